@@ -14,6 +14,8 @@ import os
 from agentpress.thread_manager import ThreadManager
 from services.supabase import DBConnection
 from services import redis
+from services import response_transport
+from services.stream_hub import stream_hub
 from utils.auth_utils import get_current_user_id_from_jwt, get_user_id_from_stream_auth, verify_thread_access
 from utils.logger import logger, structlog
 from services.billing import check_billing_status, can_use_model
@@ -178,11 +180,9 @@ async def stop_agent_run(agent_run_id: str, error_message: Optional[str] = None)
     final_status = "failed" if error_message else "stopped"
 
     # Attempt to fetch final responses from Redis
-    response_list_key = f"agent_run:{agent_run_id}:responses"
     all_responses = []
     try:
-        all_responses_json = await redis.lrange(response_list_key, 0, -1)
-        all_responses = [json.loads(r) for r in all_responses_json]
+        all_responses = await response_transport.read_compacted_responses(agent_run_id)
         logger.info(f"Fetched {len(all_responses)} responses from Redis for DB update on stop/fail: {agent_run_id}")
     except Exception as e:
         logger.error(f"Failed to fetch responses from Redis for {agent_run_id} during stop/fail: {e}")
@@ -200,6 +200,7 @@ async def stop_agent_run(agent_run_id: str, error_message: Optional[str] = None)
     global_control_channel = f"agent_run:{agent_run_id}:control"
     try:
         await redis.publish(global_control_channel, "STOP")
+        await response_transport.push_control(agent_run_id, "STOP")
         logger.debug(f"Published STOP signal to global channel {global_control_channel}")
     except Exception as e:
         logger.error(f"Failed to publish STOP signal to global channel {global_control_channel}: {str(e)}")
@@ -576,7 +577,11 @@ async def stream_agent_run(
     token: Optional[str] = None,
     request: Request = None
 ):
-    """Stream the responses of an agent run using Redis Lists and Pub/Sub."""
+    """Stream the responses of an agent run using Redis Lists and Pub/Sub, or Redis Streams.
+
+    Every event carries its entry ID, so a reconnecting client resumes after
+    the Last-Event-ID it received instead of replaying the whole run.
+    """
     logger.info(f"Starting stream for agent run: {agent_run_id}")
     client = await db.client
 
@@ -588,13 +593,113 @@ async def stream_agent_run(
         user_id=user_id,
     )
 
-    response_list_key = f"agent_run:{agent_run_id}:responses"
-    response_channel = f"agent_run:{agent_run_id}:new_response"
-    control_channel = f"agent_run:{agent_run_id}:control" # Global control channel
+    response_list_key = response_transport.response_list_key(agent_run_id)
+    response_channel = response_transport.response_channel(agent_run_id)
+    control_channel = response_transport.control_channel(agent_run_id) # Global control channel
+    last_event_id = request.headers.get("last-event-id") if request else None
+
+    async def stream_generator_from_hub():
+        logger.debug(f"Streaming responses for {agent_run_id} through the stream hub (resuming after: {last_event_id})")
+        try:
+            run_status = await client.table('agent_runs').select('status', 'thread_id').eq("id", agent_run_id).maybe_single().execute()
+            current_status = run_status.data.get('status') if run_status.data else None
+
+            if current_status != 'running':
+                # Finished run: replay what is stored without attaching to the hub
+                for entry_id, response, control_signal in await response_transport.read_responses(agent_run_id, after_id=last_event_id):
+                    if response is not None:
+                        yield f"id: {entry_id}\ndata: {json.dumps(response)}\n\n"
+                logger.info(f"Agent run {agent_run_id} is not running (status: {current_status}). Ending stream.")
+                yield f"data: {json.dumps({'type': 'status', 'status': 'completed'})}\n\n"
+                return
+
+            structlog.contextvars.bind_contextvars(
+                thread_id=run_status.data.get('thread_id'),
+            )
+
+            async for entry_id, response, control_signal in stream_hub.subscribe(agent_run_id, last_event_id):
+                event_id = f"id: {entry_id}\n" if entry_id is not None else ""
+                if control_signal:
+                    logger.info(f"Received control signal '{control_signal}' for {agent_run_id}")
+                    yield f"{event_id}data: {json.dumps({'type': 'status', 'status': control_signal})}\n\n"
+                else:
+                    yield f"{event_id}data: {json.dumps(response)}\n\n"
+
+        except asyncio.CancelledError:
+            logger.info(f"Stream generator cancelled for {agent_run_id}")
+        except Exception as e:
+            logger.error(f"Error streaming agent run {agent_run_id} through the stream hub: {e}", exc_info=True)
+            yield f"data: {json.dumps({'type': 'status', 'status': 'error', 'message': f'Stream failed: {e}'})}\n\n"
+        finally:
+            logger.debug(f"Streaming cleanup complete for agent run: {agent_run_id}")
+
+    async def stream_generator_from_redis_stream():
+        logger.debug(f"Streaming responses for {agent_run_id} from Redis stream (resuming after: {last_event_id})")
+        last_id = last_event_id
+        initial_yield_complete = False
+
+        try:
+            # 1. Yield stored entries, then check whether the run is still going
+            for entry_id, response, control_signal in await response_transport.read_responses(agent_run_id, after_id=last_id):
+                last_id = entry_id
+                if control_signal:
+                    yield f"id: {entry_id}\ndata: {json.dumps({'type': 'status', 'status': control_signal})}\n\n"
+                    return
+                yield f"id: {entry_id}\ndata: {json.dumps(response)}\n\n"
+            initial_yield_complete = True
+
+            run_status = await client.table('agent_runs').select('status', 'thread_id').eq("id", agent_run_id).maybe_single().execute()
+            current_status = run_status.data.get('status') if run_status.data else None
+
+            if current_status != 'running':
+                logger.info(f"Agent run {agent_run_id} is not running (status: {current_status}). Ending stream.")
+                yield f"data: {json.dumps({'type': 'status', 'status': 'completed'})}\n\n"
+                return
+
+            structlog.contextvars.bind_contextvars(
+                thread_id=run_status.data.get('thread_id'),
+            )
+
+            # 2. Block on the stream for new entries
+            while True:
+                entries = await response_transport.wait_for_responses(agent_run_id, last_id or "0")
+                if not entries:
+                    # Nothing arrived in time; the run may have ended without a final entry
+                    run_status = await client.table('agent_runs').select('status').eq("id", agent_run_id).maybe_single().execute()
+                    current_status = run_status.data.get('status') if run_status.data else None
+                    if current_status == 'running':
+                        continue
+                    entries = await response_transport.read_responses(agent_run_id, after_id=last_id)
+                    if not entries:
+                        logger.info(f"Agent run {agent_run_id} is no longer running (status: {current_status}). Ending stream.")
+                        yield f"data: {json.dumps({'type': 'status', 'status': current_status or 'completed'})}\n\n"
+                        return
+
+                for entry_id, response, control_signal in entries:
+                    last_id = entry_id
+                    if control_signal:
+                        logger.info(f"Received control signal '{control_signal}' for {agent_run_id}")
+                        yield f"id: {entry_id}\ndata: {json.dumps({'type': 'status', 'status': control_signal})}\n\n"
+                        return
+                    yield f"id: {entry_id}\ndata: {json.dumps(response)}\n\n"
+                    if response.get('type') == 'status' and response.get('status') in ['completed', 'failed', 'stopped']:
+                        logger.info(f"Detected run completion via status message in stream: {response.get('status')}")
+                        return
+
+        except asyncio.CancelledError:
+            logger.info(f"Stream generator cancelled for {agent_run_id}")
+        except Exception as e:
+            logger.error(f"Error streaming agent run {agent_run_id} from Redis stream: {e}", exc_info=True)
+            if not initial_yield_complete:
+                yield f"data: {json.dumps({'type': 'status', 'status': 'error', 'message': f'Failed to start stream: {e}'})}\n\n"
+            else:
+                yield f"data: {json.dumps({'type': 'status', 'status': 'error', 'message': f'Stream failed: {e}'})}\n\n"
+        finally:
+            logger.debug(f"Streaming cleanup complete for agent run: {agent_run_id}")
 
     async def stream_generator():
         logger.debug(f"Streaming responses for {agent_run_id} using Redis list {response_list_key} and channel {response_channel}")
-        last_processed_index = -1
+        last_processed_index = int(last_event_id) if last_event_id and last_event_id.isdigit() else -1
         pubsub_response = None
         pubsub_control = None
         listener_task = None
@@ -603,14 +708,14 @@ async def stream_agent_run(
 
         try:
             # 1. Fetch and yield initial responses from Redis list
-            initial_responses_json = await redis.lrange(response_list_key, 0, -1)
+            initial_responses_json = await redis.lrange(response_list_key, last_processed_index + 1, -1)
             initial_responses = []
             if initial_responses_json:
                 initial_responses = [json.loads(r) for r in initial_responses_json]
                 logger.debug(f"Sending {len(initial_responses)} initial responses for {agent_run_id}")
                 for response in initial_responses:
-                    yield f"data: {json.dumps(response)}\n\n"
-                last_processed_index = len(initial_responses) - 1
+                    last_processed_index += 1
+                    yield f"id: {last_processed_index}\ndata: {json.dumps(response)}\n\n"
             initial_yield_complete = True
 
             # 2. Check run status *after* yielding initial data
@@ -699,8 +804,8 @@ async def stream_agent_run(
                             new_responses = [json.loads(r) for r in new_responses_json]
                             num_new = len(new_responses)
                             # logger.debug(f"Received {num_new} new responses for {agent_run_id} (index {new_start_index} onwards)")
-                            for response in new_responses:
-                                yield f"data: {json.dumps(response)}\n\n"
+                            for i, response in enumerate(new_responses):
+                                yield f"id: {new_start_index + i}\ndata: {json.dumps(response)}\n\n"
                                 # Check if this response signals completion
                                 if response.get('type') == 'status' and response.get('status') in ['completed', 'failed', 'stopped']:
                                     logger.info(f"Detected run completion via status message in stream: {response.get('status')}")
@@ -756,7 +861,14 @@ async def stream_agent_run(
             await asyncio.sleep(0.1)
             logger.debug(f"Streaming cleanup complete for agent run: {agent_run_id}")
 
-    return StreamingResponse(stream_generator(), media_type="text/event-stream", headers={
+    if config.AGENT_STREAM_HUB_ENABLED:
+        generator = stream_generator_from_hub()
+    elif response_transport.get_transport() == response_transport.TRANSPORT_STREAM:
+        generator = stream_generator_from_redis_stream()
+    else:
+        generator = stream_generator()
+
+    return StreamingResponse(generator, media_type="text/event-stream", headers={
         "Cache-Control": "no-cache, no-transform", "Connection": "keep-alive",
         "X-Accel-Buffering": "no", "Content-Type": "text/event-stream",
         "Access-Control-Allow-Origin": "*"
@@ -22,6 +22,7 @@ from agent.tools.expand_msg_tool import ExpandMessageTool
 from agent.prompt import get_system_prompt
 from utils.logger import logger
 from utils.auth_utils import get_account_id_from_thread
+from utils.screenshot_pipeline import screenshot_pipeline
 from services.billing import check_billing_status
 from agent.tools.sb_vision_tool import SandboxVisionTool
 from agent.tools.sb_image_edit_tool import SandboxImageEditTool
@@ -212,6 +213,10 @@ async def run_agent(
                 try:
                     await mcp_wrapper_instance.initialize_and_register_tools()
                     logger.info("MCP tools initialized successfully")
+                    for timing in mcp_wrapper_instance.discovery_timings:
+                        logger.info(f"MCP server {timing['server']}: {timing['status']} in {timing['duration_ms']} ms")
+                    if trace:
+                        trace.event(name="mcp_discovery", level="DEFAULT", status_message=(f"Discovered {len(mcp_wrapper_instance.discovery_timings)} MCP servers"), metadata={"servers": mcp_wrapper_instance.discovery_timings})
                     updated_schemas = mcp_wrapper_instance.get_schemas()
                     logger.info(f"MCP wrapper has {len(updated_schemas)} schemas available")
                     for method_name, schema_list in updated_schemas.items():
@@ -363,293 +368,311 @@ async def run_agent(
         if trace:
             trace.update(input=data['content'])
 
-    while continue_execution and iteration_count < max_iterations:
-        iteration_count += 1
-        logger.info(f"🔄 Running iteration {iteration_count} of {max_iterations}...")
-
-        # Billing check on each iteration - still needed within the iterations
-        can_run, message, subscription = await check_billing_status(client, account_id)
-        if not can_run:
-            error_msg = f"Billing limit reached: {message}"
-            if trace:
-                trace.event(name="billing_limit_reached", level="ERROR", status_message=(f"{error_msg}"))
-            # Yield a special message to indicate billing limit reached
-            yield {
-                "type": "status",
-                "status": "stopped",
-                "message": error_msg
-            }
-            break
-        # Check if last message is from assistant using direct Supabase query
-        latest_message = await client.table('messages').select('*').eq('thread_id', thread_id).in_('type', ['assistant', 'tool', 'user']).order('created_at', desc=True).limit(1).execute()
-        if latest_message.data and len(latest_message.data) > 0:
-            message_type = latest_message.data[0].get('type')
-            if message_type == 'assistant':
-                logger.info(f"Last message was from assistant, stopping execution")
+    try:
+        while continue_execution and iteration_count < max_iterations:
+            iteration_count += 1
+            logger.info(f"🔄 Running iteration {iteration_count} of {max_iterations}...")
+
+            # Billing check on each iteration - still needed within the iterations
+            can_run, message, subscription = await check_billing_status(client, account_id)
+            if not can_run:
+                error_msg = f"Billing limit reached: {message}"
                 if trace:
-                    trace.event(name="last_message_from_assistant", level="DEFAULT", status_message=(f"Last message was from assistant, stopping execution"))
-                continue_execution = False
+                    trace.event(name="billing_limit_reached", level="ERROR", status_message=(f"{error_msg}"))
+                # Yield a special message to indicate billing limit reached
+                yield {
+                    "type": "status",
+                    "status": "stopped",
+                    "message": error_msg
+                }
                 break
+            # Check if last message is from assistant using direct Supabase query
+            latest_message = await client.table('messages').select('*').eq('thread_id', thread_id).in_('type', ['assistant', 'tool', 'user']).order('created_at', desc=True).limit(1).execute()
+            if latest_message.data and len(latest_message.data) > 0:
+                message_type = latest_message.data[0].get('type')
+                if message_type == 'assistant':
+                    logger.info(f"Last message was from assistant, stopping execution")
+                    if trace:
+                        trace.event(name="last_message_from_assistant", level="DEFAULT", status_message=(f"Last message was from assistant, stopping execution"))
+                    continue_execution = False
+                    break
 
-        # ---- Temporary Message Handling (Browser State & Image Context) ----
-        temporary_message = None
-        temp_message_content_list = [] # List to hold text/image blocks
+            # ---- Temporary Message Handling (Browser State & Image Context) ----
+            temporary_message = None
+            temp_message_content_list = [] # List to hold text/image blocks
 
-        # Get the latest browser_state message
-        latest_browser_state_msg = await client.table('messages').select('*').eq('thread_id', thread_id).eq('type', 'browser_state').order('created_at', desc=True).limit(1).execute()
-        if latest_browser_state_msg.data and len(latest_browser_state_msg.data) > 0:
-            try:
-                browser_content = latest_browser_state_msg.data[0]["content"]
-                if isinstance(browser_content, str):
-                    browser_content = json.loads(browser_content)
-                screenshot_base64 = browser_content.get("screenshot_base64")
-                screenshot_url = browser_content.get("image_url")
-                
-                # Create a copy of the browser state without screenshot data
-                browser_state_text = browser_content.copy()
-                browser_state_text.pop('screenshot_base64', None)
-                browser_state_text.pop('image_url', None)
-
-                if browser_state_text:
-                    temp_message_content_list.append({
-                        "type": "text",
-                        "text": f"The following is the current state of the browser:\n{json.dumps(browser_state_text, indent=2)}"
-                    })
+            # Get the latest browser_state message
+            latest_browser_state_msg = await client.table('messages').select('*').eq('thread_id', thread_id).eq('type', 'browser_state').order('created_at', desc=True).limit(1).execute()
+            if latest_browser_state_msg.data and len(latest_browser_state_msg.data) > 0:
+                try:
+                    browser_content = latest_browser_state_msg.data[0]["content"]
+                    if isinstance(browser_content, str):
+                        browser_content = json.loads(browser_content)
+                    screenshot_base64 = browser_content.get("screenshot_base64")
+                    screenshot_url = browser_content.get("image_url")
+                    # The screenshot may still be uploading in the background
+                    if screenshot_url and not await screenshot_pipeline.wait_for_upload(screenshot_url):
+                        screenshot_url = None
                 
-                # Only add screenshot if model is not Gemini, Anthropic, or OpenAI
-                if 'gemini' in model_name.lower() or 'anthropic' in model_name.lower() or 'openai' in model_name.lower():
-                    # Prioritize screenshot_url if available
-                    if screenshot_url:
+                    # Create a copy of the browser state without screenshot data
+                    browser_state_text = browser_content.copy()
+                    browser_state_text.pop('screenshot_base64', None)
+                    browser_state_text.pop('image_url', None)
+
+                    if browser_state_text:
                         temp_message_content_list.append({
-                            "type": "image_url",
-                            "image_url": {
-                                "url": screenshot_url,
-                                "format": "image/jpeg"
-                            }
+                            "type": "text",
+                            "text": f"The following is the current state of the browser:\n{json.dumps(browser_state_text, indent=2)}"
                         })
+                
+                    # Only add screenshot if model is not Gemini, Anthropic, or OpenAI
+                    if 'gemini' in model_name.lower() or 'anthropic' in model_name.lower() or 'openai' in model_name.lower():
+                        # Prioritize screenshot_url if available
+                        if screenshot_url:
+                            temp_message_content_list.append({
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": screenshot_url,
+                                    "format": "image/jpeg"
+                                }
+                            })
+                            if trace:
+                                trace.event(name="screenshot_url_added_to_temporary_message", level="DEFAULT", status_message=(f"Screenshot URL added to temporary message."))
+                        elif screenshot_base64:
+                            # Fallback to base64 if URL not available
+                            temp_message_content_list.append({
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": f"data:image/jpeg;base64,{screenshot_base64}",
+                                }
+                            })
+                            if trace:
+                                trace.event(name="screenshot_base64_added_to_temporary_message", level="WARNING", status_message=(f"Screenshot base64 added to temporary message. Prefer screenshot_url if available."))
+                        else:
+                            logger.warning("Browser state found but no screenshot data.")
+                            if trace:
+                                trace.event(name="browser_state_found_but_no_screenshot_data", level="WARNING", status_message=(f"Browser state found but no screenshot data."))
+                    else:
+                        logger.warning("Model is Gemini, Anthropic, or OpenAI, so not adding screenshot to temporary message.")
                         if trace:
-                            trace.event(name="screenshot_url_added_to_temporary_message", level="DEFAULT", status_message=(f"Screenshot URL added to temporary message."))
-                    elif screenshot_base64:
-                        # Fallback to base64 if URL not available
+                            trace.event(name="model_is_gemini_anthropic_or_openai", level="WARNING", status_message=(f"Model is Gemini, Anthropic, or OpenAI, so not adding screenshot to temporary message."))
+
+                except Exception as e:
+                    logger.error(f"Error parsing browser state: {e}")
+                    if trace:
+                        trace.event(name="error_parsing_browser_state", level="ERROR", status_message=(f"{e}"))
+
+            # Get the latest image_context message (NEW)
+            latest_image_context_msg = await client.table('messages').select('*').eq('thread_id', thread_id).eq('type', 'image_context').order('created_at', desc=True).limit(1).execute()
+            if latest_image_context_msg.data and len(latest_image_context_msg.data) > 0:
+                try:
+                    image_context_content = latest_image_context_msg.data[0]["content"] if isinstance(latest_image_context_msg.data[0]["content"], dict) else json.loads(latest_image_context_msg.data[0]["content"])
+                    base64_image = image_context_content.get("base64")
+                    mime_type = image_context_content.get("mime_type")
+                    file_path = image_context_content.get("file_path", "unknown file")
+
+                    if base64_image and mime_type:
+                        temp_message_content_list.append({
+                            "type": "text",
+                            "text": f"Here is the image you requested to see: '{file_path}'"
+                        })
                         temp_message_content_list.append({
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{screenshot_base64}",
+                                "url": f"data:{mime_type};base64,{base64_image}",
                             }
                         })
-                        if trace:
-                            trace.event(name="screenshot_base64_added_to_temporary_message", level="WARNING", status_message=(f"Screenshot base64 added to temporary message. Prefer screenshot_url if available."))
                     else:
-                        logger.warning("Browser state found but no screenshot data.")
-                        if trace:
-                            trace.event(name="browser_state_found_but_no_screenshot_data", level="WARNING", status_message=(f"Browser state found but no screenshot data."))
-                else:
-                    logger.warning("Model is Gemini, Anthropic, or OpenAI, so not adding screenshot to temporary message.")
-                    if trace:
-                        trace.event(name="model_is_gemini_anthropic_or_openai", level="WARNING", status_message=(f"Model is Gemini, Anthropic, or OpenAI, so not adding screenshot to temporary message."))
+                        logger.warning(f"Image context found for '{file_path}' but missing base64 or mime_type.")
 
-            except Exception as e:
-                logger.error(f"Error parsing browser state: {e}")
-                if trace:
-                    trace.event(name="error_parsing_browser_state", level="ERROR", status_message=(f"{e}"))
-
-        # Get the latest image_context message (NEW)
-        latest_image_context_msg = await client.table('messages').select('*').eq('thread_id', thread_id).eq('type', 'image_context').order('created_at', desc=True).limit(1).execute()
-        if latest_image_context_msg.data and len(latest_image_context_msg.data) > 0:
-            try:
-                image_context_content = latest_image_context_msg.data[0]["content"] if isinstance(latest_image_context_msg.data[0]["content"], dict) else json.loads(latest_image_context_msg.data[0]["content"])
-                base64_image = image_context_content.get("base64")
-                mime_type = image_context_content.get("mime_type")
-                file_path = image_context_content.get("file_path", "unknown file")
-
-                if base64_image and mime_type:
-                    temp_message_content_list.append({
-                        "type": "text",
-                        "text": f"Here is the image you requested to see: '{file_path}'"
-                    })
-                    temp_message_content_list.append({
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:{mime_type};base64,{base64_image}",
-                        }
-                    })
-                else:
-                    logger.warning(f"Image context found for '{file_path}' but missing base64 or mime_type.")
-
-                await client.table('messages').delete().eq('message_id', latest_image_context_msg.data[0]["message_id"]).execute()
-            except Exception as e:
-                logger.error(f"Error parsing image context: {e}")
-                if trace:
-                    trace.event(name="error_parsing_image_context", level="ERROR", status_message=(f"{e}"))
-
-        # If we have any content, construct the temporary_message
-        if temp_message_content_list:
-            temporary_message = {"role": "user", "content": temp_message_content_list}
-            # logger.debug(f"Constructed temporary message with {len(temp_message_content_list)} content blocks.")
-        # ---- End Temporary Message Handling ----
-
-        # Set max_tokens based on model
-        max_tokens = None
-        if "sonnet" in model_name.lower():
-            # Claude 3.5 Sonnet has a limit of 8192 tokens
-            max_tokens = 8192
-        elif "gpt-4" in model_name.lower():
-            max_tokens = 4096
-        elif "gemini-2.5-pro" in model_name.lower():
-            # Gemini 2.5 Pro has 64k max output tokens
-            max_tokens = 64000
+                    await client.table('messages').delete().eq('message_id', latest_image_context_msg.data[0]["message_id"]).execute()
+                except Exception as e:
+                    logger.error(f"Error parsing image context: {e}")
+                    if trace:
+                        trace.event(name="error_parsing_image_context", level="ERROR", status_message=(f"{e}"))
+
+            # If we have any content, construct the temporary_message
+            if temp_message_content_list:
+                temporary_message = {"role": "user", "content": temp_message_content_list}
+                # logger.debug(f"Constructed temporary message with {len(temp_message_content_list)} content blocks.")
+            # ---- End Temporary Message Handling ----
+
+            # Set max_tokens based on model
+            max_tokens = None
+            if "sonnet" in model_name.lower():
+                # Claude 3.5 Sonnet has a limit of 8192 tokens
+                max_tokens = 8192
+            elif "gpt-4" in model_name.lower():
+                max_tokens = 4096
+            elif "gemini-2.5-pro" in model_name.lower():
+                # Gemini 2.5 Pro has 64k max output tokens
+                max_tokens = 64000
             
-        generation = trace.generation(name="thread_manager.run_thread") if trace else None
-        try:
-            # Make the LLM call and process the response
-            response = await thread_manager.run_thread(
-                thread_id=thread_id,
-                system_prompt=system_message,
-                stream=stream,
-                llm_model=model_name,
-                llm_temperature=0,
-                llm_max_tokens=max_tokens,
-                tool_choice="auto",
-                max_xml_tool_calls=1,
-                temporary_message=temporary_message,
-                processor_config=ProcessorConfig(
-                    xml_tool_calling=True,
-                    native_tool_calling=False,
-                    execute_tools=True,
-                    execute_on_stream=True,
-                    tool_execution_strategy="parallel",
-                    xml_adding_strategy="user_message"
-                ),
-                native_max_auto_continues=native_max_auto_continues,
-                include_xml_examples=True,
-                enable_thinking=enable_thinking,
-                reasoning_effort=reasoning_effort,
-                enable_context_manager=enable_context_manager,
-                generation=generation
-            )
-
-            if isinstance(response, dict) and "status" in response and response["status"] == "error":
-                logger.error(f"Error response from run_thread: {response.get('message', 'Unknown error')}")
-                if trace:
-                    trace.event(name="error_response_from_run_thread", level="ERROR", status_message=(f"{response.get('message', 'Unknown error')}"))
-                yield response
-                break
+            generation = trace.generation(name="thread_manager.run_thread") if trace else None
+            try:
+                # Make the LLM call and process the response
+                response = await thread_manager.run_thread(
+                    thread_id=thread_id,
+                    system_prompt=system_message,
+                    stream=stream,
+                    llm_model=model_name,
+                    llm_temperature=0,
+                    llm_max_tokens=max_tokens,
+                    tool_choice="auto",
+                    max_xml_tool_calls=1,
+                    temporary_message=temporary_message,
+                    processor_config=ProcessorConfig(
+                        xml_tool_calling=True,
+                        native_tool_calling=False,
+                        execute_tools=True,
+                        execute_on_stream=True,
+                        tool_execution_strategy="parallel",
+                        xml_adding_strategy="user_message"
+                    ),
+                    native_max_auto_continues=native_max_auto_continues,
+                    include_xml_examples=True,
+                    enable_thinking=enable_thinking,
+                    reasoning_effort=reasoning_effort,
+                    enable_context_manager=enable_context_manager,
+                    generation=generation
+                )
+
+                if isinstance(response, dict) and "status" in response and response["status"] == "error":
+                    logger.error(f"Error response from run_thread: {response.get('message', 'Unknown error')}")
+                    if trace:
+                        trace.event(name="error_response_from_run_thread", level="ERROR", status_message=(f"{response.get('message', 'Unknown error')}"))
+                    yield response
+                    break
 
-            # Track if we see ask, complete, or web-browser-takeover tool calls
-            last_tool_call = None
-            agent_should_terminate = False
+                # Track if we see ask, complete, or web-browser-takeover tool calls
+                last_tool_call = None
+                agent_should_terminate = False
 
-            # Process the response
-            error_detected = False
-            full_response = ""
-            try:
-                # Check if response is iterable (async generator) or a dict (error case)
-                if hasattr(response, '__aiter__') and not isinstance(response, dict):
-                    async for chunk in response:
-                        # If we receive an error chunk, we should stop after this iteration
-                        if isinstance(chunk, dict) and chunk.get('type') == 'status' and chunk.get('status') == 'error':
-                            logger.error(f"Error chunk detected: {chunk.get('message', 'Unknown error')}")
-                            if trace:
-                                trace.event(name="error_chunk_detected", level="ERROR", status_message=(f"{chunk.get('message', 'Unknown error')}"))
-                            error_detected = True
-                            yield chunk  # Forward the error chunk
-                            continue     # Continue processing other chunks but don't break yet
+                # Process the response
+                error_detected = False
+                full_response = ""
+                try:
+                    # Check if response is iterable (async generator) or a dict (error case)
+                    if hasattr(response, '__aiter__') and not isinstance(response, dict):
+                        async for chunk in response:
+                            # If we receive an error chunk, we should stop after this iteration
+                            if isinstance(chunk, dict) and chunk.get('type') == 'status' and chunk.get('status') == 'error':
+                                logger.error(f"Error chunk detected: {chunk.get('message', 'Unknown error')}")
+                                if trace:
+                                    trace.event(name="error_chunk_detected", level="ERROR", status_message=(f"{chunk.get('message', 'Unknown error')}"))
+                                error_detected = True
+                                yield chunk  # Forward the error chunk
+                                continue     # Continue processing other chunks but don't break yet
                         
-                        # Check for termination signal in status messages
-                        if chunk.get('type') == 'status':
-                            try:
-                                # Parse the metadata to check for termination signal
-                                metadata = chunk.get('metadata', {})
-                                if isinstance(metadata, str):
-                                    metadata = json.loads(metadata)
+                            # Check for termination signal in status messages
+                            if chunk.get('type') == 'status':
+                                try:
+                                    # Parse the metadata to check for termination signal
+                                    metadata = chunk.get('metadata', {})
+                                    if isinstance(metadata, str):
+                                        metadata = json.loads(metadata)
                                 
-                                if metadata.get('agent_should_terminate'):
-                                    agent_should_terminate = True
-                                    logger.info("Agent termination signal detected in status message")
-                                    if trace:
-                                        trace.event(name="agent_termination_signal_detected", level="DEFAULT", status_message="Agent termination signal detected in status message")
+                                    if metadata.get('agent_should_terminate'):
+                                        agent_should_terminate = True
+                                        logger.info("Agent termination signal detected in status message")
+                                        if trace:
+                                            trace.event(name="agent_termination_signal_detected", level="DEFAULT", status_message="Agent termination signal detected in status message")
                                     
-                                    # Extract the tool name from the status content if available
-                                    content = chunk.get('content', {})
-                                    if isinstance(content, str):
-                                        content = json.loads(content)
+                                        # Extract the tool name from the status content if available
+                                        content = chunk.get('content', {})
+                                        if isinstance(content, str):
+                                            content = json.loads(content)
                                     
-                                    if content.get('function_name'):
-                                        last_tool_call = content['function_name']
-                                    elif content.get('xml_tag_name'):
-                                        last_tool_call = content['xml_tag_name']
+                                        if content.get('function_name'):
+                                            last_tool_call = content['function_name']
+                                        elif content.get('xml_tag_name'):
+                                            last_tool_call = content['xml_tag_name']
                                         
-                            except Exception as e:
-                                logger.debug(f"Error parsing status message for termination check: {e}")
+                                except Exception as e:
+                                    logger.debug(f"Error parsing status message for termination check: {e}")
                             
-                        # Check for XML versions like <ask>, <complete>, or <web-browser-takeover> in assistant content chunks
-                        if chunk.get('type') == 'assistant' and 'content' in chunk:
-                            try:
-                                # The content field might be a JSON string or object
-                                content = chunk.get('content', '{}')
-                                if isinstance(content, str):
-                                    assistant_content_json = json.loads(content)
-                                else:
-                                    assistant_content_json = content
-
-                                # The actual text content is nested within
-                                assistant_text = assistant_content_json.get('content', '')
-                                full_response += assistant_text
-                                if isinstance(assistant_text, str):
-                                    if '</ask>' in assistant_text or '</complete>' in assistant_text or '</web-browser-takeover>' in assistant_text:
-                                       if '</ask>' in assistant_text:
-                                           xml_tool = 'ask'
-                                       elif '</complete>' in assistant_text:
-                                           xml_tool = 'complete'
-                                       elif '</web-browser-takeover>' in assistant_text:
-                                           xml_tool = 'web-browser-takeover'
-
-                                       last_tool_call = xml_tool
-                                       logger.info(f"Agent used XML tool: {xml_tool}")
-                                       if trace:
-                                           trace.event(name="agent_used_xml_tool", level="DEFAULT", status_message=(f"Agent used XML tool: {xml_tool}"))
+                            # Check for XML versions like <ask>, <complete>, or <web-browser-takeover> in assistant content chunks
+                            if chunk.get('type') == 'assistant' and 'content' in chunk:
+                                try:
+                                    # The content field might be a JSON string or object
+                                    content = chunk.get('content', '{}')
+                                    if isinstance(content, str):
+                                        assistant_content_json = json.loads(content)
+                                    else:
+                                        assistant_content_json = content
+
+                                    # The actual text content is nested within
+                                    assistant_text = assistant_content_json.get('content', '')
+                                    full_response += assistant_text
+                                    if isinstance(assistant_text, str):
+                                        if '</ask>' in assistant_text or '</complete>' in assistant_text or '</web-browser-takeover>' in assistant_text:
+                                           if '</ask>' in assistant_text:
+                                               xml_tool = 'ask'
+                                           elif '</complete>' in assistant_text:
+                                               xml_tool = 'complete'
+                                           elif '</web-browser-takeover>' in assistant_text:
+                                               xml_tool = 'web-browser-takeover'
+
+                                           last_tool_call = xml_tool
+                                           logger.info(f"Agent used XML tool: {xml_tool}")
+                                           if trace:
+                                               trace.event(name="agent_used_xml_tool", level="DEFAULT", status_message=(f"Agent used XML tool: {xml_tool}"))
                             
-                            except json.JSONDecodeError:
-                                # Handle cases where content might not be valid JSON
-                                logger.warning(f"Warning: Could not parse assistant content JSON: {chunk.get('content')}")
-                                if trace:
-                                    trace.event(name="warning_could_not_parse_assistant_content_json", level="WARNING", status_message=(f"Warning: Could not parse assistant content JSON: {chunk.get('content')}"))
-                            except Exception as e:
-                                logger.error(f"Error processing assistant chunk: {e}")
-                                if trace:
-                                    trace.event(name="error_processing_assistant_chunk", level="ERROR", status_message=(f"Error processing assistant chunk: {e}"))
+                                except json.JSONDecodeError:
+                                    # Handle cases where content might not be valid JSON
+                                    logger.warning(f"Warning: Could not parse assistant content JSON: {chunk.get('content')}")
+                                    if trace:
+                                        trace.event(name="warning_could_not_parse_assistant_content_json", level="WARNING", status_message=(f"Warning: Could not parse assistant content JSON: {chunk.get('content')}"))
+                                except Exception as e:
+                                    logger.error(f"Error processing assistant chunk: {e}")
+                                    if trace:
+                                        trace.event(name="error_processing_assistant_chunk", level="ERROR", status_message=(f"Error processing assistant chunk: {e}"))
 
-                        yield chunk
-                else:
-                    # Response is not iterable, likely an error dict
-                    logger.error(f"Response is not iterable: {response}")
-                    error_detected = True
+                            yield chunk
+                    else:
+                        # Response is not iterable, likely an error dict
+                        logger.error(f"Response is not iterable: {response}")
+                        error_detected = True
 
-                # Check if we should stop based on the last tool call or error
-                if error_detected:
-                    logger.info(f"Stopping due to error detected in response")
-                    if trace:
-                        trace.event(name="stopping_due_to_error_detected_in_response", level="DEFAULT", status_message=(f"Stopping due to error detected in response"))
-                    if generation:
-                        generation.end(output=full_response, status_message="error_detected", level="ERROR")
-                    break
+                    # Check if we should stop based on the last tool call or error
+                    if error_detected:
+                        logger.info(f"Stopping due to error detected in response")
+                        if trace:
+                            trace.event(name="stopping_due_to_error_detected_in_response", level="DEFAULT", status_message=(f"Stopping due to error detected in response"))
+                        if generation:
+                            generation.end(output=full_response, status_message="error_detected", level="ERROR")
+                        break
                     
-                if agent_should_terminate or last_tool_call in ['ask', 'complete', 'web-browser-takeover']:
-                    logger.info(f"Agent decided to stop with tool: {last_tool_call}")
+                    if agent_should_terminate or last_tool_call in ['ask', 'complete', 'web-browser-takeover']:
+                        logger.info(f"Agent decided to stop with tool: {last_tool_call}")
+                        if trace:
+                            trace.event(name="agent_decided_to_stop_with_tool", level="DEFAULT", status_message=(f"Agent decided to stop with tool: {last_tool_call}"))
+                        if generation:
+                            generation.end(output=full_response, status_message="agent_stopped")
+                        continue_execution = False
+
+                except Exception as e:
+                    # Just log the error and re-raise to stop all iterations
+                    error_msg = f"Error during response streaming: {str(e)}"
+                    logger.error(f"Error: {error_msg}")
                     if trace:
-                        trace.event(name="agent_decided_to_stop_with_tool", level="DEFAULT", status_message=(f"Agent decided to stop with tool: {last_tool_call}"))
+                        trace.event(name="error_during_response_streaming", level="ERROR", status_message=(f"Error during response streaming: {str(e)}"))
                     if generation:
-                        generation.end(output=full_response, status_message="agent_stopped")
-                    continue_execution = False
-
+                        generation.end(output=full_response, status_message=error_msg, level="ERROR")
+                    yield {
+                        "type": "status",
+                        "status": "error",
+                        "message": error_msg
+                    }
+                    # Stop execution immediately on any error
+                    break
+                
             except Exception as e:
                 # Just log the error and re-raise to stop all iterations
-                error_msg = f"Error during response streaming: {str(e)}"
+                error_msg = f"Error running thread: {str(e)}"
                 logger.error(f"Error: {error_msg}")
                 if trace:
-                    trace.event(name="error_during_response_streaming", level="ERROR", status_message=(f"Error during response streaming: {str(e)}"))
-                if generation:
-                    generation.end(output=full_response, status_message=error_msg, level="ERROR")
+                    trace.event(name="error_running_thread", level="ERROR", status_message=(f"Error running thread: {str(e)}"))
                 yield {
                     "type": "status",
                     "status": "error",
@@ -657,21 +680,11 @@ async def run_agent(
                 }
                 # Stop execution immediately on any error
                 break
-                
-        except Exception as e:
-            # Just log the error and re-raise to stop all iterations
-            error_msg = f"Error running thread: {str(e)}"
-            logger.error(f"Error: {error_msg}")
-            if trace:
-                trace.event(name="error_running_thread", level="ERROR", status_message=(f"Error running thread: {str(e)}"))
-            yield {
-                "type": "status",
-                "status": "error",
-                "message": error_msg
-            }
-            # Stop execution immediately on any error
-            break
-        if generation:
-            generation.end(output=full_response)
+            if generation:
+                generation.end(output=full_response)
+    finally:
+        # Close pooled MCP sessions kept open for this run
+        if mcp_wrapper_instance:
+            await mcp_wrapper_instance.cleanup()
 
     asyncio.create_task(asyncio.to_thread(lambda: langfuse.flush()))
@@ -107,85 +107,89 @@ class AmazonProvider(RapidDataProviderBase):
 
 
 if __name__ == "__main__":
+    import asyncio
     from dotenv import load_dotenv
     load_dotenv()
-    tool = AmazonProvider()
 
-    # Example for product search
-    search_result = tool.call_endpoint(
-        route="search",
-        payload={
-            "query": "Phone",
-            "page": 1,
-            "country": "US",
-            "sort_by": "RELEVANCE",
-            "product_condition": "ALL",
-            "is_prime": False,
-            "deals_and_discounts": "NONE"
-        }
-    )
-    print("Search Result:", search_result)
+    async def main():
+        tool = AmazonProvider()
+
+        # Example for product search
+        search_result = await tool.call_endpoint(
+            route="search",
+            payload={
+                "query": "Phone",
+                "page": 1,
+                "country": "US",
+                "sort_by": "RELEVANCE",
+                "product_condition": "ALL",
+                "is_prime": False,
+                "deals_and_discounts": "NONE"
+            }
+        )
+        print("Search Result:", search_result)
     
-    # Example for product details
-    details_result = tool.call_endpoint(
-        route="product-details",
-        payload={
-            "asin": "B07ZPKBL9V",
-            "country": "US"
-        }
-    )
-    print("Product Details:", details_result)
+        # Example for product details
+        details_result = await tool.call_endpoint(
+            route="product-details",
+            payload={
+                "asin": "B07ZPKBL9V",
+                "country": "US"
+            }
+        )
+        print("Product Details:", details_result)
     
-    # Example for products by category
-    category_result = tool.call_endpoint(
-        route="products-by-category",
-        payload={
-            "category_id": "2478868012",
-            "page": 1,
-            "country": "US",
-            "sort_by": "RELEVANCE",
-            "product_condition": "ALL",
-            "is_prime": False,
-            "deals_and_discounts": "NONE"
-        }
-    )
-    print("Category Products:", category_result)
+        # Example for products by category
+        category_result = await tool.call_endpoint(
+            route="products-by-category",
+            payload={
+                "category_id": "2478868012",
+                "page": 1,
+                "country": "US",
+                "sort_by": "RELEVANCE",
+                "product_condition": "ALL",
+                "is_prime": False,
+                "deals_and_discounts": "NONE"
+            }
+        )
+        print("Category Products:", category_result)
     
-    # Example for product reviews
-    reviews_result = tool.call_endpoint(
-        route="product-reviews",
-        payload={
-            "asin": "B07ZPKN6YR",
-            "country": "US",
-            "page": 1,
-            "sort_by": "TOP_REVIEWS",
-            "star_rating": "ALL",
-            "verified_purchases_only": False,
-            "images_or_videos_only": False,
-            "current_format_only": False
-        }
-    )
-    print("Product Reviews:", reviews_result)
+        # Example for product reviews
+        reviews_result = await tool.call_endpoint(
+            route="product-reviews",
+            payload={
+                "asin": "B07ZPKN6YR",
+                "country": "US",
+                "page": 1,
+                "sort_by": "TOP_REVIEWS",
+                "star_rating": "ALL",
+                "verified_purchases_only": False,
+                "images_or_videos_only": False,
+                "current_format_only": False
+            }
+        )
+        print("Product Reviews:", reviews_result)
     
-    # Example for seller profile
-    seller_result = tool.call_endpoint(
-        route="seller-profile",
-        payload={
-            "seller_id": "A02211013Q5HP3OMSZC7W",
-            "country": "US"
-        }
-    )
-    print("Seller Profile:", seller_result)
+        # Example for seller profile
+        seller_result = await tool.call_endpoint(
+            route="seller-profile",
+            payload={
+                "seller_id": "A02211013Q5HP3OMSZC7W",
+                "country": "US"
+            }
+        )
+        print("Seller Profile:", seller_result)
     
-    # Example for seller reviews
-    seller_reviews_result = tool.call_endpoint(
-        route="seller-reviews",
-        payload={
-            "seller_id": "A02211013Q5HP3OMSZC7W",
-            "country": "US",
-            "star_rating": "ALL",
-            "page": 1
-        }
-    )
-    print("Seller Reviews:", seller_reviews_result)
+        # Example for seller reviews
+        seller_reviews_result = await tool.call_endpoint(
+            route="seller-reviews",
+            payload={
+                "seller_id": "A02211013Q5HP3OMSZC7W",
+                "country": "US",
+                "star_rating": "ALL",
+                "page": 1
+            }
+        )
+        print("Seller Reviews:", seller_reviews_result)
 
+    asyncio.run(main())
@@ -238,13 +238,17 @@ class LinkedinProvider(RapidDataProviderBase):
 
 
 if __name__ == "__main__":
+    import asyncio
     from dotenv import load_dotenv
     load_dotenv()
-    tool = LinkedinProvider()
 
-    result = tool.call_endpoint(
-        route="comments_from_recent_activity",
-        payload={"profile_url": "https://www.linkedin.com/in/adamcohenhillel/", "page": 1}
-    )
-    print(result)
+    async def main():
+        tool = LinkedinProvider()
 
+        result = await tool.call_endpoint(
+            route="comments_from_recent_activity",
+            payload={"profile_url": "https://www.linkedin.com/in/adamcohenhillel/", "page": 1}
+        )
+        print(result)
+
+    asyncio.run(main())
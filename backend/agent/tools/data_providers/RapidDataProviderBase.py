@@ -1,7 +1,24 @@
+import asyncio
+import hashlib
+import json
 import os
-import requests
+import random
 from typing import Dict, Any, Optional, TypedDict, Literal
 
+import httpx
+
+from services import redis
+from services.http_clients import http_clients
+from utils.logger import logger
+
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 1.0  # seconds, doubled per attempt
+RETRY_MAX_DELAY = 10.0
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# RapidAPI hosts -> semaphore limiting concurrent requests from this process
+_host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
 
 class EndpointSchema(TypedDict):
     route: str
@@ -12,26 +29,80 @@ class EndpointSchema(TypedDict):
 
 
 class RapidDataProviderBase:
-    def __init__(self, base_url: str, endpoints: Dict[str, EndpointSchema]):
+    def __init__(self, base_url: str, endpoints: Dict[str, EndpointSchema], max_concurrency: int = 5, cache_ttl: int = 600):
+        """
+        Args:
+            base_url: RapidAPI base URL of the provider.
+            endpoints: Endpoint schemas keyed by route name.
+            max_concurrency: Concurrent requests to the provider's host per process.
+            cache_ttl: Seconds successful responses are cached in Redis; 0 disables caching.
+        """
         self.base_url = base_url
         self.endpoints = endpoints
-    
+        self.host = base_url.split("//")[1].split("/")[0]
+        self.max_concurrency = max_concurrency
+        self.cache_ttl = cache_ttl
+
     def get_endpoints(self):
         return self.endpoints
-    
-    def call_endpoint(
+
+    def _cache_key(self, route: str, payload: Optional[Dict[str, Any]]) -> str:
+        payload_hash = hashlib.sha256(json.dumps(payload or {}, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        return f"rapidapi:{self.host}:{route}:{payload_hash}"
+
+    async def _cache_get(self, key: str) -> Optional[Any]:
+        try:
+            cached = await redis.get(key)
+            return json.loads(cached) if cached else None
+        except Exception as e:
+            logger.warning(f"Failed to read data provider cache entry {key}: {str(e)}")
+            return None
+
+    async def _cache_set(self, key: str, result: Any):
+        try:
+            await redis.set(key, json.dumps(result), ex=self.cache_ttl)
+        except Exception as e:
+            logger.warning(f"Failed to write data provider cache entry {key}: {str(e)}")
+
+    async def _request(self, method: str, url: str, headers: Dict[str, str], payload: Optional[Dict[str, Any]]) -> httpx.Response:
+        client = http_clients.get("rapidapi")
+        semaphore = _host_semaphores.setdefault(self.host, asyncio.Semaphore(self.max_concurrency))
+
+        for attempt in range(MAX_RETRIES + 1):
+            retry_after = None
+            try:
+                async with semaphore:
+                    if method == 'GET':
+                        response = await client.get(url, params=payload, headers=headers)
+                    else:
+                        response = await client.post(url, json=payload, headers=headers)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                    return response
+                failure = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("retry-after")
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                failure = f"{type(e).__name__}: {str(e)}"
+
+            delay = min(RETRY_BASE_DELAY * (2 ** attempt), RETRY_MAX_DELAY) + random.uniform(0, 0.5)
+            if retry_after and retry_after.isdigit():
+                delay = min(float(retry_after), RETRY_MAX_DELAY)
+            logger.warning(f"Data provider request to {url} failed ({failure}), retrying in {delay:.1f}s (attempt {attempt + 1}/{MAX_RETRIES + 1})")
+            await asyncio.sleep(delay)
+
+    async def call_endpoint(
             self,
             route: str,
             payload: Optional[Dict[str, Any]] = None
     ):
         """
         Call an API endpoint with the given parameters and data.
-        
+
         Args:
-            endpoint (EndpointSchema): The endpoint configuration dictionary
-            params (dict, optional): Query parameters for GET requests
-            payload (dict, optional): JSON payload for POST requests
-            
+            route (str): The key of the endpoint to call
+            payload (dict, optional): Query parameters for GET requests or JSON payload for POST requests
+
         Returns:
             dict: The JSON response from the API
         """
@@ -41,21 +112,30 @@ class RapidDataProviderBase:
         endpoint = self.endpoints.get(route)
         if not endpoint:
             raise ValueError(f"Endpoint {route} not found")
-        
+
         url = f"{self.base_url}{endpoint['route']}"
-        
+
         headers = {
-            "x-rapidapi-key": os.getenv("RAPID_API_KEY"),
-            "x-rapidapi-host": url.split("//")[1].split("/")[0],
+            "x-rapidapi-host": self.host,
             "Content-Type": "application/json"
         }
+        if os.getenv("RAPID_API_KEY"):
+            headers["x-rapidapi-key"] = os.getenv("RAPID_API_KEY")
 
         method = endpoint.get('method', 'GET').upper()
-        
-        if method == 'GET':
-            response = requests.get(url, params=payload, headers=headers)
-        elif method == 'POST':
-            response = requests.post(url, json=payload, headers=headers)
-        else:
+        if method not in ('GET', 'POST'):
             raise ValueError(f"Unsupported HTTP method: {method}")
-        return response.json()
+
+        # These endpoints are lookups, so identical calls can share a response
+        cache_key = self._cache_key(route, payload) if self.cache_ttl else None
+        if cache_key:
+            cached = await self._cache_get(cache_key)
+            if cached is not None:
+                logger.debug(f"Data provider cache hit for {self.host} {route}")
+                return cached
+
+        response = await self._request(method, url, headers, payload)
+        result = response.json()
+        if cache_key and response.status_code == 200:
+            await self._cache_set(cache_key, result)
+        return result
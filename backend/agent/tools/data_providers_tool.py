@@ -176,7 +176,7 @@ Use this tool when you need to discover what endpoints are available.
                 return self.fail_response(f"Endpoint '{route}' not found in {service_name} data provider.")
             
             
-            result = data_provider.call_endpoint(route, payload)
+            result = await data_provider.call_endpoint(route, payload)
             return self.success_response(result)
             
         except Exception as e:
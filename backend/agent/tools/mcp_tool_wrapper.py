@@ -1,8 +1,12 @@
 from typing import Any, Dict, List, Optional
 from agentpress.tool import Tool, ToolResult, openapi_schema, xml_schema, ToolSchema, SchemaType
 from mcp_service.client import MCPManager
+from mcp_service.session_pool import MCPSessionPool
 from utils.logger import logger
+import asyncio
 import inspect
+import time
+from utils.config import config
 from agent.tools.utils.mcp_connection_manager import MCPConnectionManager
 from agent.tools.utils.custom_mcp_handler import CustomMCPHandler
 from agent.tools.utils.dynamic_tool_builder import DynamicToolBuilder
@@ -11,17 +15,20 @@ from agent.tools.utils.mcp_tool_executor import MCPToolExecutor
 
 class MCPToolWrapper(Tool):
     def __init__(self, mcp_configs: Optional[List[Dict[str, Any]]] = None):
-        self.mcp_manager = MCPManager()
+        # Sessions opened during discovery are reused by tool calls for the rest of the run
+        self.session_pool = MCPSessionPool()
+        self.mcp_manager = MCPManager(session_pool=self.session_pool)
         self.mcp_configs = mcp_configs or []
         self._initialized = False
         self._schemas: Dict[str, List[ToolSchema]] = {}
         self._dynamic_tools = {}
         self._custom_tools = {}
         
-        self.connection_manager = MCPConnectionManager()
+        self.connection_manager = MCPConnectionManager(session_pool=self.session_pool)
         self.custom_handler = CustomMCPHandler(self.connection_manager)
         self.tool_builder = DynamicToolBuilder()
         self.tool_executor = None
+        self.discovery_timings: List[Dict[str, Any]] = []
         
         super().__init__()
         
@@ -35,20 +42,18 @@ class MCPToolWrapper(Tool):
         standard_configs = [cfg for cfg in self.mcp_configs if not cfg.get('isCustom', False)]
         custom_configs = [cfg for cfg in self.mcp_configs if cfg.get('isCustom', False)]
         
+        # Standard and custom servers are discovered concurrently under one deadline
+        started = time.monotonic()
+        discovery = []
         if standard_configs:
-            await self._initialize_standard_servers(standard_configs)
-        
+            discovery.append(self.mcp_manager.connect_all(standard_configs, deadline=config.MCP_DISCOVERY_DEADLINE))
         if custom_configs:
-            await self.custom_handler.initialize_custom_mcps(custom_configs)
-            
-    async def _initialize_standard_servers(self, standard_configs: List[Dict[str, Any]]):
-        for config in standard_configs:
-            try:
-                logger.info(f"Attempting to connect to MCP server: {config['qualifiedName']}")
-                await self.mcp_manager.connect_server(config)
-                logger.info(f"Successfully connected to MCP server: {config['qualifiedName']}")
-            except Exception as e:
-                logger.error(f"Failed to connect to MCP server {config['qualifiedName']}: {e}")
+            discovery.append(self.custom_handler.initialize_custom_mcps(custom_configs, deadline=config.MCP_DISCOVERY_DEADLINE))
+        await asyncio.gather(*discovery)
+        
+        self.discovery_timings = self.mcp_manager.discovery_timings + self.custom_handler.discovery_timings
+        connected = sum(1 for timing in self.discovery_timings if timing['status'] == 'connected')
+        logger.info(f"Connected to {connected}/{len(self.discovery_timings)} MCP servers in {(time.monotonic() - started) * 1000:.0f} ms")
     
     async def _create_dynamic_tools(self):
         try:
@@ -60,7 +65,7 @@ class MCPToolWrapper(Tool):
             
             self._custom_tools = custom_tools
             
-            self.tool_executor = MCPToolExecutor(self.mcp_manager, custom_tools, self)
+            self.tool_executor = MCPToolExecutor(self.mcp_manager, custom_tools, self, session_pool=self.session_pool)
             
             dynamic_methods = self.tool_builder.create_dynamic_methods(
                 available_tools, 
@@ -170,4 +175,9 @@ class MCPToolWrapper(Tool):
             except Exception as e:
                 logger.error(f"Error during MCP cleanup: {str(e)}")
             finally:
-                self._initialized = False 
\ No newline at end of file
+                self._initialized = False
+        
+        try:
+            await self.session_pool.close()
+        except Exception as e:
+            logger.error(f"Error closing MCP session pool: {str(e)}")
\ No newline at end of file
@@ -2,7 +2,7 @@ from typing import Optional
 from agentpress.tool import ToolResult, openapi_schema, xml_schema
 from sandbox.tool_base import SandboxToolsBase
 from agentpress.thread_manager import ThreadManager
-import httpx
+from services.http_clients import http_clients
 from io import BytesIO
 import uuid
 from litellm import aimage_generation, aimage_edit
@@ -126,10 +126,10 @@ class SandboxImageEditTool(SandboxToolsBase):
     async def _download_image_from_url(self, url: str) -> bytes | ToolResult:
         """Download image from URL."""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                return response.content
+            client = http_clients.get("downloads")
+            response = await client.get(url)
+            response.raise_for_status()
+            return response.content
         except Exception:
             return self.fail_response(f"Could not download image from URL: {url}")
 
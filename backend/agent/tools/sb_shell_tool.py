@@ -1,7 +1,5 @@
-import asyncio
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 import time
-import asyncio
 from uuid import uuid4
 from agentpress.tool import ToolResult, openapi_schema, xml_schema
 from sandbox.tool_base import SandboxToolsBase
@@ -11,6 +9,10 @@ class SandboxShellTool(SandboxToolsBase):
     """Tool for executing tasks in a Daytona sandbox with browser-use capabilities. 
     Uses sessions for maintaining state between commands and provides comprehensive process management."""
 
+    BLOCKING_POLL_INTERVAL = 0.2  # Marker file check interval inside the sandbox (seconds)
+    BLOCKING_WAIT_INITIAL = 1.0  # First wait window for blocking commands (seconds)
+    BLOCKING_WAIT_MAX = 16.0  # Wait window cap, kept below the 30s raw command timeout
+
     def __init__(self, project_id: str, thread_manager: ThreadManager):
         super().__init__(project_id, thread_manager)
         self._sessions: Dict[str, str] = {}  # Maps session names to session IDs
@@ -131,61 +133,59 @@ class SandboxShellTool(SandboxToolsBase):
             if not session_name:
                 session_name = f"session_{str(uuid4())[:8]}"
             
-            # Check if tmux session already exists
-            check_session = await self._execute_raw_command(f"tmux has-session -t {session_name} 2>/dev/null || echo 'not_exists'")
-            session_exists = "not_exists" not in check_session.get("output", "")
-            
-            if not session_exists:
-                # Create a new tmux session
-                await self._execute_raw_command(f"tmux new-session -d -s {session_name}")
+            # Create the tmux session unless it already exists
+            await self._execute_raw_command(f"tmux has-session -t {session_name} 2>/dev/null || tmux new-session -d -s {session_name}")
                 
             # Ensure we're in the correct directory and send command to tmux
             full_command = f"cd {cwd} && {command}"
             wrapped_command = full_command.replace('"', '\\"')  # Escape double quotes
             
             if blocking:
-                # For blocking execution, use a more reliable approach
-                # Add a unique marker to detect command completion
-                marker = f"COMMAND_DONE_{str(uuid4())[:8]}"
-                completion_command = f"{command} ; echo {marker}"
+                # Run the command through tee into a log file and record its exit
+                # status in a marker file once the output has been fully written.
+                # $? is escaped so it is expanded in the tmux pane, not by send-keys.
+                command_files = f"/tmp/command_{str(uuid4())[:8]}"
+                log_file = f"{command_files}.log"
+                exit_file = f"{command_files}.exit"
+                completion_command = (
+                    f"{{ cd {cwd} && {command} ; echo \\$? > {command_files}.status ; }} 2>&1 | tee {log_file} ; "
+                    f"mv -f {command_files}.status {exit_file} 2>/dev/null || echo unknown > {exit_file}"
+                )
                 wrapped_completion_command = completion_command.replace('"', '\\"')
                 
                 # Send the command with completion marker
-                await self._execute_raw_command(f'tmux send-keys -t {session_name} "cd {cwd} && {wrapped_completion_command}" Enter')
+                await self._execute_raw_command(f'tmux send-keys -t {session_name} "{wrapped_completion_command}" Enter')
                 
+                # Each round waits inside the sandbox for the marker file and returns
+                # only the output written since the previous round
                 start_time = time.time()
-                final_output = ""
+                output_chunks = []
+                offset = 0
+                exit_code = None
+                wait_time = self.BLOCKING_WAIT_INITIAL
                 
-                while (time.time() - start_time) < timeout:
-                    # Wait a shorter interval for more responsive checking
-                    await asyncio.sleep(0.5)
-                    
-                    # Check if session still exists (command might have exited)
-                    check_result = await self._execute_raw_command(f"tmux has-session -t {session_name} 2>/dev/null || echo 'ended'")
-                    if "ended" in check_result.get("output", ""):
+                while True:
+                    remaining = timeout - (time.time() - start_time)
+                    if remaining <= 0:
                         break
-                        
-                    # Get current output and check for our completion marker
-                    output_result = await self._execute_raw_command(f"tmux capture-pane -t {session_name} -p -S - -E -")
-                    current_output = output_result.get("output", "")
-                    
-                    if marker in current_output:
-                        final_output = current_output
+                    exit_code, new_output, offset = await self._wait_for_command(
+                        log_file, exit_file, offset, min(wait_time, remaining)
+                    )
+                    output_chunks.append(new_output)
+                    if exit_code is not None:
                         break
+                    wait_time = min(wait_time * 2, self.BLOCKING_WAIT_MAX)
                 
-                # If we didn't get the marker, capture whatever output we have
-                if not final_output:
-                    output_result = await self._execute_raw_command(f"tmux capture-pane -t {session_name} -p -S - -E -")
-                    final_output = output_result.get("output", "")
-                
-                # Kill the session after capture
-                await self._execute_raw_command(f"tmux kill-session -t {session_name}")
+                # Kill the session and remove the command files
+                await self._execute_raw_command(f"tmux kill-session -t {session_name} ; rm -f {command_files}.*")
                 
                 return self.success_response({
-                    "output": final_output,
+                    "output": "".join(output_chunks),
+                    "exit_code": int(exit_code) if exit_code and exit_code.isdigit() else None,
                     "session_name": session_name,
                     "cwd": cwd,
-                    "completed": True
+                    "completed": True,
+                    "timed_out": exit_code is None
                 })
             else:
                 # Send command to tmux session for non-blocking execution
@@ -208,6 +208,30 @@ class SandboxShellTool(SandboxToolsBase):
                     pass
             return self.fail_response(f"Error executing command: {str(e)}")
 
+    async def _wait_for_command(self, log_file: str, exit_file: str, offset: int, wait_time: float) -> Tuple[Optional[str], str, int]:
+        """Wait up to wait_time inside the sandbox for a blocking command to finish.
+        
+        Returns the exit status (None while still running), the output written
+        to log_file after byte offset, and the new offset.
+        """
+        ticks = max(1, int(wait_time / self.BLOCKING_POLL_INTERVAL))
+        script = (
+            f"for i in $(seq {ticks}); do [ -f {exit_file} ] && break; sleep {self.BLOCKING_POLL_INTERVAL}; done; "
+            f"if [ -f {exit_file} ]; then echo \"exit:$(cat {exit_file})\"; else echo running; fi; "
+            f"size=$(wc -c 2>/dev/null < {log_file} || echo 0); echo \"size:$size\"; "
+            f"tail -c +{offset + 1} {log_file} 2>/dev/null | head -c $((size - {offset}))"
+        )
+        result = await self._execute_raw_command(script)
+        status_line, size_line, new_output = (result.get("output", "").split("\n", 2) + ["", ""])[:3]
+        
+        exit_code = status_line[len("exit:"):].strip() if status_line.startswith("exit:") else None
+        try:
+            new_offset = int(size_line[len("size:"):].strip())
+        except ValueError:
+            new_offset = offset
+            new_output = ""
+        return exit_code, new_output, max(offset, new_offset)
+
     async def _execute_raw_command(self, command: str) -> Dict[str, Any]:
         """Execute a raw command directly in the sandbox."""
         # Ensure session exists for raw commands
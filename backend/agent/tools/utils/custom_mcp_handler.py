@@ -1,11 +1,9 @@
 import json
-import asyncio
 from typing import Dict, Any, List
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.sse import sse_client
-from mcp.client.stdio import stdio_client
-from mcp.client.streamable_http import streamablehttp_client
 from utils.logger import logger
+from mcp_service.discovery import discover_servers
+from mcp_service.session_pool import MCPSessionPool, TRANSPORT_HTTP
+from mcp_service.tool_cache import mcp_tool_cache, tool_to_dict
 from .mcp_connection_manager import MCPConnectionManager
 
 
@@ -13,14 +11,13 @@ class CustomMCPHandler:
     def __init__(self, connection_manager: MCPConnectionManager):
         self.connection_manager = connection_manager
         self.custom_tools: Dict[str, Dict[str, Any]] = {}
+        self.discovery_timings: List[Dict[str, Any]] = []
     
-    async def initialize_custom_mcps(self, custom_configs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
-        for config in custom_configs:
-            try:
-                await self._initialize_single_custom_mcp(config)
-            except Exception as e:
-                logger.error(f"Failed to initialize custom MCP {config.get('name', 'Unknown')}: {e}")
-                continue
+    async def initialize_custom_mcps(self, custom_configs: List[Dict[str, Any]], deadline: float = 30) -> Dict[str, Dict[str, Any]]:
+        self.discovery_timings = await discover_servers(
+            [(config.get('name', 'Unknown'), self._initialize_single_custom_mcp(config)) for config in custom_configs],
+            deadline,
+        )
         
         return self.custom_tools
     
@@ -29,21 +26,28 @@ class CustomMCPHandler:
         server_config = config.get('config', {})
         enabled_tools = config.get('enabledTools', [])
         server_name = config.get('name', 'Unknown')
+        qualified_name = config.get('qualifiedName', f"custom_{custom_type}_{server_name}")
         
         logger.info(f"Initializing custom MCP: {server_name} (type: {custom_type})")
         
         if custom_type == 'pipedream':
-            await self._initialize_pipedream_mcp(server_name, server_config, enabled_tools)
+            await self._initialize_pipedream_mcp(server_name, server_config, enabled_tools, qualified_name)
         elif custom_type == 'sse':
-            await self._initialize_sse_mcp(server_name, server_config, enabled_tools)
+            await self._initialize_sse_mcp(server_name, server_config, enabled_tools, qualified_name)
         elif custom_type == 'http':
-            await self._initialize_http_mcp(server_name, server_config, enabled_tools)
+            await self._initialize_http_mcp(server_name, server_config, enabled_tools, qualified_name)
         elif custom_type == 'json':
-            await self._initialize_json_mcp(server_name, server_config, enabled_tools)
+            await self._initialize_json_mcp(server_name, server_config, enabled_tools, qualified_name)
         else:
             logger.error(f"Custom MCP {server_name}: Unsupported type '{custom_type}'")
     
-    async def _initialize_pipedream_mcp(self, server_name: str, server_config: Dict[str, Any], enabled_tools: List[str]):
+    async def _discover_tools(self, qualified_name: str, server_config: Dict[str, Any], enabled_tools: List[str], fetch) -> List[Dict[str, Any]]:
+        """Tool list of a server from the cross-run cache, or discovered with fetch(session_pool)."""
+        return await mcp_tool_cache.get_or_fetch(
+            qualified_name, server_config, enabled_tools, fetch, self.connection_manager.session_pool
+        )
+    
+    async def _initialize_pipedream_mcp(self, server_name: str, server_config: Dict[str, Any], enabled_tools: List[str], qualified_name: str):
         app_slug = server_config.get('app_slug')
         if not app_slug and 'headers' in server_config and 'x-pd-app-slug' in server_config['headers']:
             app_slug = server_config['headers']['x-pd-app-slug']
@@ -59,78 +63,61 @@ class CustomMCPHandler:
         
         logger.info(f"Initializing Pipedream MCP for {app_slug} (user: {external_user_id}, oauth_app_id: {oauth_app_id})")
         
-        try:
+        async def fetch_tools(session_pool: MCPSessionPool) -> List[Dict[str, Any]]:
             from pipedream.client import get_pipedream_client
-            from mcp import ClientSession
-            from mcp.client.streamable_http import streamablehttp_client
             
             client = get_pipedream_client()
-            access_token = await client._obtain_access_token()
-            await client._ensure_rate_limit_token()
-            
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "x-pd-project-id": client.config.project_id,
-                "x-pd-environment": client.config.environment,
-                "x-pd-external-user-id": external_user_id,
-                "x-pd-app-slug": app_slug,
-            }
-            
-            if client.rate_limit_token:
-                headers["x-pd-rate-limit"] = client.rate_limit_token
-            
-            if oauth_app_id:
-                headers["x-pd-oauth-app-id"] = oauth_app_id
+            headers = await client.get_mcp_headers(external_user_id, app_slug, oauth_app_id)
 
-            url = "https://remote.mcp.pipedream.net"
+            url = client.mcp_url
             
-            async with streamablehttp_client(url, headers=headers) as (read_stream, write_stream, _):
-                async with ClientSession(read_stream, write_stream) as session:
-                    await session.initialize()
-                    tools_result = await session.list_tools()
-                    tools = tools_result.tools if hasattr(tools_result, 'tools') else tools_result
-                    
-                    self._register_custom_tools(tools, server_name, enabled_tools, 'pipedream', server_config)
+            tools_result = await session_pool.list_tools(TRANSPORT_HTTP, url, headers=headers)
+            tools = tools_result.tools if hasattr(tools_result, 'tools') else tools_result
+            return [tool_to_dict(tool) for tool in tools]
+        
+        try:
+            tools_info = await self._discover_tools(qualified_name, server_config, enabled_tools, fetch_tools)
+            self._register_custom_tools_from_info(tools_info, server_name, enabled_tools, 'pipedream', server_config)
                     
         except Exception as e:
             logger.error(f"Pipedream MCP {server_name}: Connection failed - {str(e)}")
             raise
     
-    async def _initialize_sse_mcp(self, server_name: str, server_config: Dict[str, Any], enabled_tools: List[str]):
+    async def _initialize_sse_mcp(self, server_name: str, server_config: Dict[str, Any], enabled_tools: List[str], qualified_name: str):
         if 'url' not in server_config:
             logger.error(f"Custom MCP {server_name}: Missing 'url' in config")
             return
         
-        server_info = await self.connection_manager.connect_sse_server(server_name, server_config)
-        if server_info.get('status') == 'connected':
-            tools_info = server_info.get('tools', [])
-            self._register_custom_tools_from_info(tools_info, server_name, enabled_tools, 'sse', server_config)
-        else:
-            logger.error(f"Failed to connect to custom MCP {server_name}")
+        async def fetch_tools(session_pool: MCPSessionPool) -> List[Dict[str, Any]]:
+            server_info = await self.connection_manager.connect_sse_server(server_name, server_config, session_pool=session_pool)
+            return server_info.get('tools', [])
+        
+        tools_info = await self._discover_tools(qualified_name, server_config, enabled_tools, fetch_tools)
+        self._register_custom_tools_from_info(tools_info, server_name, enabled_tools, 'sse', server_config)
     
-    async def _initialize_http_mcp(self, server_name: str, server_config: Dict[str, Any], enabled_tools: List[str]):
+    async def _initialize_http_mcp(self, server_name: str, server_config: Dict[str, Any], enabled_tools: List[str], qualified_name: str):
         if 'url' not in server_config:
             logger.error(f"Custom MCP {server_name}: Missing 'url' in config")
             return
         
-        server_info = await self.connection_manager.connect_http_server(server_name, server_config)
-        if server_info.get('status') == 'connected':
-            tools_info = server_info.get('tools', [])
-            self._register_custom_tools_from_info(tools_info, server_name, enabled_tools, 'http', server_config)
-        else:
-            logger.error(f"Failed to connect to custom MCP {server_name}")
+        async def fetch_tools(session_pool: MCPSessionPool) -> List[Dict[str, Any]]:
+            server_info = await self.connection_manager.connect_http_server(server_name, server_config, session_pool=session_pool)
+            return server_info.get('tools', [])
+        
+        tools_info = await self._discover_tools(qualified_name, server_config, enabled_tools, fetch_tools)
+        self._register_custom_tools_from_info(tools_info, server_name, enabled_tools, 'http', server_config)
     
-    async def _initialize_json_mcp(self, server_name: str, server_config: Dict[str, Any], enabled_tools: List[str]):
+    async def _initialize_json_mcp(self, server_name: str, server_config: Dict[str, Any], enabled_tools: List[str], qualified_name: str):
         if 'command' not in server_config:
             logger.error(f"Custom MCP {server_name}: Missing 'command' in config")
             return
         
-        server_info = await self.connection_manager.connect_stdio_server(server_name, server_config)
-        if server_info.get('status') == 'connected':
-            tools_info = server_info.get('tools', [])
-            self._register_custom_tools_from_info(tools_info, server_name, enabled_tools, 'json', server_config)
-        else:
-            logger.error(f"Failed to connect to custom MCP {server_name}")
+        async def fetch_tools(session_pool: MCPSessionPool) -> List[Dict[str, Any]]:
+            server_info = await self.connection_manager.connect_stdio_server(server_name, server_config, session_pool=session_pool)
+            return server_info.get('tools', [])
+        
+        tools_info = await self._discover_tools(qualified_name, server_config, enabled_tools, fetch_tools)
+        self._register_custom_tools_from_info(tools_info, server_name, enabled_tools, 'json', server_config)
     
     async def _resolve_external_user_id(self, server_config: Dict[str, Any]) -> str:
         profile_id = server_config.get('profile_id')
@@ -170,28 +157,6 @@ class CustomMCPHandler:
             logger.error(f"Failed to resolve profile {profile_id}: {str(e)}")
             return None
     
-    def _register_custom_tools(self, tools, server_name: str, enabled_tools: List[str], custom_type: str, server_config: Dict[str, Any]):
-        tools_registered = 0
-        
-        for tool in tools:
-            tool_name_from_server = tool.name
-            if not enabled_tools or tool_name_from_server in enabled_tools:
-                tool_name = f"custom_{server_name.replace(' ', '_').lower()}_{tool_name_from_server}"
-                self.custom_tools[tool_name] = {
-                    'name': tool_name,
-                    'description': tool.description,
-                    'parameters': tool.inputSchema,
-                    'server': server_name,
-                    'original_name': tool_name_from_server,
-                    'is_custom': True,
-                    'custom_type': custom_type,
-                    'custom_config': server_config
-                }
-                tools_registered += 1
-                logger.debug(f"Registered custom tool: {tool_name}")
-        
-        logger.info(f"Successfully initialized custom MCP {server_name} with {tools_registered} tools")
-    
     def _register_custom_tools_from_info(self, tools_info: List[Dict[str, Any]], server_name: str, enabled_tools: List[str], custom_type: str, server_config: Dict[str, Any]):
         tools_registered = 0
         
@@ -1,136 +1,58 @@
-import asyncio
-from typing import Dict, Any, List
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.sse import sse_client
-from mcp.client.stdio import stdio_client
-from mcp.client.streamable_http import streamablehttp_client
+from typing import Dict, Any, List, Optional
+from mcp_service.session_pool import MCPSessionPool, TRANSPORT_HTTP, TRANSPORT_SSE, TRANSPORT_STDIO
 from utils.logger import logger
 
 
 class MCPConnectionManager:
-    def __init__(self):
+    def __init__(self, session_pool: Optional[MCPSessionPool] = None):
         self.connected_servers: Dict[str, Dict[str, Any]] = {}
+        self.session_pool = session_pool or MCPSessionPool()
     
-    async def connect_sse_server(self, server_name: str, server_config: Dict[str, Any], timeout: int = 15) -> Dict[str, Any]:
+    def _register_server(self, server_name: str, transport: str, tools_result, url: Optional[str] = None) -> Dict[str, Any]:
+        tools_info = [
+            {
+                "name": tool.name,
+                "description": tool.description,
+                "input_schema": tool.inputSchema
+            }
+            for tool in tools_result.tools
+        ]
+        
+        server_info = {
+            "status": "connected",
+            "transport": transport,
+            "tools": tools_info
+        }
+        if url:
+            server_info["url"] = url
+        
+        self.connected_servers[server_name] = server_info
+        transport_label = {"sse": "SSE", "http": "HTTP"}.get(transport, transport)
+        logger.info(f"Connected to {server_name} via {transport_label} ({len(tools_info)} tools)")
+        return server_info
+    
+    async def connect_sse_server(self, server_name: str, server_config: Dict[str, Any], timeout: int = 15, session_pool: Optional[MCPSessionPool] = None) -> Dict[str, Any]:
         url = server_config["url"]
         headers = server_config.get("headers", {})
         
-        async with asyncio.timeout(timeout):
-            try:
-                async with sse_client(url, headers=headers) as (read, write):
-                    async with ClientSession(read, write) as session:
-                        await session.initialize()
-                        tools_result = await session.list_tools()
-                        
-                        tools_info = [
-                            {
-                                "name": tool.name,
-                                "description": tool.description,
-                                "input_schema": tool.inputSchema
-                            }
-                            for tool in tools_result.tools
-                        ]
-                        
-                        server_info = {
-                            "status": "connected",
-                            "transport": "sse",
-                            "url": url,
-                            "tools": tools_info
-                        }
-                        
-                        self.connected_servers[server_name] = server_info
-                        logger.info(f"Connected to {server_name} via SSE ({len(tools_info)} tools)")
-                        return server_info
-                        
-            except TypeError as e:
-                if "unexpected keyword argument" in str(e):
-                    async with sse_client(url) as (read, write):
-                        async with ClientSession(read, write) as session:
-                            await session.initialize()
-                            tools_result = await session.list_tools()
-                            
-                            tools_info = [
-                                {
-                                    "name": tool.name,
-                                    "description": tool.description,
-                                    "input_schema": tool.inputSchema
-                                }
-                                for tool in tools_result.tools
-                            ]
-                            
-                            server_info = {
-                                "status": "connected",
-                                "transport": "sse",
-                                "url": url,
-                                "tools": tools_info
-                            }
-                            
-                            self.connected_servers[server_name] = server_info
-                            logger.info(f"Connected to {server_name} via SSE ({len(tools_info)} tools)")
-                            return server_info
-                else:
-                    raise
+        tools_result = await (session_pool or self.session_pool).list_tools(TRANSPORT_SSE, url, headers=headers, timeout=timeout)
+        return self._register_server(server_name, "sse", tools_result, url=url)
     
-    async def connect_http_server(self, server_name: str, server_config: Dict[str, Any], timeout: int = 15) -> Dict[str, Any]:
+    async def connect_http_server(self, server_name: str, server_config: Dict[str, Any], timeout: int = 15, session_pool: Optional[MCPSessionPool] = None) -> Dict[str, Any]:
         url = server_config["url"]
         
-        async with asyncio.timeout(timeout):
-            async with streamablehttp_client(url) as (read_stream, write_stream, _):
-                async with ClientSession(read_stream, write_stream) as session:
-                    await session.initialize()
-                    tools_result = await session.list_tools()
-                    
-                    tools_info = [
-                        {
-                            "name": tool.name,
-                            "description": tool.description,
-                            "input_schema": tool.inputSchema
-                        }
-                        for tool in tools_result.tools
-                    ]
-                    
-                    server_info = {
-                        "status": "connected",
-                        "transport": "http",
-                        "url": url,
-                        "tools": tools_info
-                    }
-                    
-                    self.connected_servers[server_name] = server_info
-                    logger.info(f"Connected to {server_name} via HTTP ({len(tools_info)} tools)")
-                    return server_info
+        tools_result = await (session_pool or self.session_pool).list_tools(TRANSPORT_HTTP, url, timeout=timeout)
+        return self._register_server(server_name, "http", tools_result, url=url)
     
-    async def connect_stdio_server(self, server_name: str, server_config: Dict[str, Any], timeout: int = 15) -> Dict[str, Any]:
-        server_params = StdioServerParameters(
-            command=server_config["command"],
-            args=server_config.get("args", []),
-            env=server_config.get("env", {})
-        )
+    async def connect_stdio_server(self, server_name: str, server_config: Dict[str, Any], timeout: int = 15, session_pool: Optional[MCPSessionPool] = None) -> Dict[str, Any]:
+        target = {
+            "command": server_config["command"],
+            "args": server_config.get("args", []),
+            "env": server_config.get("env", {})
+        }
         
-        async with asyncio.timeout(timeout):
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    await session.initialize()
-                    tools_result = await session.list_tools()
-                    
-                    tools_info = [
-                        {
-                            "name": tool.name,
-                            "description": tool.description,
-                            "input_schema": tool.inputSchema
-                        }
-                        for tool in tools_result.tools
-                    ]
-                    
-                    server_info = {
-                        "status": "connected",
-                        "transport": "stdio",
-                        "tools": tools_info
-                    }
-                    
-                    self.connected_servers[server_name] = server_info
-                    logger.info(f"Connected to {server_name} via stdio ({len(tools_info)} tools)")
-                    return server_info
+        tools_result = await (session_pool or self.session_pool).list_tools(TRANSPORT_STDIO, target, timeout=timeout)
+        return self._register_server(server_name, "stdio", tools_result)
     
     def get_server_info(self, server_name: str) -> Dict[str, Any]:
         return self.connected_servers.get(server_name, {})
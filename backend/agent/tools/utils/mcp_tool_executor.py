@@ -1,20 +1,17 @@
 import json
-import asyncio
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from agentpress.tool import ToolResult
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.sse import sse_client
-from mcp.client.stdio import stdio_client
-from mcp.client.streamable_http import streamablehttp_client
 from mcp_service.client import MCPManager
+from mcp_service.session_pool import MCPSessionPool, TRANSPORT_HTTP, TRANSPORT_SSE, TRANSPORT_STDIO
 from utils.logger import logger
 
 
 class MCPToolExecutor:
-    def __init__(self, mcp_manager: MCPManager, custom_tools: Dict[str, Dict[str, Any]], tool_wrapper=None):
+    def __init__(self, mcp_manager: MCPManager, custom_tools: Dict[str, Dict[str, Any]], tool_wrapper=None, session_pool: Optional[MCPSessionPool] = None):
         self.mcp_manager = mcp_manager
         self.custom_tools = custom_tools
         self.tool_wrapper = tool_wrapper
+        self.session_pool = session_pool or mcp_manager.session_pool
     
     async def execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> ToolResult:
         logger.info(f"Executing MCP tool {tool_name} with arguments {arguments}")
@@ -69,31 +66,12 @@ class MCPToolExecutor:
             from pipedream.client import get_pipedream_client
             
             client = get_pipedream_client()
-            access_token = await client._obtain_access_token()
-            await client._ensure_rate_limit_token()
+            headers = await client.get_mcp_headers(external_user_id, app_slug, oauth_app_id)
             
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "x-pd-project-id": client.config.project_id,
-                "x-pd-environment": client.config.environment,
-                "x-pd-external-user-id": external_user_id,
-                "x-pd-app-slug": app_slug,
-            }
+            url = client.mcp_url
             
-            if client.rate_limit_token:
-                headers["x-pd-rate-limit"] = client.rate_limit_token
-            
-            if oauth_app_id:
-                headers["x-pd-oauth-app-id"] = oauth_app_id
-            
-            url = "https://remote.mcp.pipedream.net"
-            
-            async with asyncio.timeout(30):
-                async with streamablehttp_client(url, headers=headers) as (read_stream, write_stream, _):
-                    async with ClientSession(read_stream, write_stream) as session:
-                        await session.initialize()
-                        result = await session.call_tool(original_tool_name, arguments)
-                        return self._create_success_result(self._extract_content(result))
+            result = await self.session_pool.call_tool(TRANSPORT_HTTP, url, original_tool_name, arguments, headers=headers, timeout=30)
+            return self._create_success_result(self._extract_content(result))
                         
         except Exception as e:
             logger.error(f"Error executing Pipedream MCP tool: {str(e)}")
@@ -106,23 +84,8 @@ class MCPToolExecutor:
         url = custom_config['url']
         headers = custom_config.get('headers', {})
         
-        async with asyncio.timeout(30):
-            try:
-                async with sse_client(url, headers=headers) as (read, write):
-                    async with ClientSession(read, write) as session:
-                        await session.initialize()
-                        result = await session.call_tool(original_tool_name, arguments)
-                        return self._create_success_result(self._extract_content(result))
-                        
-            except TypeError as e:
-                if "unexpected keyword argument" in str(e):
-                    async with sse_client(url) as (read, write):
-                        async with ClientSession(read, write) as session:
-                            await session.initialize()
-                            result = await session.call_tool(original_tool_name, arguments)
-                            return self._create_success_result(self._extract_content(result))
-                else:
-                    raise
+        result = await self.session_pool.call_tool(TRANSPORT_SSE, url, original_tool_name, arguments, headers=headers, timeout=30)
+        return self._create_success_result(self._extract_content(result))
     
     async def _execute_http_tool(self, tool_name: str, arguments: Dict[str, Any], tool_info: Dict[str, Any]) -> ToolResult:
         custom_config = tool_info['custom_config']
@@ -131,12 +94,8 @@ class MCPToolExecutor:
         url = custom_config['url']
         
         try:
-            async with asyncio.timeout(30):
-                async with streamablehttp_client(url) as (read, write, _):
-                    async with ClientSession(read, write) as session:
-                        await session.initialize()
-                        result = await session.call_tool(original_tool_name, arguments)
-                        return self._create_success_result(self._extract_content(result))
+            result = await self.session_pool.call_tool(TRANSPORT_HTTP, url, original_tool_name, arguments, timeout=30)
+            return self._create_success_result(self._extract_content(result))
                         
         except Exception as e:
             logger.error(f"Error executing HTTP MCP tool: {str(e)}")
@@ -146,18 +105,14 @@ class MCPToolExecutor:
         custom_config = tool_info['custom_config']
         original_tool_name = tool_info['original_name']
         
-        server_params = StdioServerParameters(
-            command=custom_config["command"],
-            args=custom_config.get("args", []),
-            env=custom_config.get("env", {})
-        )
+        target = {
+            "command": custom_config["command"],
+            "args": custom_config.get("args", []),
+            "env": custom_config.get("env", {})
+        }
         
-        async with asyncio.timeout(30):
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    await session.initialize()
-                    result = await session.call_tool(original_tool_name, arguments)
-                    return self._create_success_result(self._extract_content(result))
+        result = await self.session_pool.call_tool(TRANSPORT_STDIO, target, original_tool_name, arguments, timeout=30)
+        return self._create_success_result(self._extract_content(result))
     
     async def _resolve_external_user_id(self, custom_config: Dict[str, Any]) -> str:
         profile_id = custom_config.get('profile_id')
@@ -6,25 +6,118 @@ reaching the context window limitations of LLM models.
 """
 
 import json
-from typing import List, Dict, Any, Optional, Union
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Union, Tuple, Literal
 
 from litellm.utils import token_counter
 from services.supabase import DBConnection
 from utils.logger import logger
+from utils.config import config
 
 DEFAULT_TOKEN_THRESHOLD = 120000
+TOKEN_CACHE_MAX_ENTRIES = 20000
+
+# Type alias for the context compression algorithm
+CompressionStrategy = Literal["recursive", "packed"]
+
+
+def get_model_max_tokens(llm_model: str) -> int:
+    """Get the prompt token budget used for context compression of a model."""
+    if 'sonnet' in llm_model.lower():
+        return 200 * 1000 - 64000 - 28000
+    elif 'gpt' in llm_model.lower():
+        return 128 * 1000 - 28000
+    elif 'gemini' in llm_model.lower():
+        return 1000 * 1000 - 300000
+    elif 'deepseek' in llm_model.lower():
+        return 128 * 1000 - 28000
+    else:
+        return 41 * 1000 - 10000
+
+
+@dataclass
+class PackingReport:
+    """Outcome of a single ``ContextManager.pack_messages`` pass."""
+    budget: int
+    tokens_before: int
+    tokens_after: int = 0
+    messages_before: int = 0
+    messages_after: int = 0
+    truncated: List[str] = field(default_factory=list)
+    omitted: List[str] = field(default_factory=list)
+    over_budget: bool = False
+
+    def summary(self) -> str:
+        return (
+            f"{self.tokens_before} -> {self.tokens_after}/{self.budget} tokens, "
+            f"{self.messages_before} -> {self.messages_after} messages, "
+            f"truncated={len(self.truncated)}, omitted={len(self.omitted)}"
+            + (", still over budget" if self.over_budget else "")
+        )
+
+class MessageTokenCache:
+    """Memoizes per-message token counts.
+    
+    Entries are keyed by model, message_id and a hash of the message, so a
+    message that gets compressed or truncated is simply counted again. List
+    totals are computed as sums of cached per-message counts.
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._counts: "OrderedDict[Tuple[str, Optional[str], str], int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, msg: Dict[str, Any], llm_model: str) -> Tuple[str, Optional[str], str]:
+        serialized = json.dumps(msg, sort_keys=True, default=str)
+        content_hash = hashlib.blake2b(serialized.encode('utf-8'), digest_size=16).hexdigest()
+        return (llm_model, msg.get('message_id'), content_hash)
+
+    def count_message(self, msg: Dict[str, Any], llm_model: str) -> int:
+        """Get the token count of a single message, tokenizing only on a cache miss."""
+        key = self._key(msg, llm_model)
+        count = self._counts.get(key)
+        if count is not None:
+            self.hits += 1
+            self._counts.move_to_end(key)
+            return count
+
+        self.misses += 1
+        count = token_counter(model=llm_model, messages=[msg])
+        self._counts[key] = count
+        if len(self._counts) > self.max_entries:
+            self._counts.popitem(last=False)
+        return count
+
+    def count_messages(self, messages: List[Dict[str, Any]], llm_model: str) -> int:
+        """Get the token count of a message list as the sum of cached per-message counts."""
+        return sum(self.count_message(msg, llm_model) for msg in messages)
 
 class ContextManager:
     """Manages thread context including token counting and summarization."""
     
-    def __init__(self, token_threshold: int = DEFAULT_TOKEN_THRESHOLD):
+    def __init__(self, token_threshold: int = DEFAULT_TOKEN_THRESHOLD, compression_strategy: Optional[CompressionStrategy] = None):
         """Initialize the ContextManager.
         
         Args:
             token_threshold: Token count threshold to trigger summarization
+            compression_strategy: "recursive" (compress_messages) or "packed"
+                (pack_messages). Defaults to CONTEXT_COMPRESSION_STRATEGY.
         """
         self.db = DBConnection()
         self.token_threshold = token_threshold
+        self.compression_strategy = compression_strategy or config.CONTEXT_COMPRESSION_STRATEGY
+        if self.compression_strategy not in ("recursive", "packed"):
+            logger.warning(f"Unknown compression strategy '{self.compression_strategy}', using 'recursive'")
+            self.compression_strategy = "recursive"
+        self.token_cache = MessageTokenCache()
+
+    def count_tokens(self, messages: List[Dict[str, Any]], llm_model: str) -> int:
+        """Count tokens of a message list using the per-message token cache."""
+        return self.token_cache.count_messages(messages, llm_model)
 
     def is_tool_result_message(self, msg: Dict[str, Any]) -> bool:
         """Check if a message is a tool result message."""
@@ -94,7 +187,7 @@ class ContextManager:
   
     def compress_tool_result_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
         """Compress the tool result messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        uncompressed_total_token_count = self.count_tokens(messages, llm_model)
         max_tokens_value = max_tokens or (100 * 1000)
 
         if uncompressed_total_token_count > max_tokens_value:
@@ -102,7 +195,7 @@ class ContextManager:
             for msg in reversed(messages):  # Start from the end and work backwards
                 if self.is_tool_result_message(msg):  # Only compress ToolResult messages
                     _i += 1  # Count the number of ToolResult messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
+                    msg_token_count = self.token_cache.count_message(msg, llm_model)  # Count the number of tokens in the message
                     if msg_token_count > token_threshold:  # If the message is too long
                         if _i > 1:  # If this is not the most recent ToolResult message
                             message_id = msg.get('message_id')  # Get the message_id
@@ -116,7 +209,7 @@ class ContextManager:
 
     def compress_user_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
         """Compress the user messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        uncompressed_total_token_count = self.count_tokens(messages, llm_model)
         max_tokens_value = max_tokens or (100 * 1000)
 
         if uncompressed_total_token_count > max_tokens_value:
@@ -124,7 +217,7 @@ class ContextManager:
             for msg in reversed(messages):  # Start from the end and work backwards
                 if msg.get('role') == 'user':  # Only compress User messages
                     _i += 1  # Count the number of User messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
+                    msg_token_count = self.token_cache.count_message(msg, llm_model)  # Count the number of tokens in the message
                     if msg_token_count > token_threshold:  # If the message is too long
                         if _i > 1:  # If this is not the most recent User message
                             message_id = msg.get('message_id')  # Get the message_id
@@ -138,7 +231,7 @@ class ContextManager:
 
     def compress_assistant_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
         """Compress the assistant messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        uncompressed_total_token_count = self.count_tokens(messages, llm_model)
         max_tokens_value = max_tokens or (100 * 1000)
         
         if uncompressed_total_token_count > max_tokens_value:
@@ -146,7 +239,7 @@ class ContextManager:
             for msg in reversed(messages):  # Start from the end and work backwards
                 if msg.get('role') == 'assistant':  # Only compress Assistant messages
                     _i += 1  # Count the number of Assistant messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
+                    msg_token_count = self.token_cache.count_message(msg, llm_model)  # Count the number of tokens in the message
                     if msg_token_count > token_threshold:  # If the message is too long
                         if _i > 1:  # If this is not the most recent Assistant message
                             message_id = msg.get('message_id')  # Get the message_id
@@ -196,30 +289,26 @@ class ContextManager:
             token_threshold: Token threshold for individual message compression (must be a power of 2)
             max_iterations: Maximum number of compression iterations
         """
+        if self.compression_strategy == "packed":
+            packed, report = self.pack_messages(messages, llm_model, token_threshold=token_threshold)
+            return packed
+
         # Set model-specific token limits
-        if 'sonnet' in llm_model.lower():
-            max_tokens = 200 * 1000 - 64000 - 28000
-        elif 'gpt' in llm_model.lower():
-            max_tokens = 128 * 1000 - 28000
-        elif 'gemini' in llm_model.lower():
-            max_tokens = 1000 * 1000 - 300000
-        elif 'deepseek' in llm_model.lower():
-            max_tokens = 128 * 1000 - 28000
-        else:
-            max_tokens = 41 * 1000 - 10000
+        max_tokens = get_model_max_tokens(llm_model)
 
         result = messages
         result = self.remove_meta_messages(result)
 
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=result)
+        uncompressed_total_token_count = self.count_tokens(result, llm_model)
 
         result = self.compress_tool_result_messages(result, llm_model, max_tokens, token_threshold)
         result = self.compress_user_messages(result, llm_model, max_tokens, token_threshold)
         result = self.compress_assistant_messages(result, llm_model, max_tokens, token_threshold)
 
-        compressed_token_count = token_counter(model=llm_model, messages=result)
+        compressed_token_count = self.count_tokens(result, llm_model)
 
         logger.info(f"compress_messages: {uncompressed_total_token_count} -> {compressed_token_count}")  # Log the token compression for debugging later
+        logger.debug(f"compress_messages: token cache hits={self.token_cache.hits}, misses={self.token_cache.misses}")
 
         if max_iterations <= 0:
             logger.warning(f"compress_messages: Max iterations reached, omitting messages")
@@ -232,6 +321,126 @@ class ContextManager:
 
         return self.middle_out_messages(result)
     
+    def pack_messages(
+            self,
+            messages: List[Dict[str, Any]],
+            llm_model: str,
+            max_tokens: Optional[int] = None,
+            token_threshold: int = 4096,
+            recent_messages_to_keep: int = 6,
+            max_messages: int = 320
+        ) -> Tuple[List[Dict[str, Any]], PackingReport]:
+        """Fit the messages into the model budget in a single deterministic pass.
+        
+        Per-message token costs are computed once. Messages are then truncated
+        oldest first and, if that is not enough, omitted oldest first until the
+        total fits. The system prompt, the first user message, the last user
+        message, the last tool result and the most recent messages are never
+        omitted; they are only middle-truncated as a last resort.
+        
+        Args:
+            messages: List of messages to pack
+            llm_model: Model name for token counting
+            max_tokens: Token budget, defaults to the model's budget
+            token_threshold: Messages above this many tokens are truncation candidates
+            recent_messages_to_keep: Number of trailing messages that are protected
+            max_messages: Maximum number of messages to keep
+            
+        Returns:
+            Tuple of (packed messages, report of what was truncated and omitted)
+        """
+        budget = max_tokens or get_model_max_tokens(llm_model)
+        result = self.remove_meta_messages(messages)
+        costs = [self.token_cache.count_message(msg, llm_model) for msg in result]
+        total = sum(costs)
+        report = PackingReport(budget=budget, tokens_before=total, messages_before=len(result))
+
+        def label(index: int) -> str:
+            return result[index].get('message_id') or f"index:{index}"
+
+        # Protected messages
+        protected = set(range(max(0, len(result) - recent_messages_to_keep), len(result)))
+        if result and result[0].get('role') == 'system':
+            protected.add(0)
+        first_user = next((i for i, msg in enumerate(result) if msg.get('role') == 'user'), None)
+        last_user = next((i for i in reversed(range(len(result))) if result[i].get('role') == 'user'), None)
+        last_tool_result = next((i for i in reversed(range(len(result))) if self.is_tool_result_message(result[i])), None)
+        protected.update(i for i in (first_user, last_user, last_tool_result) if i is not None)
+
+        # 1. Truncate oversized unprotected messages, oldest first
+        for i in range(len(result)):
+            if total <= budget:
+                break
+            if i in protected or costs[i] <= token_threshold:
+                continue
+            message_id = result[i].get('message_id')
+            if not message_id:
+                logger.warning(f"UNEXPECTED: Message has no message_id {str(result[i])[:100]}")
+                continue
+            truncated_msg = dict(result[i])
+            truncated_msg["content"] = self.compress_message(truncated_msg["content"], message_id, token_threshold * 3)
+            new_cost = self.token_cache.count_message(truncated_msg, llm_model)
+            total -= costs[i] - new_cost
+            result[i], costs[i] = truncated_msg, new_cost
+            report.truncated.append(label(i))
+
+        # 2. Omit unprotected messages, oldest first
+        keep = [True] * len(result)
+        unprotected = [i for i in range(len(result)) if i not in protected]
+        excess_messages = max(0, len(result) - max_messages)
+        for i in unprotected:
+            if total <= budget and excess_messages <= 0:
+                break
+            keep[i] = False
+            total -= costs[i]
+            excess_messages -= 1
+            report.omitted.append(label(i))
+
+        # 3. Middle-truncate the largest protected messages (never the system prompt)
+        if total > budget:
+            for i in sorted(protected, key=lambda i: costs[i], reverse=True):
+                if total <= budget:
+                    break
+                if costs[i] <= token_threshold or result[i].get('role') == 'system':
+                    continue
+                # Cut the excess from this message, but not below the truncation threshold
+                allowed = max(costs[i] - (total - budget), token_threshold)
+                truncated_msg, new_cost = self.truncate_to_tokens(result[i], costs[i], allowed, llm_model)
+                total -= costs[i] - new_cost
+                result[i], costs[i] = truncated_msg, new_cost
+                report.truncated.append(label(i))
+
+        packed = [msg for i, msg in enumerate(result) if keep[i]]
+        report.tokens_after = total
+        report.messages_after = len(packed)
+        report.over_budget = total > budget
+        logger.info(f"pack_messages: {report.summary()}")
+        if report.over_budget:
+            logger.warning(f"pack_messages: could not fit protected messages into budget: {total} > {budget}")
+        return packed, report
+
+    def truncate_to_tokens(self, msg: Dict[str, Any], cost: int, max_tokens: int, llm_model: str, attempts: int = 3) -> Tuple[Dict[str, Any], int]:
+        """Middle-truncate a message until it costs at most max_tokens.
+        
+        The character limit starts from the message's own characters per token
+        and shrinks by the remaining overshoot on each attempt.
+        
+        Returns:
+            Tuple of (truncated message, its token cost)
+        """
+        content = msg["content"]
+        length = len(content) if isinstance(content, str) else len(json.dumps(content))
+        max_chars = int(length * max_tokens / max(cost, 1))
+        truncated_msg, new_cost = msg, cost
+        for _ in range(attempts):
+            truncated_msg = dict(msg)
+            truncated_msg["content"] = self.safe_truncate(content, max(max_chars, 1000))
+            new_cost = self.token_cache.count_message(truncated_msg, llm_model)
+            if new_cost <= max_tokens or max_chars <= 1000:
+                break
+            max_chars = int(max_chars * max_tokens / new_cost * 0.9)
+        return truncated_msg, new_cost
+
     def compress_messages_by_omitting_messages(
             self, 
             messages: List[Dict[str, Any]], 
@@ -256,7 +465,7 @@ class ContextManager:
         result = self.remove_meta_messages(result)
 
         # Early exit if no compression needed
-        initial_token_count = token_counter(model=llm_model, messages=result)
+        initial_token_count = self.count_tokens(result, llm_model)
         max_allowed_tokens = max_tokens or (100 * 1000)
         
         if initial_token_count <= max_allowed_tokens:
@@ -293,11 +502,11 @@ class ContextManager:
 
             # Recalculate token count
             messages_to_count = ([system_message] + conversation_messages) if system_message else conversation_messages
-            current_token_count = token_counter(model=llm_model, messages=messages_to_count)
+            current_token_count = self.count_tokens(messages_to_count, llm_model)
 
         # Prepare final result
         final_messages = ([system_message] + conversation_messages) if system_message else conversation_messages
-        final_token_count = token_counter(model=llm_model, messages=final_messages)
+        final_token_count = self.count_tokens(final_messages, llm_model)
         
         logger.info(f"compress_messages_by_omitting_messages: {initial_token_count} -> {final_token_count} tokens ({len(messages)} -> {len(final_messages)} messages)")
             
@@ -312,4 +521,32 @@ class ContextManager:
         keep_start = max_messages // 2
         keep_end = max_messages - keep_start
         
-        return messages[:keep_start] + messages[-keep_end:] 
\ No newline at end of file
+        return messages[:keep_start] + messages[-keep_end:] 
+
+
+if __name__ == "__main__":
+    # Micro-benchmark: compress a 500-message thread with and without the token
+    # cache, and with the single-pass packer for A/B comparison.
+    #   python -m agentpress.context_manager [model]
+    import sys
+    import time
+
+    model = sys.argv[1] if len(sys.argv) > 1 else "gpt-4o"
+    thread = [{"role": "system", "content": "You are a helpful assistant."}]
+    for i in range(500):
+        role = "user" if i % 2 == 0 else "assistant"
+        body = f"Message {i}: " + ("lorem ipsum dolor sit amet " * (40 if i % 7 else 400))
+        thread.append({"role": role, "content": body, "message_id": f"msg-{i}"})
+
+    runs = (("uncached", "recursive", 0), ("cached", "recursive", TOKEN_CACHE_MAX_ENTRIES),
+            ("packed", "packed", TOKEN_CACHE_MAX_ENTRIES))
+    for label, strategy, max_entries in runs:
+        manager = ContextManager(compression_strategy=strategy)
+        manager.token_cache = MessageTokenCache(max_entries=max_entries)
+        timings = []
+        for _ in range(3):  # Successive auto-continue iterations over the same thread
+            started = time.perf_counter()
+            manager.compress_messages([dict(msg) for msg in thread], model)
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f"{label:9s} " + ", ".join(f"{t:.0f} ms" for t in timings)
+              + f" (tokenizer calls: {manager.token_cache.misses})")
@@ -0,0 +1,208 @@
+"""
+Per-thread LLM message cache for AgentPress.
+
+Keeps the parsed LLM messages of recently used threads in the worker process
+so that every auto-continue iteration only has to fetch rows created after
+the last cached message instead of re-downloading the whole thread. An
+optional Redis tier lets another worker process pick up a warm cache.
+"""
+
+import json
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+REDIS_CACHE_TTL = 3600  # 1 hour
+
+
+def _parse_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def parse_message_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Convert a ``messages`` row into the LLM message dict used by ThreadManager."""
+    content = row['content']
+    if isinstance(content, str):
+        try:
+            message = json.loads(content)
+        except json.JSONDecodeError:
+            logger.error(f"Failed to parse message: {content}")
+            return None
+    else:
+        message = dict(content)
+    message['message_id'] = row['message_id']
+    return message
+
+
+@dataclass
+class _ThreadEntry:
+    """Cached LLM messages of a single thread, ordered by created_at."""
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    created_at: List[str] = field(default_factory=list)
+    message_ids: Set[str] = field(default_factory=set)
+    # Newest created_at returned by a database fetch. Rows appended locally
+    # are not counted, so rows committed by other processes are never skipped.
+    fetched_until: Optional[str] = None
+    # Locally appended rows not yet written to the Redis tier
+    unpersisted: List[Dict[str, Any]] = field(default_factory=list)
+
+
+class ThreadMessageCache:
+    """LRU cache of parsed LLM messages keyed by thread_id.
+
+    Usage:
+        messages = await message_cache.refresh(thread_id, fetch_rows)
+        message_cache.append(thread_id, saved_row)
+        message_cache.invalidate(thread_id)
+    """
+
+    def __init__(self, max_threads: int = 256, use_redis: bool = False):
+        self.max_threads = max_threads
+        self.use_redis = use_redis
+        self._entries: "OrderedDict[str, _ThreadEntry]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _redis_key(self, thread_id: str) -> str:
+        return f"thread_messages:{thread_id}"
+
+    def _touch(self, thread_id: str, entry: _ThreadEntry):
+        self._entries[thread_id] = entry
+        self._entries.move_to_end(thread_id)
+        while len(self._entries) > self.max_threads:
+            evicted_id, _ = self._entries.popitem(last=False)
+            lock = self._locks.get(evicted_id)
+            # A refresh holding the lock must stay the only fetch for that thread
+            if lock is not None and not lock.locked():
+                del self._locks[evicted_id]
+
+    def _add_rows(self, entry: _ThreadEntry, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Merge rows into an entry, skipping known ids. Returns the rows that were new."""
+        added = []
+        needs_sort = False
+        for row in rows:
+            if row['message_id'] in entry.message_ids:
+                continue
+            message = parse_message_row(row)
+            if message is None:
+                continue
+            if entry.created_at and _parse_timestamp(row['created_at']) < _parse_timestamp(entry.created_at[-1]):
+                needs_sort = True
+            entry.messages.append(message)
+            entry.created_at.append(row['created_at'])
+            entry.message_ids.add(row['message_id'])
+            added.append(row)
+
+        if needs_sort:
+            order = sorted(range(len(entry.messages)), key=lambda i: _parse_timestamp(entry.created_at[i]))
+            entry.messages = [entry.messages[i] for i in order]
+            entry.created_at = [entry.created_at[i] for i in order]
+        return added
+
+    async def _load_from_redis(self, thread_id: str) -> Optional[_ThreadEntry]:
+        key = self._redis_key(thread_id)
+        try:
+            fetched_until = await redis.get(f"{key}:fetched_until")
+            raw_rows = await redis.lrange(key, 0, -1) if fetched_until else []
+        except Exception as e:
+            logger.warning(f"Failed to load message cache for thread {thread_id} from Redis: {str(e)}")
+            return None
+        if not raw_rows:
+            return None
+
+        entry = _ThreadEntry(fetched_until=fetched_until)
+        self._add_rows(entry, [json.loads(raw_row) for raw_row in raw_rows])
+        logger.debug(f"Loaded {len(entry.messages)} cached messages for thread {thread_id} from Redis")
+        return entry
+
+    async def _save_to_redis(self, thread_id: str, entry: _ThreadEntry, rows: List[Dict[str, Any]], rewrite: bool):
+        key = self._redis_key(thread_id)
+        try:
+            if rewrite:
+                await redis.delete(key)
+            if rows:
+                await redis.rpush(key, *[
+                    json.dumps({'message_id': row['message_id'], 'content': row['content'], 'created_at': row['created_at']})
+                    for row in rows
+                ])
+            if entry.fetched_until:
+                await redis.set(f"{key}:fetched_until", entry.fetched_until, ex=REDIS_CACHE_TTL)
+            await redis.expire(key, REDIS_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to store message cache for thread {thread_id} in Redis: {str(e)}")
+
+    async def refresh(self, thread_id: str, fetch_rows) -> List[Dict[str, Any]]:
+        """Bring the cached thread up to date and return a copy of its messages.
+
+        Args:
+            thread_id: The thread to load.
+            fetch_rows: Async callable ``fetch_rows(since)`` returning LLM message
+                rows (``message_id``, ``content``, ``created_at``) ordered by
+                created_at, with ``created_at >= since`` (or all rows if None).
+
+        Returns:
+            Shallow copies of the cached message dicts, safe for callers to modify.
+        """
+        lock = self._locks.setdefault(thread_id, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(thread_id)
+            if entry is None and self.use_redis:
+                entry = await self._load_from_redis(thread_id)
+            is_new = entry is None
+            if entry is None:
+                entry = _ThreadEntry()
+
+            rows = await fetch_rows(entry.fetched_until)
+            new_rows = self._add_rows(entry, rows)
+            if rows:
+                entry.fetched_until = max((row['created_at'] for row in rows), key=_parse_timestamp)
+            self._touch(thread_id, entry)
+
+            logger.debug(
+                f"Message cache for thread {thread_id}: {'miss' if is_new else 'hit'}, "
+                f"{len(new_rows)} new of {len(rows)} fetched, {len(entry.messages)} total"
+            )
+            if self.use_redis and (is_new or rows or entry.unpersisted):
+                await self._save_to_redis(thread_id, entry, entry.unpersisted + new_rows, rewrite=is_new)
+            entry.unpersisted = []
+
+            return [dict(message) for message in entry.messages]
+
+    def append(self, thread_id: str, row: Dict[str, Any]):
+        """Append a freshly saved LLM message row to a cached thread.
+
+        Does nothing if the thread is not cached; the next refresh will load it.
+        """
+        entry = self._entries.get(thread_id)
+        if entry is None:
+            return
+        try:
+            entry.unpersisted.extend(self._add_rows(entry, [row]))
+        except Exception as e:
+            logger.warning(f"Failed to append message to cache for thread {thread_id}, invalidating: {str(e)}")
+            self.invalidate(thread_id)
+
+    def invalidate(self, thread_id: str):
+        """Drop a thread from the in-process cache."""
+        self._entries.pop(thread_id, None)
+
+    async def invalidate_async(self, thread_id: str):
+        """Drop a thread from the in-process cache and the Redis tier."""
+        self.invalidate(thread_id)
+        if self.use_redis:
+            try:
+                await redis.delete(self._redis_key(thread_id))
+                await redis.delete(f"{self._redis_key(thread_id)}:fetched_until")
+            except Exception as e:
+                logger.warning(f"Failed to invalidate Redis message cache for thread {thread_id}: {str(e)}")
+
+
+message_cache = ThreadMessageCache(
+    max_threads=config.THREAD_MESSAGE_CACHE_MAX_THREADS,
+    use_redis=config.THREAD_MESSAGE_CACHE_REDIS,
+)
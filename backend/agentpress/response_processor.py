@@ -19,8 +19,10 @@ from utils.logger import logger
 from agentpress.tool import ToolResult
 from agentpress.tool_registry import ToolRegistry
 from agentpress.xml_tool_parser import XMLToolParser
+from agentpress.xml_stream_scanner import XMLStreamScanner
 from langfuse.client import StatefulTraceClient
 from services.langfuse import langfuse
+from services.usage_ledger import usage_ledger, usage_from_response
 from agentpress.utils.json_helpers import (
     ensure_dict, ensure_list, safe_json_parse, 
     to_json_string, format_for_yield
@@ -113,6 +115,11 @@ class ResponseProcessor:
             return format_for_yield(message_obj)
         return None
 
+    async def _record_usage(self, thread_id: str, response: Any):
+        """Add the cost of a saved assistant_response_end to the account's usage ledger."""
+        model, prompt_tokens, completion_tokens = usage_from_response(response)
+        await usage_ledger.record_usage(thread_id, model, prompt_tokens, completion_tokens)
+
     async def _add_message_with_agent_info(
         self,
         thread_id: str,
@@ -161,7 +168,7 @@ class ResponseProcessor:
         """
         accumulated_content = ""
         tool_calls_buffer = {}
-        current_xml_content = ""
+        xml_scanner = XMLStreamScanner(self.tool_registry.get_xml_tag_pattern(), self.tool_registry.xml_tools.keys())
         xml_chunks_buffer = []
         pending_tool_executions = []
         yielded_tool_indices = set() # Stores indices of tools whose *status* has been yielded
@@ -254,7 +261,6 @@ class ResponseProcessor:
                         chunk_content = delta.content
                         # print(chunk_content, end='', flush=True)
                         accumulated_content += chunk_content
-                        current_xml_content += chunk_content
 
                         if not (config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls):
                             # Yield ONLY content chunk (don't save)
@@ -274,9 +280,8 @@ class ResponseProcessor:
 
                         # --- Process XML Tool Calls (if enabled and limit not reached) ---
                         if config.xml_tool_calling and not (config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls):
-                            xml_chunks = self._extract_xml_chunks(current_xml_content)
+                            xml_chunks = xml_scanner.feed(chunk_content)
                             for xml_chunk in xml_chunks:
-                                current_xml_content = current_xml_content.replace(xml_chunk, "", 1)
                                 xml_chunks_buffer.append(xml_chunk)
                                 result = self._parse_xml_tool_call(xml_chunk)
                                 if result:
@@ -558,9 +563,8 @@ class ResponseProcessor:
                  # Gather XML tool calls from buffer (up to limit)
                 parsed_xml_data = []
                 if config.xml_tool_calling:
-                    # Reparse remaining content just in case (should be empty if processed correctly)
-                    xml_chunks = self._extract_xml_chunks(current_xml_content)
-                    xml_chunks_buffer.extend(xml_chunks)
+                    # The stream scanner emits blocks as soon as they close, so
+                    # xml_chunks_buffer already holds every complete block
                     # Process only chunks not already handled in the stream loop
                     remaining_limit = config.max_xml_tool_calls - xml_tool_call_count if config.max_xml_tool_calls > 0 else len(xml_chunks_buffer)
                     xml_chunks_to_process = xml_chunks_buffer[:remaining_limit] # Ensure limit is respected
@@ -737,6 +741,7 @@ class ResponseProcessor:
                             is_llm_message=False,
                             metadata={"thread_run_id": thread_run_id}
                         )
+                        await self._record_usage(thread_id, assistant_end_content)
                         logger.info("Assistant response end saved for stream (before termination)")
                     except Exception as e:
                         logger.error(f"Error saving assistant response end for stream (before termination): {str(e)}")
@@ -789,6 +794,7 @@ class ResponseProcessor:
                         is_llm_message=False,
                         metadata={"thread_run_id": thread_run_id}
                     )
+                    await self._record_usage(thread_id, assistant_end_content)
                     logger.info("Assistant response end saved for stream")
                 except Exception as e:
                     logger.error(f"Error saving assistant response end for stream: {str(e)}")
@@ -992,6 +998,7 @@ class ResponseProcessor:
                         is_llm_message=False,
                         metadata={"thread_run_id": thread_run_id}
                     )
+                    await self._record_usage(thread_id, llm_response)
                     logger.info("Assistant response end saved for non-stream")
                 except Exception as e:
                     logger.error(f"Error saving assistant response end for non-stream: {str(e)}")
@@ -10,12 +10,13 @@ This module provides comprehensive conversation management, including:
 - Context summarization to manage token limits
 """
 
-import json
+import time
 from typing import List, Dict, Any, Optional, Type, Union, AsyncGenerator, Literal, cast
 from services.llm import make_llm_api_call
 from agentpress.tool import Tool
 from agentpress.tool_registry import ToolRegistry
 from agentpress.context_manager import ContextManager
+from agentpress.message_cache import message_cache
 from agentpress.response_processor import (
     ResponseProcessor,
     ProcessorConfig
@@ -25,7 +26,6 @@ from utils.logger import logger
 from langfuse.client import StatefulGenerationClient, StatefulTraceClient
 from services.langfuse import langfuse
 import datetime
-from litellm.utils import token_counter
 
 # Type alias for tool choice
 ToolChoice = Literal["auto", "required", "none"]
@@ -117,6 +117,8 @@ class ThreadManager:
             logger.info(f"Successfully added message to thread {thread_id}")
 
             if result.data and len(result.data) > 0 and isinstance(result.data[0], dict) and 'message_id' in result.data[0]:
+                if is_llm_message:
+                    message_cache.append(thread_id, result.data[0])
                 return result.data[0]
             else:
                 logger.error(f"Insert operation failed or did not return expected data structure for thread {thread_id}. Result data: {result.data}")
@@ -128,8 +130,8 @@ class ThreadManager:
     async def get_llm_messages(self, thread_id: str) -> List[Dict[str, Any]]:
         """Get all messages for a thread.
 
-        This method uses the SQL function which handles context truncation
-        by considering summary messages.
+        Messages are served from the per-thread message cache; only rows
+        created after the last cached message are fetched from the database.
 
         Args:
             thread_id: The ID of the thread to get messages for.
@@ -140,16 +142,17 @@ class ThreadManager:
         logger.debug(f"Getting messages for thread {thread_id}")
         client = await self.db.client
 
-        try:
-            # result = await client.rpc('get_llm_formatted_messages', {'p_thread_id': thread_id}).execute()
-            
+        async def fetch_rows(since: Optional[str]) -> List[Dict[str, Any]]:
             # Fetch messages in batches of 1000 to avoid overloading the database
             all_messages = []
             batch_size = 1000
             offset = 0
             
             while True:
-                result = await client.table('messages').select('message_id, content').eq('thread_id', thread_id).eq('is_llm_message', True).order('created_at').range(offset, offset + batch_size - 1).execute()
+                query = client.table('messages').select('message_id, content, created_at').eq('thread_id', thread_id).eq('is_llm_message', True)
+                if since:
+                    query = query.gte('created_at', since)
+                result = await query.order('created_at').range(offset, offset + batch_size - 1).execute()
                 
                 if not result.data or len(result.data) == 0:
                     break
@@ -161,33 +164,15 @@ class ThreadManager:
                     break
                     
                 offset += batch_size
-            
-            # Use all_messages instead of result.data in the rest of the method
-            result_data = all_messages
 
-            # Parse the returned data which might be stringified JSON
-            if not result_data:
-                return []
+            return all_messages
 
-            # Return properly parsed JSON objects
-            messages = []
-            for item in result_data:
-                if isinstance(item['content'], str):
-                    try:
-                        parsed_item = json.loads(item['content'])
-                        parsed_item['message_id'] = item['message_id']
-                        messages.append(parsed_item)
-                    except json.JSONDecodeError:
-                        logger.error(f"Failed to parse message: {item['content']}")
-                else:
-                    content = item['content']
-                    content['message_id'] = item['message_id']
-                    messages.append(content)
-
-            return messages
+        try:
+            return await message_cache.refresh(thread_id, fetch_rows)
 
         except Exception as e:
             logger.error(f"Failed to get messages for thread {thread_id}: {str(e)}", exc_info=True)
+            await message_cache.invalidate_async(thread_id)
             return []
 
     async def run_thread(
@@ -312,7 +297,7 @@ Here are the XML tools available with examples:
                 token_count = 0
                 try:
                     # Use the potentially modified working_system_prompt for token counting
-                    token_count = token_counter(model=llm_model, messages=[working_system_prompt] + messages)
+                    token_count = self.context_manager.count_tokens([working_system_prompt] + messages, llm_model)
                     token_threshold = self.context_manager.token_threshold
                     logger.info(f"Thread {thread_id} token count: {token_count}/{token_threshold} ({(token_count/token_threshold)*100:.1f}%)")
 
@@ -348,7 +333,9 @@ Here are the XML tools available with examples:
                     openapi_tool_schemas = self.tool_registry.get_openapi_schemas()
                     logger.debug(f"Retrieved {len(openapi_tool_schemas) if openapi_tool_schemas else 0} OpenAPI tool schemas")
 
+                compression_start = time.monotonic()
                 prepared_messages = self.context_manager.compress_messages(prepared_messages, llm_model)
+                logger.info(f"Context compression ({self.context_manager.compression_strategy}) took {(time.monotonic() - compression_start) * 1000:.1f}ms")
 
                 # 5. Make LLM API call
                 logger.debug("Making LLM API call")
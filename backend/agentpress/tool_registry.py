@@ -1,5 +1,6 @@
-from typing import Dict, Type, Any, List, Optional, Callable
+from typing import Dict, Type, Any, List, Optional, Callable, Pattern
 from agentpress.tool import Tool, SchemaType
+from agentpress.xml_stream_scanner import build_xml_tag_pattern
 from utils.logger import logger
 
 
@@ -19,12 +20,14 @@ class ToolRegistry:
         get_xml_tool: Get a tool by XML tag name
         get_openapi_schemas: Get OpenAPI schemas for function calling
         get_xml_examples: Get examples of XML tool usage
+        get_xml_tag_pattern: Get the precompiled matcher for XML tool openings
     """
     
     def __init__(self):
         """Initialize a new ToolRegistry instance."""
         self.tools = {}
         self.xml_tools = {}
+        self._xml_tag_pattern: Optional[Pattern[str]] = None
         logger.debug("Initialized new ToolRegistry instance")
     
     def register_tool(self, tool_class: Type[Tool], function_names: Optional[List[str]] = None, **kwargs):
@@ -66,6 +69,7 @@ class ToolRegistry:
                             "schema": schema
                         }
                         registered_xml += 1
+                        self._xml_tag_pattern = None
                         logger.debug(f"Registered XML tag {schema.xml_schema.tag_name} -> {func_name} from {tool_class.__name__}")
         
         logger.debug(f"Tool registration complete for {tool_class.__name__}: {registered_openapi} OpenAPI functions, {registered_xml} XML tags")
@@ -150,3 +154,16 @@ class ToolRegistry:
                 examples[schema.xml_schema.tag_name] = schema.xml_schema.example
         logger.debug(f"Retrieved {len(examples)} XML examples")
         return examples
+
+    def get_xml_tag_pattern(self) -> Pattern[str]:
+        """Get a single precompiled matcher for all XML tool block openings.
+        
+        Built once and reused until another XML tag is registered.
+        
+        Returns:
+            Compiled pattern matching <function_calls> or any registered tag
+        """
+        if self._xml_tag_pattern is None:
+            self._xml_tag_pattern = build_xml_tag_pattern(self.xml_tools.keys())
+            logger.debug(f"Compiled XML tag pattern for {len(self.xml_tools)} tags")
+        return self._xml_tag_pattern
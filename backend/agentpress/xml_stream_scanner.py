@@ -0,0 +1,226 @@
+"""
+Incremental XML tool call scanner for streaming responses.
+
+Instead of re-scanning the whole accumulated response on every content delta,
+the scanner keeps a cursor and a small state machine across deltas and emits
+complete ``<function_calls>`` blocks (or legacy ``<tag>...</tag>`` tool blocks)
+the moment their closing tag arrives. Text that can no longer be part of a
+tool block is discarded, so memory stays bounded by the size of the block
+currently being received.
+"""
+
+import re
+from typing import Dict, List, Optional, Pattern, Tuple
+
+FUNCTION_CALLS_TAG = "function_calls"
+FUNCTION_CALLS_START = "<function_calls>"
+FUNCTION_CALLS_END = "</function_calls>"
+
+
+class XMLStreamScanner:
+    """Stateful scanner that extracts complete XML tool blocks from a stream.
+
+    Usage:
+        scanner = XMLStreamScanner(tool_registry.get_xml_tag_pattern(), tool_registry.xml_tools.keys())
+        for delta in deltas:
+            for xml_chunk in scanner.feed(delta):
+                ...
+
+    Once a ``<function_calls>`` block has been emitted, legacy tag detection is
+    disabled for the rest of the stream, mirroring the precedence used by
+    ``ResponseProcessor._extract_xml_chunks``.
+    """
+
+    def __init__(self, start_pattern: Pattern[str], legacy_tags=()):
+        """
+        Args:
+            start_pattern: Precompiled matcher for the opening of any tool block,
+                as returned by ``ToolRegistry.get_xml_tag_pattern``. Group 1 is
+                the tag name.
+            legacy_tags: Registered legacy XML tag names, used to size the
+                look-behind window for partially received opening tags.
+        """
+        self._start_pattern = start_pattern
+        self._buffer = ""
+        self._cursor = 0
+        # State: None while searching, otherwise the tag of the open block
+        self._current_tag: Optional[str] = None
+        self._block_start = 0
+        self._depth = 0
+        # Where to resume looking for <function_calls> inside an open legacy block
+        self._function_calls_scan = 0
+        self._legacy_enabled = True
+        self._nesting_patterns: Dict[str, Tuple[Pattern[str], str]] = {}
+        self._max_open_len = max(
+            [len(FUNCTION_CALLS_TAG)] + [len(tag) for tag in legacy_tags]
+        ) + 2
+
+    @property
+    def pending(self) -> str:
+        """Text retained because it may still belong to an unfinished block."""
+        return self._buffer
+
+    def feed(self, delta: str) -> List[str]:
+        """Consume a content delta and return the tool blocks it completed."""
+        if not delta:
+            return []
+        self._buffer += delta
+        chunks = []
+        while True:
+            if self._current_tag is None:
+                if not self._find_block_start():
+                    break
+            chunk = self._find_block_end()
+            if chunk is None:
+                break
+            chunks.append(chunk)
+        self._compact()
+        return chunks
+
+    def _find_block_start(self) -> bool:
+        """Advance the cursor to the next opening tag; return True if found."""
+        pos = self._cursor
+        while True:
+            match = self._start_pattern.search(self._buffer, pos)
+            if not match:
+                break
+            tag = match.group(1)
+            if tag == FUNCTION_CALLS_TAG or self._legacy_enabled:
+                self._current_tag = tag
+                self._block_start = match.start()
+                self._depth = 0
+                self._cursor = match.end()
+                self._function_calls_scan = self._cursor
+                return True
+            pos = match.end()
+
+        # Hold back a possible partially received opening tag at the end
+        tail_start = max(self._cursor, len(self._buffer) - self._max_open_len)
+        last_lt = self._buffer.rfind("<", tail_start)
+        self._cursor = last_lt if last_lt != -1 else len(self._buffer)
+        return False
+
+    def _find_block_end(self) -> Optional[str]:
+        """Look for the close of the open block; return it once complete."""
+        tag = self._current_tag
+        if tag == FUNCTION_CALLS_TAG:
+            end_pos = self._buffer.find(FUNCTION_CALLS_END, self._cursor)
+            if end_pos == -1:
+                self._cursor = max(self._cursor, len(self._buffer) - len(FUNCTION_CALLS_END) + 1)
+                return None
+            self._legacy_enabled = False
+            return self._emit(end_pos + len(FUNCTION_CALLS_END))
+
+        # <function_calls> takes precedence over a legacy block that hasn't closed
+        # before it, e.g. a legacy tag mentioned in prose
+        function_calls_pos = self._buffer.find(FUNCTION_CALLS_START, self._function_calls_scan)
+        if function_calls_pos == -1:
+            self._function_calls_scan = max(self._function_calls_scan, len(self._buffer) - len(FUNCTION_CALLS_START) + 1)
+
+        nesting_pattern, end_tag = self._get_nesting_pattern(tag)
+        pos = self._cursor
+        while True:
+            match = nesting_pattern.search(self._buffer, pos, function_calls_pos if function_calls_pos != -1 else len(self._buffer))
+            if not match:
+                break
+            if match.group(0) == end_tag:
+                if self._depth == 0:
+                    return self._emit(match.end())
+                self._depth -= 1
+            else:
+                self._depth += 1
+            pos = match.end()
+
+        if function_calls_pos != -1:
+            self._current_tag = FUNCTION_CALLS_TAG
+            self._block_start = function_calls_pos
+            self._depth = 0
+            self._cursor = function_calls_pos + len(FUNCTION_CALLS_START)
+            return self._find_block_end()
+
+        # Re-scan the tail next time in case a tag was split across deltas
+        self._cursor = max(pos, len(self._buffer) - len(end_tag) + 1)
+        return None
+
+    def _emit(self, chunk_end: int) -> str:
+        chunk = self._buffer[self._block_start:chunk_end]
+        self._current_tag = None
+        self._cursor = chunk_end
+        return chunk
+
+    def _compact(self):
+        """Drop text that can no longer be part of a tool block."""
+        keep_from = self._block_start if self._current_tag is not None else self._cursor
+        if keep_from > 0:
+            self._buffer = self._buffer[keep_from:]
+            self._cursor -= keep_from
+            self._block_start = max(0, self._block_start - keep_from)
+            self._function_calls_scan = max(0, self._function_calls_scan - keep_from)
+
+    def _get_nesting_pattern(self, tag: str) -> Tuple[Pattern[str], str]:
+        cached = self._nesting_patterns.get(tag)
+        if cached is None:
+            end_tag = f"</{tag}>"
+            pattern = re.compile(rf"<{re.escape(tag)}(?=[\s/>])|{re.escape(end_tag)}")
+            cached = (pattern, end_tag)
+            self._nesting_patterns[tag] = cached
+        return cached
+
+
+def build_xml_tag_pattern(tag_names) -> Pattern[str]:
+    """Build a single matcher for ``<function_calls>`` and all legacy tool tags."""
+    alternatives = [re.escape(FUNCTION_CALLS_TAG) + "(?=>)"]
+    # Longest first so that e.g. "create-file" wins over "create"
+    for tag in sorted(set(tag_names), key=len, reverse=True):
+        if tag != FUNCTION_CALLS_TAG:
+            alternatives.append(re.escape(tag) + r"(?=[\s/>])")
+    return re.compile("<(" + "|".join(alternatives) + ")")
+
+
+if __name__ == "__main__":
+    # Benchmark: replay a recorded response chunk by chunk.
+    #   python -m agentpress.xml_stream_scanner [recorded_response.txt] [chunk_size]
+    import sys
+    import time
+
+    tags = ["create-file", "full-file-rewrite", "str-replace", "execute-command", "ask", "complete",
+            "web-search", "scrape-webpage", "browser-navigate-to", "see-image", "expose-port"]
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            recorded = f.read()
+    else:
+        file_body = "\n".join(f"<div class=\"row-{i}\">line {i} &lt;b&gt;</div>" for i in range(150))
+        block = (
+            "Writing the next file now.\n<function_calls>\n<invoke name=\"create_file\">\n"
+            "<parameter name=\"file_path\">src/index.html</parameter>\n"
+            f"<parameter name=\"file_contents\">{file_body}</parameter>\n</invoke>\n</function_calls>\n"
+        )
+        recorded = block * max(1, 200_000 // len(block))
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    deltas = [recorded[i:i + chunk_size] for i in range(0, len(recorded), chunk_size)]
+
+    def rescan_baseline() -> int:
+        # Previous behaviour: search the whole accumulated buffer on every delta
+        content, found = "", 0
+        for delta in deltas:
+            content += delta
+            start = content.find("<function_calls>")
+            end = content.find(FUNCTION_CALLS_END, start) if start != -1 else -1
+            if end == -1:
+                # No complete block: the legacy fallback scans every tag from 0
+                for tag in tags:
+                    content.find(f"<{tag}")
+                continue
+            content = content[end + len(FUNCTION_CALLS_END):]
+            found += 1
+        return found
+
+    def incremental() -> int:
+        scanner = XMLStreamScanner(build_xml_tag_pattern(tags), tags)
+        return sum(len(scanner.feed(delta)) for delta in deltas)
+
+    for name, fn in (("rescan", rescan_baseline), ("incremental", incremental)):
+        started = time.perf_counter()
+        blocks = fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"{name:12s} {len(recorded) / 1024:.0f} KB in {len(deltas)} deltas -> {blocks} blocks, {elapsed:.1f} ms")
@@ -25,6 +25,8 @@ from agent import workflows as workflows_api
 from sandbox import api as sandbox_api
 from services import billing as billing_api
 from flags import api as feature_flags_api
+from flags import get_flag_manager
+from services.http_clients import http_clients
 from services import transcription as transcription_api
 import sys
 from services import email_api
@@ -76,6 +78,14 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.error(f"Failed to initialize Redis connection: {e}")
             # Continue without Redis - the application will handle Redis failures gracefully
+
+        await http_clients.initialize()
+        
+        # Load the feature flag snapshot so flag checks don't wait on Redis
+        try:
+            await get_flag_manager().load_snapshot()
+        except Exception as e:
+            logger.warning(f"Failed to preload feature flags: {e}")
         
         # Start background tasks
         # asyncio.create_task(agent_api.restore_running_agent_runs())
@@ -95,6 +105,9 @@ async def lifespan(app: FastAPI):
         logger.info("Cleaning up agent resources")
         await agent_api.cleanup()
         
+        await get_flag_manager().close()
+        await http_clients.close()
+        
         # Clean up Redis connection
         try:
             logger.info("Closing Redis connection")
@@ -203,7 +216,8 @@ async def health_check():
     return {
         "status": "ok", 
         "timestamp": datetime.now(timezone.utc).isoformat(),
-        "instance_id": instance_id
+        "instance_id": instance_id,
+        "http_clients": http_clients.stats()
     }
 
 @api_router.get("/health-docker")
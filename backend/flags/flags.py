@@ -1,6 +1,8 @@
+import asyncio
 import json
 import logging
 import os
+import time
 from datetime import datetime
 from typing import Dict, List, Optional
 import sys
@@ -19,11 +21,133 @@ except ImportError:
     OVERRIDE_ACTIVE = False
     logger.info("Feature flags override not found - using normal flag system")
 
+# Seconds a flag snapshot is trusted without a reload, in case a change
+# notification was missed while the subscription was down
+SNAPSHOT_TTL = 30
+RECONNECT_DELAY = 1.0  # seconds, doubled up to RECONNECT_MAX_DELAY
+RECONNECT_MAX_DELAY = 30.0
+# Reads on the changes subscription wait at most this long, well below the
+# pool's socket timeout, so a silent channel isn't mistaken for a dead one
+POLL_TIMEOUT = 1.0  # seconds
+
+
 class FeatureFlagManager:
-    def __init__(self):
+    """Feature flags stored in Redis, served from an in-process snapshot.
+
+    The snapshot holds every flag and is loaded with one SMEMBERS and a
+    pipelined HGETALL. set_flag/delete_flag publish the changed key and every
+    process reloads just that flag, so checks are dict lookups that see
+    changes within milliseconds. Snapshots older than SNAPSHOT_TTL are
+    reloaded in full.
+    """
+
+    def __init__(self, snapshot_ttl: float = SNAPSHOT_TTL):
         """Initialize with existing Redis service"""
         self.flag_prefix = "feature_flag:"
         self.flag_list_key = "feature_flags:list"
+        self.changes_channel = "feature_flags:changes"
+        self.snapshot_ttl = snapshot_ttl
+        self._snapshot: Optional[Dict[str, Dict[str, str]]] = None
+        self._loaded_at = 0.0
+        self._load_lock: Optional[asyncio.Lock] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def load_snapshot(self) -> Dict[str, Dict[str, str]]:
+        """Load all flags from Redis into the local snapshot."""
+        redis_client = await redis.get_client()
+        flag_keys = sorted(await redis_client.smembers(self.flag_list_key))
+        pipe = redis_client.pipeline(transaction=False)
+        for key in flag_keys:
+            pipe.hgetall(f"{self.flag_prefix}{key}")
+        results = await pipe.execute() if flag_keys else []
+        self._snapshot = {key: data for key, data in zip(flag_keys, results) if data}
+        self._loaded_at = time.monotonic()
+        logger.debug(f"Loaded {len(self._snapshot)} feature flags")
+        return self._snapshot
+
+    async def _get_snapshot(self) -> Dict[str, Dict[str, str]]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Tasks and locks belong to one event loop; start over on a new one
+            self._loop = loop
+            self._load_lock = asyncio.Lock()
+            self._listener = None
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+        if self._snapshot is None or time.monotonic() - self._loaded_at > self.snapshot_ttl:
+            async with self._load_lock:
+                if self._snapshot is None or time.monotonic() - self._loaded_at > self.snapshot_ttl:
+                    try:
+                        await self.load_snapshot()
+                    except Exception:
+                        if self._snapshot is None:
+                            raise
+                        # Keep serving the last snapshot; retry once the TTL passes again
+                        self._loaded_at = time.monotonic()
+                        logger.warning("Failed to reload feature flags, using the previous snapshot", exc_info=True)
+        return self._snapshot
+
+    async def _reload_flag(self, key: str):
+        redis_client = await redis.get_client()
+        flag_data = await redis_client.hgetall(f"{self.flag_prefix}{key}")
+        if self._snapshot is None:
+            return
+        if flag_data:
+            self._snapshot[key] = flag_data
+        else:
+            self._snapshot.pop(key, None)
+        logger.debug(f"Reloaded feature flag {key}")
+
+    async def _listen(self):
+        delay = RECONNECT_DELAY
+        while True:
+            pubsub = None
+            try:
+                pubsub = await redis.create_pubsub()
+                await pubsub.subscribe(self.changes_channel)
+                if self._snapshot is not None:
+                    # Changes may have been missed while unsubscribed
+                    await self.load_snapshot()
+                delay = RECONNECT_DELAY
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=POLL_TIMEOUT)
+                    if not message or message.get("type") != "message":
+                        continue
+                    data = message.get("data")
+                    if isinstance(data, bytes): data = data.decode('utf-8')
+                    await self._reload_flag(data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Feature flag listener failed, reconnecting in {delay:.0f}s: {e}")
+            finally:
+                if pubsub:
+                    try:
+                        await pubsub.unsubscribe(self.changes_channel)
+                        await pubsub.close()
+                    except Exception as e:
+                        logger.warning(f"Error closing feature flag pubsub: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def close(self):
+        """Stop listening for flag changes."""
+        listener = self._listener
+        self._listener = None
+        if listener and not listener.done():
+            listener.cancel()
+            try:
+                await listener
+            except asyncio.CancelledError:
+                pass
+
+    async def _publish_change(self, key: str):
+        try:
+            await redis.publish(self.changes_channel, key)
+        except Exception as e:
+            logger.warning(f"Failed to publish change of feature flag {key}: {e}")
     
     async def set_flag(self, key: str, enabled: bool, description: str = "") -> bool:
         """Set a feature flag to enabled or disabled"""
@@ -39,6 +163,9 @@ class FeatureFlagManager:
             redis_client = await redis.get_client()
             await redis_client.hset(flag_key, mapping=flag_data)
             await redis_client.sadd(self.flag_list_key, key)
+            if self._snapshot is not None:
+                self._snapshot[key] = flag_data
+            await self._publish_change(key)
             
             logger.info(f"Set feature flag {key} to {enabled}")
             return True
@@ -53,10 +180,8 @@ class FeatureFlagManager:
             return await is_enabled_override(key)
             
         try:
-            flag_key = f"{self.flag_prefix}{key}"
-            redis_client = await redis.get_client()
-            enabled = await redis_client.hget(flag_key, 'enabled')
-            return enabled == 'true' if enabled else False
+            snapshot = await self._get_snapshot()
+            return snapshot.get(key, {}).get('enabled') == 'true'
         except Exception as e:
             logger.error(f"Failed to check feature flag {key}: {e}")
             # Return True by default if Redis is unavailable and override is not active
@@ -81,6 +206,9 @@ class FeatureFlagManager:
             deleted = await redis_client.delete(flag_key)
             if deleted:
                 await redis_client.srem(self.flag_list_key, key)
+                if self._snapshot is not None:
+                    self._snapshot.pop(key, None)
+                await self._publish_change(key)
                 logger.info(f"Deleted feature flag: {key}")
                 return True
             return False
@@ -90,15 +218,17 @@ class FeatureFlagManager:
     
     async def list_flags(self) -> Dict[str, bool]:
         """List all feature flags with their status"""
+        if OVERRIDE_ACTIVE:
+            try:
+                redis_client = await redis.get_client()
+                return {key: await is_enabled_override(key) for key in await redis_client.smembers(self.flag_list_key)}
+            except Exception as e:
+                logger.error(f"Failed to list feature flags: {e}")
+                return {}
+
         try:
-            redis_client = await redis.get_client()
-            flag_keys = await redis_client.smembers(self.flag_list_key)
-            flags = {}
-            
-            for key in flag_keys:
-                flags[key] = await self.is_enabled(key)
-            
-            return flags
+            snapshot = await self._get_snapshot()
+            return {key: data.get('enabled') == 'true' for key, data in snapshot.items()}
         except Exception as e:
             logger.error(f"Failed to list feature flags: {e}")
             return {}
@@ -106,16 +236,7 @@ class FeatureFlagManager:
     async def get_all_flags_details(self) -> Dict[str, Dict[str, str]]:
         """Get all feature flags with detailed information"""
         try:
-            redis_client = await redis.get_client()
-            flag_keys = await redis_client.smembers(self.flag_list_key)
-            flags = {}
-            
-            for key in flag_keys:
-                flag_data = await self.get_flag(key)
-                if flag_data:
-                    flags[key] = flag_data
-            
-            return flags
+            return {key: dict(data) for key, data in (await self.load_snapshot()).items()}
         except Exception as e:
             logger.error(f"Failed to get all flags details: {e}")
             return {}
@@ -1,20 +1,10 @@
 import asyncio
 import json
 import base64
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional
 from dataclasses import dataclass
 
 from mcp import ClientSession
-try:
-    from mcp.client.streamable_http import streamablehttp_client
-except ImportError:
-    try:
-        from mcp.client import streamablehttp_client
-    except ImportError:
-        raise ImportError(
-            "Could not import streamablehttp_client. "
-            "Make sure you have installed mcp with: pip install 'mcp[cli]'"
-        )
 
 try:
     from mcp.types import Tool, CallToolResult as ToolResult
@@ -29,6 +19,9 @@ except ImportError:
 
 from utils.logger import logger
 from .mcp_providers import MCPProviderFactory, SmitheryProvider, PipedreamProvider
+from .session_pool import MCPSessionPool, TRANSPORT_HTTP
+from .discovery import discover_servers
+from .tool_cache import mcp_tool_cache, tool_to_dict
 import os
 
 SMITHERY_API_KEY = os.getenv("SMITHERY_API_KEY")
@@ -46,9 +39,10 @@ class MCPConnection:
     external_user_id: Optional[str] = None
     
 class MCPManager:
-    def __init__(self):
+    def __init__(self, session_pool: Optional[MCPSessionPool] = None):
         self.connections: Dict[str, MCPConnection] = {}
-        self._sessions: Dict[str, Tuple[Any, Any, Any]] = {}  # Store streams for cleanup
+        self.session_pool = session_pool or MCPSessionPool()
+        self.discovery_timings: List[Dict[str, Any]] = []
         
     async def connect_server(self, mcp_config: Dict[str, Any], external_user_id: Optional[str] = None) -> MCPConnection:
         qualified_name = mcp_config["qualifiedName"]
@@ -68,20 +62,29 @@ class MCPManager:
             provider = MCPProviderFactory.create_provider(provider_type)
             url = provider.get_server_url(qualified_name, mcp_config.get("config", {}))
             
-            if provider_type == "pipedream":
-                if not external_user_id:
-                    raise ValueError("external_user_id is required for Pipedream MCP connections")
-                headers = await provider.get_headers_async(qualified_name, mcp_config.get("config", {}), external_user_id)
-            else:
-                headers = provider.get_headers(qualified_name, mcp_config.get("config", {}), external_user_id)
+            if provider_type == "pipedream" and not external_user_id:
+                raise ValueError("external_user_id is required for Pipedream MCP connections")
             
-            async with streamablehttp_client(url, headers=headers) as (read_stream, write_stream, _):
-                async with ClientSession(read_stream, write_stream) as session:
-                    await session.initialize()
-                    logger.info(f"MCP session initialized for {qualified_name} via {provider_type}")
-                    
-                    tools_result = await session.list_tools()
-                    tools = tools_result.tools if hasattr(tools_result, 'tools') else tools_result
+            async def fetch_tools(session_pool: MCPSessionPool) -> List[Dict[str, Any]]:
+                if provider_type == "pipedream":
+                    headers = await provider.get_headers_async(qualified_name, mcp_config.get("config", {}), external_user_id)
+                else:
+                    headers = provider.get_headers(qualified_name, mcp_config.get("config", {}), external_user_id)
+                
+                # The pooled session stays open for subsequent tool calls
+                tools_result = await session_pool.list_tools(TRANSPORT_HTTP, url, headers=headers)
+                logger.info(f"MCP session initialized for {qualified_name} via {provider_type}")
+                tools = tools_result.tools if hasattr(tools_result, 'tools') else tools_result
+                return [tool_to_dict(tool) for tool in tools]
+            
+            cache_config = {"provider": provider_type, "config": mcp_config.get("config", {}), "external_user_id": external_user_id}
+            tools_info = await mcp_tool_cache.get_or_fetch(
+                qualified_name, cache_config, mcp_config.get("enabledTools", []), fetch_tools, self.session_pool
+            )
+            tools = [
+                Tool(name=tool_info["name"], description=tool_info["description"], inputSchema=tool_info["input_schema"])
+                for tool_info in tools_info
+            ]
             
             logger.info(f"Available tools from {qualified_name}: {[t.name for t in tools]}")
             
@@ -103,12 +106,12 @@ class MCPManager:
             logger.error(f"Failed to connect to MCP server {qualified_name} via {provider_type}: {str(e)}")
             raise
         
-    async def connect_all(self, mcp_configs: List[Dict[str, Any]]) -> None:
-        for config in mcp_configs:
-            try:
-                await self.connect_server(config)
-            except Exception as e:
-                logger.error(f"Failed to connect to {config['qualifiedName']}: {str(e)}")
+    async def connect_all(self, mcp_configs: List[Dict[str, Any]], deadline: float = 30) -> None:
+        """Connect to all servers concurrently; per-server timings end up in discovery_timings."""
+        self.discovery_timings = await discover_servers(
+            [(config['qualifiedName'], self.connect_server(config)) for config in mcp_configs],
+            deadline,
+        )
                 
     def get_all_tools_openapi(self) -> List[Dict[str, Any]]:
         openapi_tools = []
@@ -173,38 +176,35 @@ class MCPManager:
             else:
                 headers = provider.get_headers(qualified_name, conn.config, external_user_id)
             
-            async with streamablehttp_client(url, headers=headers) as (read_stream, write_stream, _):
-                async with ClientSession(read_stream, write_stream) as session:
-                    await session.initialize()
-                    result = await session.call_tool(original_tool_name, arguments)
-                    if hasattr(result, 'content'):
-                        content = result.content
-                        if isinstance(content, list):
-                            text_parts = []
-                            for item in content:
-                                if hasattr(item, 'text'):
-                                    text_parts.append(item.text)
-                                elif hasattr(item, 'content'):
-                                    text_parts.append(str(item.content))
-                                else:
-                                    text_parts.append(str(item))
-                            content_str = "\n".join(text_parts)
-                        elif hasattr(content, 'text'):
-                            content_str = content.text
-                        elif hasattr(content, 'content'):
-                            content_str = str(content.content)
+            result = await self.session_pool.call_tool(TRANSPORT_HTTP, url, original_tool_name, arguments, headers=headers)
+            if hasattr(result, 'content'):
+                content = result.content
+                if isinstance(content, list):
+                    text_parts = []
+                    for item in content:
+                        if hasattr(item, 'text'):
+                            text_parts.append(item.text)
+                        elif hasattr(item, 'content'):
+                            text_parts.append(str(item.content))
                         else:
-                            content_str = str(content)
-                        
-                        is_error = getattr(result, 'isError', False)
-                    else:
-                        content_str = str(result)
-                        is_error = False
-                        
-                return {
-                        "content": content_str,
-                        "isError": is_error
-                }
+                            text_parts.append(str(item))
+                    content_str = "\n".join(text_parts)
+                elif hasattr(content, 'text'):
+                    content_str = content.text
+                elif hasattr(content, 'content'):
+                    content_str = str(content.content)
+                else:
+                    content_str = str(content)
+                
+                is_error = getattr(result, 'isError', False)
+            else:
+                content_str = str(result)
+                is_error = False
+                
+            return {
+                    "content": content_str,
+                    "isError": is_error
+            }
                 
         except Exception as e:
             logger.error(f"Error executing MCP tool {tool_name}: {str(e)}")
@@ -221,7 +221,7 @@ class MCPManager:
             except Exception as e:
                 logger.error(f"Error clearing configuration for {qualified_name}: {str(e)}")
                 
-        self._sessions.clear()
+        await self.session_pool.close()
                 
     def get_tool_info(self, tool_name: str) -> Optional[Dict[str, Any]]:
         parts = tool_name.split("_", 2)
@@ -0,0 +1,59 @@
+"""
+Concurrent MCP server discovery.
+
+Agents can have several MCP servers configured. Connecting to them one after
+another delays the first LLM call by the sum of all handshakes; this helper
+runs them concurrently under a global deadline and records per-server timing.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Dict, List, Tuple
+
+from utils.logger import logger
+
+
+async def discover_servers(jobs: List[Tuple[str, Awaitable[Any]]], deadline: float) -> List[Dict[str, Any]]:
+    """Run discovery jobs concurrently and return their timings.
+
+    Jobs still running when the deadline passes are cancelled; failed or
+    cancelled jobs are reported in the timings and do not affect the others.
+
+    Args:
+        jobs: (server name, awaitable) pairs. Each awaitable should apply its own
+            per-server timeout.
+        deadline: Seconds after which remaining jobs are cancelled.
+
+    Returns:
+        One dict per job: server, status ("connected", "failed" or "timeout"),
+        duration_ms and, for failures, error.
+    """
+    timings: List[Dict[str, Any]] = []
+
+    async def timed(server_name: str, job: Awaitable[Any]):
+        entry = {"server": server_name, "status": "connected"}
+        timings.append(entry)
+        started = time.monotonic()
+        try:
+            await job
+        except asyncio.CancelledError:
+            entry["status"] = "timeout"
+            raise
+        except Exception as e:
+            entry["status"] = "failed"
+            entry["error"] = str(e)
+            logger.error(f"Failed to connect to MCP server {server_name}: {str(e)}")
+        finally:
+            entry["duration_ms"] = round((time.monotonic() - started) * 1000)
+
+    if not jobs:
+        return timings
+
+    tasks = [asyncio.create_task(timed(server_name, job)) for server_name, job in jobs]
+    _, pending = await asyncio.wait(tasks, timeout=deadline)
+    if pending:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        logger.warning(f"MCP discovery deadline of {deadline}s reached, skipped {len(pending)} of {len(tasks)} servers")
+    return timings
@@ -53,27 +53,10 @@ class PipedreamProvider:
         if not external_user_id:
             raise ValueError("external_user_id is required for Pipedream MCP connections")
         
-        access_token = await self.get_access_token()
-        
         from pipedream.client import get_pipedream_client
-        client = get_pipedream_client()
-        await client._ensure_rate_limit_token()
-        
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "x-pd-project-id": self.project_id,
-            "x-pd-environment": self.environment,
-            "x-pd-external-user-id": external_user_id,
-            "x-pd-app-slug": qualified_name,
-        }
-        
-        if client.rate_limit_token:
-            headers["x-pd-rate-limit"] = client.rate_limit_token
-        
-        if config.get('oauth_app_id'):
-            headers["x-pd-oauth-app-id"] = config['oauth_app_id']
-        
-        return headers
+        return await get_pipedream_client().get_mcp_headers(
+            external_user_id, qualified_name, config.get('oauth_app_id')
+        )
     
     def get_headers(self, qualified_name: str, config: Dict[str, Any], external_user_id: Optional[str] = None) -> Dict[str, str]:
         raise NotImplementedError("PipedreamProvider requires async header generation. Use get_headers_async instead.")
@@ -0,0 +1,341 @@
+"""
+Pooled MCP client sessions.
+
+Opening an MCP session costs a transport connect plus the ``initialize``
+handshake, which is often slower than the tool call itself. The pool keeps
+initialized sessions per server (URL or command + headers) alive for the
+lifetime of an agent run: sessions idle for a while are pinged before reuse,
+broken sessions are reconnected, and sessions unused for ``idle_timeout`` are
+closed.
+
+Each session is owned by a dedicated task, because the MCP transports are
+anyio context managers that must be entered and exited in the same task.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+from mcp.shared.exceptions import McpError
+
+from utils.logger import logger
+
+TRANSPORT_HTTP = "http"
+TRANSPORT_SSE = "sse"
+TRANSPORT_STDIO = "stdio"
+
+# target is a URL for http/sse and {"command", "args", "env"} for stdio
+Target = Union[str, Dict[str, Any]]
+
+
+def _is_session_error(error: McpError) -> bool:
+    """Whether an McpError reports a terminated session rather than a failed request."""
+    return "session terminated" in str(error).lower()
+
+
+def session_key(transport: str, target: Target, headers: Optional[Dict[str, str]] = None) -> str:
+    payload = json.dumps({"transport": transport, "target": target, "headers": headers or {}}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class _PooledSession:
+    """An initialized ClientSession kept open by its owner task."""
+
+    def __init__(self, transport: str, target: Target, headers: Optional[Dict[str, str]]):
+        self.transport = transport
+        self.target = target
+        self.headers = headers or {}
+        self.session: Optional[ClientSession] = None
+        self.error: Optional[BaseException] = None
+        self.last_used = time.monotonic()
+        self.in_flight = 0
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    @property
+    def label(self) -> str:
+        if isinstance(self.target, dict):
+            return f"{self.transport}:{self.target.get('command')}"
+        return f"{self.transport}:{self.target}"
+
+    def _open_transport(self):
+        if self.transport == TRANSPORT_HTTP:
+            return streamablehttp_client(self.target, headers=self.headers)
+        if self.transport == TRANSPORT_SSE:
+            try:
+                return sse_client(self.target, headers=self.headers)
+            except TypeError as e:
+                if "unexpected keyword argument" not in str(e):
+                    raise
+                return sse_client(self.target)
+        if self.transport == TRANSPORT_STDIO:
+            return stdio_client(StdioServerParameters(
+                command=self.target["command"],
+                args=self.target.get("args", []),
+                env=self.target.get("env", {})
+            ))
+        raise ValueError(f"Unsupported MCP transport: {self.transport}")
+
+    async def _run(self):
+        try:
+            async with self._open_transport() as streams:
+                async with ClientSession(streams[0], streams[1]) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._closing.wait()
+        except Exception as e:
+            self.error = e
+            if self.session is not None:
+                logger.warning(f"MCP session {self.label} closed unexpectedly: {str(e)}")
+        finally:
+            self.session = None
+            self._ready.set()
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+        await self._ready.wait()
+        if self.session is None:
+            raise self.error or ConnectionError(f"Failed to open MCP session {self.label}")
+
+    async def ping(self) -> bool:
+        try:
+            async with asyncio.timeout(5):
+                await self.session.send_ping()
+            return True
+        except Exception as e:
+            logger.info(f"MCP session {self.label} failed health check: {str(e)}")
+            return False
+
+    async def close(self):
+        self._closing.set()
+        if not self._task or self._task.done():
+            return
+        if self.session is None:
+            # Still connecting, nothing to shut down gracefully
+            self._task.cancel()
+        done, _ = await asyncio.wait({self._task}, timeout=5)
+        if not done:
+            self._task.cancel()
+            await asyncio.wait({self._task}, timeout=1)
+
+
+class MCPSessionPool:
+    """Reuses initialized MCP sessions across tool calls.
+
+    Usage:
+        pool = MCPSessionPool()
+        tools = await pool.list_tools(TRANSPORT_HTTP, url, headers=headers)
+        result = await pool.call_tool(TRANSPORT_HTTP, url, "search", {"query": "..."}, headers=headers)
+        await pool.close()
+    """
+
+    def __init__(self, idle_timeout: float = 300.0, health_check_after: float = 30.0):
+        """
+        Args:
+            idle_timeout: Close sessions unused for this many seconds.
+            health_check_after: Ping sessions idle for longer than this before reuse.
+        """
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self._sessions: Dict[str, _PooledSession] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.connects = 0
+        self.reuses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"sessions": len(self._sessions), "connects": self.connects, "reuses": self.reuses}
+
+    async def _evict_idle(self):
+        now = time.monotonic()
+        idle = [
+            (key, pooled) for key, pooled in self._sessions.items()
+            if pooled.in_flight == 0 and now - pooled.last_used > self.idle_timeout
+        ]
+        for key, pooled in idle:
+            if self._sessions.get(key) is pooled:
+                del self._sessions[key]
+            logger.debug(f"Closing idle MCP session {pooled.label}")
+            await pooled.close()
+
+    async def _discard(self, key: str, pooled: _PooledSession):
+        if self._sessions.get(key) is pooled:
+            del self._sessions[key]
+        await pooled.close()
+
+    async def _acquire(self, transport: str, target: Target, headers: Optional[Dict[str, str]]) -> Tuple[str, _PooledSession, bool]:
+        await self._evict_idle()
+        key = session_key(transport, target, headers)
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            pooled = self._sessions.get(key)
+            if pooled is not None and pooled.alive and time.monotonic() - pooled.last_used > self.health_check_after:
+                if not await pooled.ping():
+                    await self._discard(key, pooled)
+                    pooled = None
+            if pooled is not None and not pooled.alive:
+                await self._discard(key, pooled)
+                pooled = None
+
+            reused = pooled is not None
+            if pooled is None:
+                pooled = _PooledSession(transport, target, headers)
+                try:
+                    await pooled.start()
+                except BaseException:
+                    await pooled.close()
+                    raise
+                self._sessions[key] = pooled
+                self.connects += 1
+                logger.debug(f"Opened MCP session {pooled.label}")
+            else:
+                self.reuses += 1
+            pooled.last_used = time.monotonic()
+            return key, pooled, reused
+
+    async def _request(
+        self,
+        transport: str,
+        target: Target,
+        headers: Optional[Dict[str, str]],
+        timeout: float,
+        operation: Callable[[ClientSession], Awaitable[Any]],
+        description: str,
+    ) -> Any:
+        # A reused session may have been dropped by the server; reconnect once.
+        # Protocol errors from a healthy session are not retried.
+        for attempt in range(2):
+            started = time.monotonic()
+            key, pooled, reused = None, None, False
+            try:
+                async with asyncio.timeout(timeout):
+                    key, pooled, reused = await self._acquire(transport, target, headers)
+                    pooled.in_flight += 1
+                    try:
+                        result = await operation(pooled.session)
+                    finally:
+                        pooled.in_flight -= 1
+                        pooled.last_used = time.monotonic()
+            except TimeoutError:
+                # Unanswered requests usually mean a dead connection; don't reuse it
+                if pooled is not None:
+                    await self._discard(key, pooled)
+                raise
+            except McpError as e:
+                if not _is_session_error(e):
+                    raise
+                failure = e
+            except Exception as e:
+                failure = e
+            else:
+                logger.debug(
+                    f"MCP {description} on {pooled.label} took {(time.monotonic() - started) * 1000:.0f} ms "
+                    f"({'reused' if reused else 'new'} session)"
+                )
+                return result
+
+            if pooled is None:
+                raise failure
+            await self._discard(key, pooled)
+            if reused and attempt == 0:
+                logger.warning(f"MCP session {pooled.label} failed during {description}, reconnecting: {str(failure)}")
+                continue
+            raise failure
+
+    async def get_session(self, transport: str, target: Target, headers: Optional[Dict[str, str]] = None) -> ClientSession:
+        """Return an initialized session for the server, opening one if needed."""
+        _, pooled, _ = await self._acquire(transport, target, headers)
+        return pooled.session
+
+    async def list_tools(self, transport: str, target: Target, headers: Optional[Dict[str, str]] = None, timeout: float = 15):
+        return await self._request(
+            transport, target, headers, timeout,
+            lambda session: session.list_tools(),
+            "list_tools",
+        )
+
+    async def call_tool(
+        self,
+        transport: str,
+        target: Target,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 30,
+    ):
+        return await self._request(
+            transport, target, headers, timeout,
+            lambda session: session.call_tool(tool_name, arguments),
+            f"call_tool {tool_name}",
+        )
+
+    async def close(self):
+        """Close all pooled sessions."""
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        self._locks.clear()
+        for pooled in sessions:
+            try:
+                await pooled.close()
+            except Exception as e:
+                logger.warning(f"Error closing MCP session {pooled.label}: {str(e)}")
+        if sessions:
+            logger.info(f"Closed {len(sessions)} pooled MCP sessions ({self.connects} connects, {self.reuses} reuses)")
+
+
+if __name__ == "__main__":
+    # Per-call latency with and without pooling against a local stub server:
+    #   python -m mcp_service.session_pool stub [port]
+    #   python -m mcp_service.session_pool bench [url] [calls]
+    import statistics
+    import sys
+
+    def run_stub(port: int):
+        from mcp.server.fastmcp import FastMCP
+
+        stub = FastMCP("stub", port=port)
+
+        @stub.tool()
+        def echo(text: str) -> str:
+            return text
+
+        stub.run(transport="streamable-http")
+
+    async def bench(url: str, calls: int):
+        async def unpooled_call():
+            async with streamablehttp_client(url) as (read_stream, write_stream, _):
+                async with ClientSession(read_stream, write_stream) as session:
+                    await session.initialize()
+                    return await session.call_tool("echo", {"text": "ping"})
+
+        pool = MCPSessionPool()
+
+        async def pooled_call():
+            return await pool.call_tool(TRANSPORT_HTTP, url, "echo", {"text": "ping"})
+
+        for name, call in (("new session", unpooled_call), ("pooled", pooled_call)):
+            timings = []
+            for _ in range(calls):
+                started = time.perf_counter()
+                await call()
+                timings.append((time.perf_counter() - started) * 1000)
+            print(f"{name:12s} mean {statistics.mean(timings):7.1f} ms  p50 {statistics.median(timings):7.1f} ms  max {max(timings):7.1f} ms")
+        print(f"pool: {pool.stats()}")
+        await pool.close()
+
+    mode = sys.argv[1] if len(sys.argv) > 1 else "bench"
+    if mode == "stub":
+        run_stub(int(sys.argv[2]) if len(sys.argv) > 2 else 8765)
+    else:
+        bench_url = sys.argv[2] if len(sys.argv) > 2 else "http://127.0.0.1:8765/mcp"
+        asyncio.run(bench(bench_url, int(sys.argv[3]) if len(sys.argv) > 3 else 50))
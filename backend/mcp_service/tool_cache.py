@@ -0,0 +1,147 @@
+"""
+Cross-run cache of discovered MCP tool lists.
+
+An agent's MCP tool lists rarely change between runs, yet every run used to
+call ``list_tools`` on every configured server. Tool lists are cached in
+Redis per server, keyed by qualifiedName + a hash of the server config +
+enabledTools. Fresh entries are used as is; stale entries are still served
+while a background task re-discovers the server (stale-while-revalidate),
+so warm runs skip network discovery entirely.
+
+Only tool names, descriptions and input schemas are stored; the config that
+goes into the key is hashed, never stored. The ToolSchemas built from them by
+DynamicToolBuilder are not cached: building one is a dict copy without I/O,
+and each is attached to a method bound to the run's own tool wrapper.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+from .session_pool import MCPSessionPool
+
+REDIS_CACHE_TTL = 3600 * 24  # Entries older than this are rediscovered before use
+REFRESH_LOCK_TTL = 60
+
+# Receives the session pool to discover with and returns
+# [{"name", "description", "input_schema"}, ...]
+FetchTools = Callable[[MCPSessionPool], Awaitable[List[Dict[str, Any]]]]
+
+
+def tool_to_dict(tool) -> Dict[str, Any]:
+    return {
+        "name": tool.name,
+        "description": tool.description,
+        "input_schema": tool.inputSchema,
+    }
+
+
+def cache_key(qualified_name: str, server_config: Dict[str, Any], enabled_tools: Optional[List[str]]) -> str:
+    config_hash = hashlib.sha256(
+        json.dumps(server_config or {}, sort_keys=True, default=str).encode()
+    ).hexdigest()[:16]
+    tools_hash = hashlib.sha256(
+        json.dumps(sorted(enabled_tools or [])).encode()
+    ).hexdigest()[:8]
+    return f"mcp_tools:{qualified_name}:{config_hash}:{tools_hash}"
+
+
+class MCPToolCache:
+    """Redis-backed stale-while-revalidate cache of MCP tool lists.
+
+    Usage:
+        tools = await mcp_tool_cache.get_or_fetch(qualified_name, server_config, enabled_tools, fetch, session_pool)
+    """
+
+    def __init__(self, enabled: bool = True, fresh_for: int = 3600):
+        """
+        Args:
+            enabled: When False every call goes straight to fetch.
+            fresh_for: Seconds an entry is served without a background refresh.
+        """
+        self.enabled = enabled
+        self.fresh_for = fresh_for
+        self._refreshes: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    async def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = await redis.get(key)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning(f"Failed to read MCP tool cache entry {key}: {str(e)}")
+            return None
+
+    async def _store(self, key: str, tools: List[Dict[str, Any]]):
+        if not tools:
+            # Don't pin an empty list from a flaky server
+            return
+        try:
+            await redis.set(key, json.dumps({"tools": tools, "cached_at": time.time()}), ex=REDIS_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to write MCP tool cache entry {key}: {str(e)}")
+
+    async def _refresh(self, key: str, fetch: FetchTools):
+        pool = MCPSessionPool()
+        try:
+            # Only one worker refreshes a given entry at a time
+            if not await redis.set(f"{key}:refreshing", "1", ex=REFRESH_LOCK_TTL, nx=True):
+                return
+            tools = await fetch(pool)
+            await self._store(key, tools)
+            logger.debug(f"Refreshed MCP tool cache entry {key} ({len(tools)} tools)")
+        except Exception as e:
+            logger.warning(f"Background refresh of MCP tool cache entry {key} failed: {str(e)}")
+        finally:
+            await pool.close()
+
+    async def get_or_fetch(
+        self,
+        qualified_name: str,
+        server_config: Dict[str, Any],
+        enabled_tools: Optional[List[str]],
+        fetch: FetchTools,
+        session_pool: MCPSessionPool,
+    ) -> List[Dict[str, Any]]:
+        """Return the server's tool list from the cache, discovering it on a miss.
+
+        Args:
+            fetch: Discovers the tools with the given pool. Misses use
+                session_pool so the session is reused by later tool calls;
+                background refreshes use a short-lived pool of their own.
+        """
+        if not self.enabled:
+            return await fetch(session_pool)
+
+        key = cache_key(qualified_name, server_config, enabled_tools)
+        entry = await self._load(key)
+        if entry is not None:
+            age = time.time() - entry.get("cached_at", 0)
+            if age <= self.fresh_for:
+                self.hits += 1
+                logger.debug(f"MCP tool cache hit for {qualified_name} ({len(entry['tools'])} tools)")
+            else:
+                self.stale_hits += 1
+                logger.debug(f"MCP tool cache entry for {qualified_name} is {age:.0f}s old, refreshing in background")
+                task = asyncio.create_task(self._refresh(key, fetch))
+                self._refreshes.add(task)
+                task.add_done_callback(self._refreshes.discard)
+            return entry["tools"]
+
+        self.misses += 1
+        tools = await fetch(session_pool)
+        await self._store(key, tools)
+        return tools
+
+
+mcp_tool_cache = MCPToolCache(
+    enabled=config.MCP_TOOL_CACHE_ENABLED,
+    fresh_for=config.MCP_TOOL_CACHE_FRESH_SECONDS,
+)
@@ -6,6 +6,7 @@ import httpx
 from utils.logger import logger
 import time
 import random
+from .token_manager import TokenManager
 
 try:
     from mcp import ClientSession
@@ -26,10 +27,20 @@ class PipedreamClient:
     def __init__(self, config: Optional[PipedreamConfig] = None):
         self.config = config or self._load_config_from_env()
         self.base_url = "https://api.pipedream.com/v1"
-        self.access_token: Optional[str] = None
-        self.rate_limit_token: Optional[str] = None
         self.session: Optional[httpx.AsyncClient] = None
+        self.mcp_url = "https://remote.mcp.pipedream.net"
+        self._rate_limit_params = {"window_size_seconds": 10, "requests_per_window": 1000}
+        self._access_token = TokenManager("access token", self._fetch_access_token)
+        self._rate_limit_token = TokenManager("rate limit token", self._fetch_rate_limit_token)
         
+    @property
+    def access_token(self) -> Optional[str]:
+        return self._access_token.token
+
+    @property
+    def rate_limit_token(self) -> Optional[str]:
+        return self._rate_limit_token.token
+
     def _load_config_from_env(self) -> PipedreamConfig:
         project_id = os.getenv("PIPEDREAM_PROJECT_ID")
         environment = os.getenv("PIPEDREAM_X_PD_ENVIRONMENT", "development")
@@ -65,23 +76,18 @@ class PipedreamClient:
             )
         return self.session
 
-    async def _obtain_rate_limit_token(self, window_size_seconds: int = 10, requests_per_window: int = 1000) -> str:
+    async def _fetch_rate_limit_token(self) -> tuple[str, Optional[float]]:
         """Obtain a rate limit token from Pipedream to bypass rate limits"""
-        if self.rate_limit_token:
-            logger.debug(f"Using existing rate limit token: {self.rate_limit_token[:20]}...")
-            return self.rate_limit_token
-            
         access_token = await self._obtain_access_token()
+        window_size_seconds = self._rate_limit_params["window_size_seconds"]
+        requests_per_window = self._rate_limit_params["requests_per_window"]
         logger.info(f"Obtaining Pipedream rate limit token (window: {window_size_seconds}s, requests: {requests_per_window})")
         
         try:
             # Make this request without retry logic to avoid circular dependency
             session = await self._get_session()
             url = f"{self.base_url}/connect/rate_limits"
-            payload = {
-                "window_size_seconds": window_size_seconds,
-                "requests_per_window": requests_per_window
-            }
+            payload = dict(self._rate_limit_params)
             
             logger.debug(f"Making POST request to {url} with payload: {payload}")
             
@@ -101,20 +107,16 @@ class PipedreamClient:
                 response.raise_for_status()
             
             data = response.json()
-            logger.debug(f"Rate limit token response data: {data}")
-            
-            self.rate_limit_token = data.get("token")
-            
-            if not self.rate_limit_token:
-                raise ValueError("No rate limit token received from Pipedream")
-            
-            logger.info(f"Successfully obtained Pipedream rate limit token: {self.rate_limit_token[:20]}...")
-            return self.rate_limit_token
+            return data.get("token"), data.get("expires_in")
             
         except Exception as e:
             logger.error(f"Error obtaining rate limit token: {str(e)}")
             raise
 
+    async def _obtain_rate_limit_token(self) -> str:
+        """Get the cached rate limit token, obtaining one if needed"""
+        return await self._rate_limit_token.get()
+
     async def _make_request_with_retry(self, method: str, url: str, headers: dict, max_retries: int = 3, **kwargs) -> httpx.Response:
         session = await self._get_session()
         
@@ -122,9 +124,10 @@ class PipedreamClient:
             try:
                 # Always include rate limit token if available
                 request_headers = headers.copy()
-                if self.rate_limit_token:
-                    request_headers["x-pd-rate-limit"] = self.rate_limit_token
-                    logger.debug(f"Making {method} request to {url} with rate limit token: {self.rate_limit_token[:20]}...")
+                rate_limit_token = self.rate_limit_token
+                if rate_limit_token:
+                    request_headers["x-pd-rate-limit"] = rate_limit_token
+                    logger.debug(f"Making {method} request to {url} with rate limit token: {rate_limit_token[:20]}...")
                 else:
                     logger.debug(f"Making {method} request to {url} without rate limit token")
                 
@@ -164,10 +167,7 @@ class PipedreamClient:
         
         raise Exception(f"Max retries ({max_retries}) exceeded for {method} {url}")
 
-    async def _obtain_access_token(self) -> str:
-        if self.access_token:
-            return self.access_token
-            
+    async def _fetch_access_token(self) -> tuple[str, Optional[float]]:
         logger.info("Obtaining Pipedream access token via OAuth")
         try:
             # Make this request without retry logic to avoid issues
@@ -184,38 +184,54 @@ class PipedreamClient:
             
             response.raise_for_status()
             data = response.json()
-            
-            self.access_token = data.get("access_token")
-            if not self.access_token:
-                raise ValueError("No access token received from Pipedream OAuth")
-            
-            logger.info("Successfully obtained Pipedream access token")
-            return self.access_token
+            return data.get("access_token"), data.get("expires_in")
             
         except Exception as e:
             logger.error(f"Error obtaining access token: {str(e)}")
             raise
 
+    async def _obtain_access_token(self) -> str:
+        """Get the cached OAuth access token, obtaining one if needed"""
+        return await self._access_token.get()
+
     async def refresh_rate_limit_token(self, window_size_seconds: int = 10, requests_per_window: int = 1000) -> str:
         """Manually refresh the rate limit token with custom parameters"""
-        self.rate_limit_token = None  # Clear existing token
-        return await self._obtain_rate_limit_token(window_size_seconds, requests_per_window)
-
+        self._rate_limit_params = {"window_size_seconds": window_size_seconds, "requests_per_window": requests_per_window}
+        return await self._rate_limit_token.refresh()
+    
     def clear_rate_limit_token(self) -> None:
         """Clear the stored rate limit token to force obtaining a new one"""
-        self.rate_limit_token = None
+        self._rate_limit_token.invalidate()
         logger.info("Rate limit token cleared")
 
     async def _ensure_rate_limit_token(self) -> None:
         """Ensure we have a rate limit token before making requests"""
-        if not self.rate_limit_token:
-            try:
-                await self._obtain_rate_limit_token()
-            except Exception as e:
-                logger.warning(f"Failed to obtain rate limit token, proceeding without it: {str(e)}")
-        else:
-            logger.debug(f"Using existing rate limit token: {self.rate_limit_token[:20]}...")
-    
+        try:
+            await self._obtain_rate_limit_token()
+        except Exception as e:
+            logger.warning(f"Failed to obtain rate limit token, proceeding without it: {str(e)}")
+
+    async def get_mcp_headers(self, external_user_id: str, app_slug: str, oauth_app_id: Optional[str] = None) -> Dict[str, str]:
+        """Headers for calling a user's app on the Pipedream remote MCP server"""
+        access_token = await self._obtain_access_token()
+        await self._ensure_rate_limit_token()
+        
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "x-pd-project-id": self.config.project_id,
+            "x-pd-environment": self.config.environment,
+            "x-pd-external-user-id": external_user_id,
+            "x-pd-app-slug": app_slug,
+        }
+        
+        if self.rate_limit_token:
+            headers["x-pd-rate-limit"] = self.rate_limit_token
+        
+        if oauth_app_id:
+            headers["x-pd-oauth-app-id"] = oauth_app_id
+        
+        return headers
+
     async def create_connection_token(self, external_user_id: str, app: Optional[str] = None) -> Dict[str, Any]:
         access_token = await self._obtain_access_token()
         await self._ensure_rate_limit_token()
@@ -4,9 +4,9 @@ This module provides reusable search functionality for the agent builder and oth
 """
 
 import asyncio
-import httpx
 from typing import Dict, Any, List, Optional
 from utils.logger import logger
+from services.http_clients import http_clients
 from .client import get_pipedream_client
 
 class PipedreamSearchAPI:
@@ -36,50 +36,50 @@ class PipedreamSearchAPI:
             Dictionary with search results including apps, page info, and total count
         """
         try:
-            async with httpx.AsyncClient() as client:
-                url = f"{self.base_url}/apps"
-                params = {"page": page, "pageSize": limit}
-                
-                if query:
-                    params["q"] = query
-                if category:
-                    params["category"] = category
-                
-                logger.info(f"Searching Pipedream apps: query='{query}', category='{category}', page={page}")
-                
-                response = await client.get(url, params=params, timeout=30.0)
-                response.raise_for_status()
-                
-                data = response.json()
-                
-                # Format response for consistency
-                apps = data.get("data", [])
-                formatted_apps = []
-                
-                for app in apps:
-                    formatted_app = {
-                        "name": app.get("name", "Unknown"),
-                        "app_slug": app.get("name_slug", ""),
-                        "description": app.get("description", "No description available"),
-                        "category": app.get("category", "Other"),
-                        "logo_url": app.get("img_src", ""),
-                        "auth_type": app.get("auth_type", ""),
-                        "is_verified": app.get("verified", False),
-                        "url": app.get("url", ""),
-                        "tags": app.get("tags", []),
-                        "featured_weight": app.get("featured_weight", 0)
-                    }
-                    formatted_apps.append(formatted_app)
-                
-                logger.info(f"Found {len(formatted_apps)} Pipedream apps")
-                
-                return {
-                    "success": True,
-                    "apps": formatted_apps,
-                    "page_info": data.get("page_info", {}),
-                    "total_count": data.get("page_info", {}).get("total_count", 0)
+            client = http_clients.get("pipedream")
+            url = f"{self.base_url}/apps"
+            params = {"page": page, "pageSize": limit}
+
+            if query:
+                params["q"] = query
+            if category:
+                params["category"] = category
+
+            logger.info(f"Searching Pipedream apps: query='{query}', category='{category}', page={page}")
+
+            response = await client.get(url, params=params, timeout=30.0)
+            response.raise_for_status()
+
+            data = response.json()
+
+            # Format response for consistency
+            apps = data.get("data", [])
+            formatted_apps = []
+
+            for app in apps:
+                formatted_app = {
+                    "name": app.get("name", "Unknown"),
+                    "app_slug": app.get("name_slug", ""),
+                    "description": app.get("description", "No description available"),
+                    "category": app.get("category", "Other"),
+                    "logo_url": app.get("img_src", ""),
+                    "auth_type": app.get("auth_type", ""),
+                    "is_verified": app.get("verified", False),
+                    "url": app.get("url", ""),
+                    "tags": app.get("tags", []),
+                    "featured_weight": app.get("featured_weight", 0)
                 }
-                
+                formatted_apps.append(formatted_app)
+
+            logger.info(f"Found {len(formatted_apps)} Pipedream apps")
+
+            return {
+                "success": True,
+                "apps": formatted_apps,
+                "page_info": data.get("page_info", {}),
+                "total_count": data.get("page_info", {}).get("total_count", 0)
+            }
+
         except Exception as e:
             logger.error(f"Error searching Pipedream apps: {str(e)}")
             return {
@@ -92,73 +92,73 @@ class PipedreamSearchAPI:
     
     async def get_app_details(self, app_slug: str) -> Dict[str, Any]:
         try:
-            async with httpx.AsyncClient() as client:
-                url = f"{self.base_url}/apps"
-                params = {"q": app_slug, "pageSize": 20}
-                
-                logger.info(f"Getting details for Pipedream app: {app_slug}")
-                
-                response = await client.get(url, params=params, timeout=30.0)
-                response.raise_for_status()
-                
-                data = response.json()
-                apps = data.get("data", [])
-                
-                target_app = None
+            client = http_clients.get("pipedream")
+            url = f"{self.base_url}/apps"
+            params = {"q": app_slug, "pageSize": 20}
+
+            logger.info(f"Getting details for Pipedream app: {app_slug}")
+
+            response = await client.get(url, params=params, timeout=30.0)
+            response.raise_for_status()
+
+            data = response.json()
+            apps = data.get("data", [])
+
+            target_app = None
+            for app in apps:
+                if app.get("name_slug") == app_slug:
+                    target_app = app
+                    break
+
+            if not target_app:
                 for app in apps:
-                    if app.get("name_slug") == app_slug:
+                    if app.get("name", "").lower() == app_slug.lower():
                         target_app = app
                         break
-                
-                if not target_app:
-                    for app in apps:
-                        if app.get("name", "").lower() == app_slug.lower():
-                            target_app = app
-                            break
-                
-                if not target_app:
-                    partial_matches = []
-                    for app in apps:
-                        if (app_slug.lower() in app.get("name", "").lower() or 
-                            app_slug.lower() in app.get("name_slug", "").lower()):
-                            partial_matches.append(app)
-                    
-                    if partial_matches:
-                        partial_matches.sort(key=lambda x: (
-                            x.get("featured_weight", 0),
-                            x.get("name", "").lower() == app_slug.lower()
-                        ), reverse=True)
-                        target_app = partial_matches[0]
-                
-                if not target_app:
-                    return {
-                        "success": False,
-                        "error": f"App '{app_slug}' not found in Pipedream registry",
-                        "app": None
-                    }
-                
-                app_details = {
-                    "name": target_app.get("name", "Unknown"),
-                    "app_slug": target_app.get("name_slug", app_slug),
-                    "description": target_app.get("description", "No description available"),
-                    "category": target_app.get("category", "Other"),
-                    "logo_url": target_app.get("img_src", ""),
-                    "auth_type": target_app.get("auth_type", ""),
-                    "is_verified": target_app.get("verified", False),
-                    "url": target_app.get("url", ""),
-                    "tags": target_app.get("tags", []),
-                    "actions": target_app.get("actions", []),
-                    "triggers": target_app.get("triggers", []),
-                    "featured_weight": target_app.get("featured_weight", 0)
-                }
-                
-                logger.info(f"Retrieved details for {app_details['name']}")
-                
+
+            if not target_app:
+                partial_matches = []
+                for app in apps:
+                    if (app_slug.lower() in app.get("name", "").lower() or 
+                        app_slug.lower() in app.get("name_slug", "").lower()):
+                        partial_matches.append(app)
+
+                if partial_matches:
+                    partial_matches.sort(key=lambda x: (
+                        x.get("featured_weight", 0),
+                        x.get("name", "").lower() == app_slug.lower()
+                    ), reverse=True)
+                    target_app = partial_matches[0]
+
+            if not target_app:
                 return {
-                    "success": True,
-                    "app": app_details
+                    "success": False,
+                    "error": f"App '{app_slug}' not found in Pipedream registry",
+                    "app": None
                 }
-                
+
+            app_details = {
+                "name": target_app.get("name", "Unknown"),
+                "app_slug": target_app.get("name_slug", app_slug),
+                "description": target_app.get("description", "No description available"),
+                "category": target_app.get("category", "Other"),
+                "logo_url": target_app.get("img_src", ""),
+                "auth_type": target_app.get("auth_type", ""),
+                "is_verified": target_app.get("verified", False),
+                "url": target_app.get("url", ""),
+                "tags": target_app.get("tags", []),
+                "actions": target_app.get("actions", []),
+                "triggers": target_app.get("triggers", []),
+                "featured_weight": target_app.get("featured_weight", 0)
+            }
+
+            logger.info(f"Retrieved details for {app_details['name']}")
+
+            return {
+                "success": True,
+                "app": app_details
+            }
+
         except Exception as e:
             logger.error(f"Error getting app details for {app_slug}: {str(e)}")
             return {
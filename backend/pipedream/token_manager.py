@@ -0,0 +1,104 @@
+"""
+Expiry-aware caching of Pipedream API tokens.
+
+The OAuth access token and the rate limit token are cached with the
+``expires_in`` Pipedream returns. Concurrent callers that find no valid token
+share a single fetch instead of each hitting the OAuth endpoint, and a token
+that is about to expire is still handed out while a background task fetches
+its replacement.
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional, Tuple
+
+from utils.logger import logger
+
+# Returns (token, expires_in seconds or None if the token doesn't expire)
+FetchToken = Callable[[], Awaitable[Tuple[str, Optional[float]]]]
+
+
+class TokenManager:
+    """Caches one token, refreshing it ahead of expiry with a single in-flight fetch.
+
+    Usage:
+        access_token = TokenManager("access token", fetch_access_token)
+        token = await access_token.get()
+    """
+
+    def __init__(self, name: str, fetch: FetchToken, refresh_margin: float = 300.0):
+        """
+        Args:
+            name: Used in log messages.
+            fetch: Obtains a new token and its lifetime in seconds.
+            refresh_margin: Refresh in the background once the token expires within this many seconds.
+        """
+        self.name = name
+        self.fetch = fetch
+        self.refresh_margin = refresh_margin
+        self._token: Optional[str] = None
+        self._expires_at: Optional[float] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def token(self) -> Optional[str]:
+        """The cached token if it hasn't expired, without fetching."""
+        if self._token and (self._expires_at is None or time.monotonic() < self._expires_at):
+            return self._token
+        return None
+
+    def _needs_refresh(self) -> bool:
+        return self._expires_at is not None and time.monotonic() >= self._expires_at - self.refresh_margin
+
+    def _get_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Locks and tasks belong to one event loop
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._refresh_task = None
+        return self._lock
+
+    async def _fetch(self) -> str:
+        token, expires_in = await self.fetch()
+        if not token:
+            raise ValueError(f"No {self.name} received from Pipedream")
+        self._token = token
+        self._expires_at = time.monotonic() + expires_in if expires_in else None
+        logger.info(f"Obtained Pipedream {self.name}" + (f" (expires in {expires_in:.0f}s)" if expires_in else ""))
+        return token
+
+    async def _refresh_in_background(self):
+        try:
+            async with self._get_lock():
+                if self._needs_refresh():
+                    await self._fetch()
+        except Exception as e:
+            # The current token stays in use until it expires
+            logger.warning(f"Background refresh of Pipedream {self.name} failed: {str(e)}")
+
+    async def get(self) -> str:
+        """Return a valid token, fetching one if there is none."""
+        lock = self._get_lock()
+        token = self.token
+        if token is None:
+            async with lock:
+                token = self.token
+                if token is None:
+                    token = await self._fetch()
+
+        if self._needs_refresh() and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._refresh_in_background())
+        return token
+
+    async def refresh(self) -> str:
+        """Fetch a new token now, replacing the cached one."""
+        async with self._get_lock():
+            return await self._fetch()
+
+    def invalidate(self):
+        """Drop the cached token so the next get() fetches a new one."""
+        self._token = None
+        self._expires_at = None
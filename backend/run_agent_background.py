@@ -3,18 +3,23 @@ dotenv.load_dotenv(".env")
 
 import sentry
 import asyncio
-import json
+import time
 import traceback
 from datetime import datetime, timezone
 from typing import Optional
 from services import redis
 from agent.run import run_agent
 from utils.logger import logger, structlog
+from utils.config import config
 import dramatiq
 import uuid
 from agentpress.thread_manager import ThreadManager
 from services.supabase import DBConnection
 from services import redis
+from services import response_transport
+from services.run_control import run_control
+from flags.flags import get_flag_manager
+from services.http_clients import http_clients
 from dramatiq.brokers.rabbitmq import RabbitmqBroker
 import os
 from services.langfuse import langfuse
@@ -41,6 +46,11 @@ async def initialize():
         instance_id = str(uuid.uuid4())[:8]
     await retry(lambda: redis.initialize_async())
     await db.initialize()
+    await http_clients.initialize()
+    try:
+        await get_flag_manager().load_snapshot()
+    except Exception as e:
+        logger.warning(f"Failed to preload feature flags: {e}")
 
     _initialized = True
     logger.info(f"Initialized agent API with instance ID: {instance_id}")
@@ -120,53 +130,21 @@ async def run_agent_background(
     client = await db.client
     start_time = datetime.now(timezone.utc)
     total_responses = 0
-    pubsub = None
-    stop_checker = None
-    stop_signal_received = False
+    stop_event = None
+    agent_gen = None
+    publisher = response_transport.ResponsePublisher(agent_run_id)
+    transcript = response_transport.TranscriptCompactor()
+    transcript_retry_at = 0.0
 
     # Define Redis keys and channels
-    response_list_key = f"agent_run:{agent_run_id}:responses"
-    response_channel = f"agent_run:{agent_run_id}:new_response"
-    instance_control_channel = f"agent_run:{agent_run_id}:control:{instance_id}"
-    global_control_channel = f"agent_run:{agent_run_id}:control"
+    global_control_channel = response_transport.control_channel(agent_run_id)
     instance_active_key = f"active_run:{instance_id}:{agent_run_id}"
 
-    async def check_for_stop_signal():
-        nonlocal stop_signal_received
-        if not pubsub: return
-        try:
-            while not stop_signal_received:
-                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=0.5)
-                if message and message.get("type") == "message":
-                    data = message.get("data")
-                    if isinstance(data, bytes): data = data.decode('utf-8')
-                    if data == "STOP":
-                        logger.info(f"Received STOP signal for agent run {agent_run_id} (Instance: {instance_id})")
-                        stop_signal_received = True
-                        break
-                # Periodically refresh the active run key TTL
-                if total_responses % 50 == 0: # Refresh every 50 responses or so
-                    try: await redis.expire(instance_active_key, redis.REDIS_KEY_TTL)
-                    except Exception as ttl_err: logger.warning(f"Failed to refresh TTL for {instance_active_key}: {ttl_err}")
-                await asyncio.sleep(0.1) # Short sleep to prevent tight loop
-        except asyncio.CancelledError:
-            logger.info(f"Stop signal checker cancelled for {agent_run_id} (Instance: {instance_id})")
-        except Exception as e:
-            logger.error(f"Error in stop signal checker for {agent_run_id}: {e}", exc_info=True)
-            stop_signal_received = True # Stop the run if the checker fails
-
     trace = langfuse.trace(name="agent_run", id=agent_run_id, session_id=thread_id, metadata={"project_id": project_id, "instance_id": instance_id})
     try:
-        # Setup Pub/Sub listener for control signals
-        pubsub = await redis.create_pubsub()
-        try:
-            await retry(lambda: pubsub.subscribe(instance_control_channel, global_control_channel))
-        except Exception as e:
-            logger.error(f"Redis failed to subscribe to control channels: {e}", exc_info=True)
-            raise e
-
-        logger.debug(f"Subscribed to control channels: {instance_control_channel}, {global_control_channel}")
-        stop_checker = asyncio.create_task(check_for_stop_signal())
+        # Listen for STOP on the worker's shared control channel subscription;
+        # it also keeps the active run key alive
+        stop_event = await run_control.register(agent_run_id, instance_active_key)
 
         # Ensure active run key exists and has TTL
         await redis.set(instance_active_key, "running", ex=redis.REDIS_KEY_TTL)
@@ -187,20 +165,23 @@ async def run_agent_background(
         final_status = "running"
         error_message = None
 
-        pending_redis_operations = []
-
         async for response in agent_gen:
-            if stop_signal_received:
+            if stop_event.is_set():
                 logger.info(f"Agent run {agent_run_id} stopped by signal.")
                 final_status = "stopped"
                 trace.span(name="agent_run_stopped").end(status_message="agent_run_stopped", level="WARNING")
                 break
 
-            # Store response in Redis list and publish notification
-            response_json = json.dumps(response)
-            pending_redis_operations.append(asyncio.create_task(redis.rpush(response_list_key, response_json)))
-            pending_redis_operations.append(asyncio.create_task(redis.publish(response_channel, "new")))
+            # Buffer response; the publisher pushes batches and notifies consumers
+            await publisher.publish(response)
+            transcript.add(response)
             total_responses += 1
+            if time.monotonic() >= transcript_retry_at and (
+                    len(transcript.finished()) >= config.AGENT_TRANSCRIPT_FLUSH_ITEMS
+                    or transcript.finished_chars >= config.AGENT_TRANSCRIPT_FLUSH_CHARS):
+                if not await flush_transcript(client, agent_run_id, transcript, attempts=1):
+                    # Keep streaming; the responses go out with a later flush
+                    transcript_retry_at = time.monotonic() + TRANSCRIPT_RETRY_AFTER
 
             # Check for agent-signaled completion or error
             if response.get('type') == 'status':
@@ -219,20 +200,20 @@ async def run_agent_background(
              logger.info(f"Agent run {agent_run_id} completed normally (duration: {duration:.2f}s, responses: {total_responses})")
              completion_message = {"type": "status", "status": "completed", "message": "Agent run completed successfully"}
              trace.span(name="agent_run_completed").end(status_message="agent_run_completed")
-             await redis.rpush(response_list_key, json.dumps(completion_message))
-             await redis.publish(response_channel, "new") # Notify about the completion message
-
-        # Fetch final responses from Redis for DB update
-        all_responses_json = await redis.lrange(response_list_key, 0, -1)
-        all_responses = [json.loads(r) for r in all_responses_json]
+             await publisher.publish(completion_message)
+             transcript.add(completion_message)
 
-        # Update DB status
-        await update_agent_run_status(client, agent_run_id, final_status, error=error_message, responses=all_responses)
+        # Append the rest of the compacted transcript, then mark the run finished
+        await publisher.flush()
+        transcript.finish()
+        await flush_transcript(client, agent_run_id, transcript)
+        await update_agent_run_status(client, agent_run_id, final_status, error=error_message)
 
         # Publish final control signal (END_STREAM or ERROR)
         control_signal = "END_STREAM" if final_status == "completed" else "ERROR" if final_status == "failed" else "STOP"
         try:
             await redis.publish(global_control_channel, control_signal)
+            await response_transport.push_control(agent_run_id, control_signal)
             # No need to publish to instance channel as the run is ending on this instance
             logger.debug(f"Published final control signal '{control_signal}' to {global_control_channel}")
         except Exception as e:
@@ -249,46 +230,45 @@ async def run_agent_background(
         # Push error message to Redis list
         error_response = {"type": "status", "status": "error", "message": error_message}
         try:
-            await redis.rpush(response_list_key, json.dumps(error_response))
-            await redis.publish(response_channel, "new")
+            await publisher.publish(error_response)
+            await publisher.flush()
         except Exception as redis_err:
              logger.error(f"Failed to push error response to Redis for {agent_run_id}: {redis_err}")
 
-        # Fetch final responses (including the error)
-        all_responses = []
-        try:
-             all_responses_json = await redis.lrange(response_list_key, 0, -1)
-             all_responses = [json.loads(r) for r in all_responses_json]
-        except Exception as fetch_err:
-             logger.error(f"Failed to fetch responses from Redis after error for {agent_run_id}: {fetch_err}")
-             all_responses = [error_response] # Use the error message we tried to push
+        # Append the rest of the compacted transcript, including the error
+        transcript.add(error_response)
+        transcript.finish()
+        await flush_transcript(client, agent_run_id, transcript)
 
         # Update DB status
-        await update_agent_run_status(client, agent_run_id, "failed", error=f"{error_message}\n{traceback_str}", responses=all_responses)
+        await update_agent_run_status(client, agent_run_id, "failed", error=f"{error_message}\n{traceback_str}")
 
         # Publish ERROR signal
         try:
             await redis.publish(global_control_channel, "ERROR")
+            await response_transport.push_control(agent_run_id, "ERROR")
             logger.debug(f"Published ERROR signal to {global_control_channel}")
         except Exception as e:
             logger.warning(f"Failed to publish ERROR signal: {str(e)}")
 
     finally:
-        # Cleanup stop checker task
-        if stop_checker and not stop_checker.done():
-            stop_checker.cancel()
-            try: await stop_checker
-            except asyncio.CancelledError: pass
-            except Exception as e: logger.warning(f"Error during stop_checker cancellation: {e}")
-
-        # Close pubsub connection
-        if pubsub:
+        # Stop listening for control signals for this run
+        if stop_event is not None:
             try:
-                await pubsub.unsubscribe()
-                await pubsub.close()
-                logger.debug(f"Closed pubsub connection for {agent_run_id}")
+                await run_control.unregister(agent_run_id)
             except Exception as e:
-                logger.warning(f"Error closing pubsub for {agent_run_id}: {str(e)}")
+                logger.warning(f"Error unregistering {agent_run_id} from run control: {str(e)}")
+
+        # Close the agent generator so run_agent releases its resources (e.g. MCP sessions)
+        # even when the loop above stopped early
+        if agent_gen is not None:
+            try:
+                await agent_gen.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing agent generator for {agent_run_id}: {str(e)}")
+
+        # Flush buffered responses and wait for in-flight pushes, with timeout
+        await publisher.close(timeout=30.0)
 
         # Set TTL on the response list in Redis
         await _cleanup_redis_response_list(agent_run_id)
@@ -299,12 +279,6 @@ async def run_agent_background(
         # Clean up the run lock
         await _cleanup_redis_run_lock(agent_run_id)
 
-        # Wait for all pending redis operations to complete, with timeout
-        try:
-            await asyncio.wait_for(asyncio.gather(*pending_redis_operations), timeout=30.0)
-        except asyncio.TimeoutError:
-            logger.warning(f"Timeout waiting for pending Redis operations for {agent_run_id}")
-
         logger.info(f"Agent run background task fully completed for: {agent_run_id} (Instance: {instance_id}) with final status: {final_status}")
 
 async def _cleanup_redis_instance_key(agent_run_id: str):
@@ -335,12 +309,40 @@ REDIS_RESPONSE_LIST_TTL = 3600 * 24
 
 async def _cleanup_redis_response_list(agent_run_id: str):
     """Set TTL on the Redis response list."""
-    response_list_key = f"agent_run:{agent_run_id}:responses"
     try:
-        await redis.expire(response_list_key, REDIS_RESPONSE_LIST_TTL)
-        logger.debug(f"Set TTL ({REDIS_RESPONSE_LIST_TTL}s) on response list: {response_list_key}")
+        await response_transport.expire_responses(agent_run_id, REDIS_RESPONSE_LIST_TTL)
+        logger.debug(f"Set TTL ({REDIS_RESPONSE_LIST_TTL}s) on responses of agent run: {agent_run_id}")
     except Exception as e:
-        logger.warning(f"Failed to set TTL on response list {response_list_key}: {str(e)}")
+        logger.warning(f"Failed to set TTL on responses of agent run {agent_run_id}: {str(e)}")
+
+# Seconds to wait before appending to the transcript again after a failed append
+TRANSCRIPT_RETRY_AFTER = 10.0
+
+async def flush_transcript(client, agent_run_id: str, transcript: response_transport.TranscriptCompactor, attempts: int = 3) -> bool:
+    """Append the finished part of a run's compacted transcript to agent_runs.responses.
+
+    The responses are dropped from memory once written; on failure they are
+    kept and go out with the next flush.
+    """
+    responses = transcript.finished()
+    if not responses:
+        return True
+    count = len(responses)
+    for retry in range(attempts):
+        try:
+            await client.rpc('append_agent_run_responses', {
+                'p_agent_run_id': agent_run_id,
+                'p_responses': responses,
+            }).execute()
+            transcript.drop_finished(count)
+            logger.debug(f"Appended {count} transcript responses to agent run {agent_run_id}")
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to append {count} transcript responses to agent run {agent_run_id} on retry {retry}: {str(e)}")
+            if retry < attempts - 1:
+                await asyncio.sleep(0.5 * (2 ** retry))
+    logger.error(f"Failed to append {count} transcript responses to agent run {agent_run_id} after {attempts} attempts")
+    return False
 
 async def update_agent_run_status(
     client,
@@ -0,0 +1,164 @@
+"""
+Client for the browser automation API running inside a sandbox.
+
+Actions are sent straight to the API's port through the sandbox preview URL
+on a pooled HTTP client. The screenshot comes back as a binary part of a
+``multipart/mixed`` response rather than base64 inside the JSON. Running
+``curl`` in the sandbox through ``process.exec`` is only used when the port
+can't be reached; the direct channel is then skipped for
+``DIRECT_RETRY_AFTER`` seconds. A rejected preview token is replaced by a
+freshly fetched preview link once before giving up on the direct channel.
+
+Usage:
+    client = SandboxBrowserClient(sandbox)
+    result, screenshot = await client.request("navigate_to", {"url": url})
+"""
+
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from daytona_sdk import AsyncSandbox
+
+from services.http_clients import http_clients
+from utils.logger import logger
+
+BROWSER_API_PORT = 8003
+DIRECT_RETRY_AFTER = 60.0
+# Returned by the preview proxy when nothing is listening on the port
+UNREACHABLE_STATUS_CODES = (502, 503, 504)
+# Returned by the preview proxy when the preview token expired or was revoked
+AUTH_STATUS_CODES = (401, 403)
+
+
+class BrowserAPIUnreachable(Exception):
+    """The browser API port can't be reached through the preview URL."""
+
+
+def parse_multipart(content_type: str, body: bytes) -> List[Tuple[str, bytes]]:
+    """Split a multipart body into (content type, content) parts."""
+    boundary = None
+    for param in content_type.split(";")[1:]:
+        name, _, value = param.strip().partition("=")
+        if name.lower() == "boundary":
+            boundary = value.strip('"')
+    if not boundary:
+        raise ValueError("Multipart response without boundary")
+
+    parts = []
+    # Skip the preamble and everything after the closing delimiter
+    for part in body.split(b"--" + boundary.encode())[1:-1]:
+        headers, _, content = part.partition(b"\r\n\r\n")
+        part_type = "application/octet-stream"
+        for line in headers.decode("latin-1").split("\r\n"):
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-type":
+                part_type = value.strip()
+        parts.append((part_type, content[:-2] if content.endswith(b"\r\n") else content))
+    return parts
+
+
+class SandboxBrowserClient:
+    """Sends browser automation requests to one sandbox."""
+
+    def __init__(self, sandbox: AsyncSandbox):
+        self.sandbox = sandbox
+        self._base_url: Optional[str] = None
+        self._headers: Dict[str, str] = {}
+        self._direct_disabled_until = 0.0
+
+    async def _get_base_url(self) -> str:
+        if self._base_url is None:
+            preview_link = await self.sandbox.get_preview_link(BROWSER_API_PORT)
+            self._base_url = (preview_link.url if hasattr(preview_link, 'url') else str(preview_link)).rstrip("/")
+            token = getattr(preview_link, 'token', None)
+            if token:
+                self._headers = {"x-daytona-preview-token": token}
+        return self._base_url
+
+    async def _send_direct(self, endpoint: str, params: Optional[Dict[str, Any]], method: str) -> httpx.Response:
+        try:
+            base_url = await self._get_base_url()
+        except Exception as e:
+            raise BrowserAPIUnreachable(f"No preview URL for port {BROWSER_API_PORT}: {str(e)}")
+
+        url = f"{base_url}/api/automation/{endpoint}"
+        headers = {**self._headers, "Accept": "multipart/mixed, application/json"}
+        client = http_clients.get("sandbox_browser")
+        try:
+            if method == "GET":
+                return await client.get(url, params=params, headers=headers)
+            return await client.request(method, url, json=params, headers=headers)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            raise BrowserAPIUnreachable(f"{type(e).__name__}: {str(e)}")
+
+    async def _request_direct(self, endpoint: str, params: Optional[Dict[str, Any]], method: str) -> Tuple[Dict[str, Any], Optional[bytes]]:
+        response = await self._send_direct(endpoint, params, method)
+        if response.status_code in AUTH_STATUS_CODES:
+            # The proxy rejected the request before it reached the API; retry with a new preview link
+            logger.info(f"Preview URL rejected the request with HTTP {response.status_code}, refreshing the preview link")
+            self._base_url = None
+            self._headers = {}
+            response = await self._send_direct(endpoint, params, method)
+        if response.status_code in UNREACHABLE_STATUS_CODES + AUTH_STATUS_CODES:
+            raise BrowserAPIUnreachable(f"HTTP {response.status_code} from preview URL")
+
+        content_type = response.headers.get("content-type", "")
+        if not content_type.startswith("multipart/"):
+            return response.json(), None
+
+        result, screenshot = None, None
+        for part_type, content in parse_multipart(content_type, response.content):
+            if part_type.startswith("application/json"):
+                result = json.loads(content)
+            elif part_type.startswith("image/"):
+                screenshot = content
+        if result is None:
+            raise ValueError("Multipart browser response without a JSON part")
+        return result, screenshot
+
+    async def _request_exec(self, endpoint: str, params: Optional[Dict[str, Any]], method: str) -> Dict[str, Any]:
+        # Build the curl command
+        url = f"http://localhost:{BROWSER_API_PORT}/api/automation/{endpoint}"
+
+        if method == "GET" and params:
+            query_params = "&".join([f"{k}={v}" for k, v in params.items()])
+            url = f"{url}?{query_params}"
+            curl_cmd = f"curl -s -X {method} '{url}' -H 'Content-Type: application/json'"
+        else:
+            curl_cmd = f"curl -s -X {method} '{url}' -H 'Content-Type: application/json'"
+            if params:
+                json_data = json.dumps(params)
+                curl_cmd += f" -d '{json_data}'"
+
+        logger.debug("\033[95mExecuting curl command:\033[0m")
+        logger.debug(f"{curl_cmd}")
+
+        response = await self.sandbox.process.exec(curl_cmd, timeout=30)
+        if response.exit_code != 0:
+            raise RuntimeError(f"Browser automation request failed: {response}")
+        try:
+            return json.loads(response.result)
+        except json.JSONDecodeError as e:
+            raise RuntimeError(f"Failed to parse response JSON: {response.result} {e}")
+
+    async def request(self, endpoint: str, params: Optional[Dict[str, Any]] = None, method: str = "POST") -> Tuple[Dict[str, Any], Optional[bytes]]:
+        """Run a browser automation action.
+
+        Returns:
+            The result JSON and the screenshot bytes. When the request went through
+            the exec fallback the screenshot is left base64 encoded in the result's
+            ``screenshot_base64`` and None is returned for the bytes.
+        """
+        if time.monotonic() >= self._direct_disabled_until:
+            try:
+                return await self._request_direct(endpoint, params, method)
+            except BrowserAPIUnreachable as e:
+                # Only connection failures fall back: anything later may have run the action
+                logger.warning(f"Browser API unreachable via preview URL ({str(e)}), falling back to exec for {DIRECT_RETRY_AFTER:.0f}s")
+                self._direct_disabled_until = time.monotonic() + DIRECT_RETRY_AFTER
+                self._base_url = None
+                self._headers = {}
+
+        return await self._request_exec(endpoint, params, method), None
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Body
+from fastapi import FastAPI, APIRouter, HTTPException, Body, Request
+from fastapi.responses import Response
 from playwright.async_api import async_playwright, Browser, BrowserContext, Page
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
@@ -6,6 +7,13 @@ import asyncio
 import json
 import logging
 import base64
+import bisect
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 from dataclasses import dataclass, field
 from datetime import datetime
 import os
@@ -16,6 +24,23 @@ import pytesseract
 from PIL import Image
 import io
 
+# OCR is opt-in: run it after every action only when this is set, otherwise
+# on request through /automation/ocr
+OCR_ON_ACTION = os.getenv("BROWSER_OCR_ON_ACTION", "false").lower() == "true"
+OCR_WORKERS = int(os.getenv("BROWSER_OCR_WORKERS", "2"))
+OCR_CACHE_SIZE = 64
+
+# "compact" builds the DOM state from a single evaluate of pre-serialized elements;
+# "full" builds DOMElementNode/DOMTextNode trees
+DOM_SNAPSHOT_MODE = os.getenv("BROWSER_DOM_SNAPSHOT", "compact").lower()
+# Maximum interactive elements in a compact snapshot, 0 for no limit
+DOM_MAX_ELEMENTS = int(os.getenv("BROWSER_DOM_MAX_ELEMENTS", "0"))
+
+def ocr_image(image_bytes: bytes) -> str:
+    """Run tesseract on an image; executed in the OCR process pool"""
+    image = Image.open(io.BytesIO(image_bytes))
+    return pytesseract.image_to_string(image).strip()
+
 #######################################################
 # Action model definitions
 #######################################################
@@ -56,6 +81,9 @@ class OpenTabAction(BaseModel):
 class CloseTabAction(BaseModel):
     page_id: int
 
+class OCRAction(BaseModel):
+    screenshot_base64: Optional[str] = None  # Defaults to the latest action screenshot
+
 class NoParamsAction(BaseModel):
     pass
 
@@ -237,14 +265,320 @@ class DOMElementNode(DOMBaseNode):
         result = '\n'.join(formatted_text)
         return result if result.strip() else "No interactive elements found"
 
+class CompactElementNode:
+    """Interactive element of a compact DOM snapshot, serialized by the browser"""
+    __slots__ = ('highlight_index', 'tag_name', 'attributes', 'text', 'line', 'is_in_viewport')
+    is_visible = True
+    is_interactive = True
+    
+    def __init__(self, highlight_index: int, tag_name: str, attributes: Dict[str, str], text: str,
+                 line: str, is_in_viewport: bool):
+        self.highlight_index = highlight_index
+        self.tag_name = tag_name
+        self.attributes = attributes
+        self.text = text
+        self.line = line
+        self.is_in_viewport = is_in_viewport
+    
+    def __repr__(self) -> str:
+        attributes = ''.join(f' {key}="{value}"' for key, value in self.attributes.items())
+        return f'<{self.tag_name}{attributes}> [interactive, highlight:{self.highlight_index}]'
+    
+    def get_all_text_till_next_clickable_element(self, max_depth: int = -1) -> str:
+        return self.text
+
+class CompactElementTree:
+    """Element list standing in for the DOMElementNode tree in compact snapshots"""
+    __slots__ = ('elements', 'truncated')
+    
+    def __init__(self, elements: List[CompactElementNode], truncated: bool = False):
+        self.elements = elements
+        self.truncated = truncated
+    
+    def clickable_elements_to_string(self, include_attributes: list[str] | None = None) -> str:
+        """Join the element lines; include_attributes was applied when the snapshot was taken."""
+        lines = [element.line for element in self.elements]
+        if self.truncated:
+            lines.append(f"... more interactive elements not shown (limit {len(self.elements)})")
+        return '\n'.join(lines) if lines else "No interactive elements found"
+
 @dataclass
 class DOMState:
-    element_tree: DOMElementNode
-    selector_map: Dict[int, DOMElementNode]
+    element_tree: DOMElementNode | CompactElementTree
+    selector_map: Dict[int, DOMElementNode | CompactElementNode]
     url: str = ""
     title: str = ""
     pixels_above: int = 0
     pixels_below: int = 0
+    viewport_width: Optional[int] = None
+    viewport_height: Optional[int] = None
+
+# Attributes kept on compact snapshot elements (selectors and interactive_elements)
+SNAPSHOT_ATTRIBUTES = ["id", "class", "href", "src", "alt", "aria-label", "placeholder", "name", "role", "title", "value", "type"]
+
+# Serializes the interactive elements the same way clickable_elements_to_string does, with
+# the same selection and order as the click_element lookup so indices match
+DOM_SNAPSHOT_JS = """
+(options) => {
+    const lineAttributes = ['id', 'href', 'name', 'value', 'type'];
+    const elements = [];
+    let truncated = false;
+    
+    for (const el of document.querySelectorAll(
+        'a, button, input, select, textarea, [role="button"], [role="link"], [role="checkbox"], [role="radio"], [tabindex]:not([tabindex="-1"])'
+    )) {
+        const rect = el.getBoundingClientRect();
+        if (rect.width <= 0 || rect.height <= 0) continue;
+        const style = window.getComputedStyle(el);
+        if (style.display === 'none' || style.visibility === 'hidden' || style.opacity === '0') continue;
+        if (options.maxElements && elements.length >= options.maxElements) {
+            truncated = true;
+            break;
+        }
+        
+        const index = elements.length + 1;
+        const tag = el.tagName.toLowerCase();
+        const text = String(el.innerText || el.value || '').trim();
+        
+        const attributes = {};
+        for (const name of options.attributes) {
+            const value = el.getAttribute(name);
+            if (value !== null) attributes[name] = value;
+        }
+        
+        let line = `[${index}]<${tag}`;
+        for (const name of lineAttributes) {
+            const value = el.getAttribute(name);
+            if (value) line += ` ${name}="${value}"`;
+        }
+        if (text) {
+            line += `> ${text}`;
+        } else {
+            const shown = [];
+            for (const attr of el.attributes) {
+                if (options.includeAttributes.includes(attr.name) && attr.value && attr.value !== tag) {
+                    shown.push(attr.value);
+                }
+            }
+            line += shown.length ? `> ${shown.join(';')}` : `> ${tag.toUpperCase()}`;
+        }
+        line += ' </>';
+        
+        const inViewport = rect.top >= 0 && rect.left >= 0 &&
+                           rect.bottom <= window.innerHeight && rect.right <= window.innerWidth;
+        elements.push([index, tag, attributes, text, line, inViewport]);
+    }
+    
+    const body = document.body;
+    const html = document.documentElement;
+    const totalHeight = Math.max(
+        body ? body.scrollHeight : 0, body ? body.offsetHeight : 0,
+        html.clientHeight, html.scrollHeight, html.offsetHeight
+    );
+    const scrollY = window.scrollY || window.pageYOffset || 0;
+    
+    return {
+        title: document.title,
+        elements: elements,
+        truncated: truncated,
+        pixelsAbove: scrollY,
+        pixelsBelow: Math.max(0, totalHeight - scrollY - window.innerHeight),
+        viewportWidth: window.innerWidth,
+        viewportHeight: window.innerHeight
+    };
+}
+"""
+
+#######################################################
+# Page settle engine
+#######################################################
+
+# Seconds an action may wait for the page to settle, per action type
+SETTLE_BUDGETS = {
+    action_type: float(os.getenv(f"BROWSER_SETTLE_BUDGET_{action_type.upper()}", default))
+    for action_type, default in {
+        "navigate": "10",
+        "click": "5",
+        "input": "2",
+        "scroll": "1",
+        "read": "1",
+        "default": "3",
+    }.items()
+}
+
+ACTION_SETTLE_TYPES = {
+    "navigate_to": "navigate",
+    "search_google": "navigate",
+    "go_back": "navigate",
+    "open_tab": "navigate",
+    "switch_tab": "navigate",
+    "close_tab": "navigate",
+    "click_element": "click",
+    "click_coordinates": "click",
+    "select_dropdown_option": "click",
+    "drag_drop": "click",
+    "input_text": "input",
+    "send_keys": "input",
+    "scroll_down": "scroll",
+    "scroll_up": "scroll",
+    "scroll_to_text": "scroll",
+    "extract_content": "read",
+    "save_pdf": "read",
+    "get_dropdown_options": "read",
+    "wait": "read",
+}
+
+# The DOM is settled after this long without mutations
+SETTLE_DOM_QUIET_MS = int(os.getenv("BROWSER_SETTLE_DOM_QUIET_MS", "300"))
+# The network is settled after this long without short-lived requests in flight
+SETTLE_NETWORK_QUIET_MS = int(os.getenv("BROWSER_SETTLE_NETWORK_QUIET_MS", "500"))
+# Requests in flight longer than this are long-lived (long polling, streaming, beacons) and ignored
+SETTLE_LONG_REQUEST_MS = int(os.getenv("BROWSER_SETTLE_LONG_REQUEST_MS", "5000"))
+LONG_LIVED_RESOURCE_TYPES = {"websocket", "eventsource"}
+SETTLE_HISTOGRAM_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+DOM_QUIET_JS = """
+(options) => new Promise(resolve => {
+    const start = performance.now();
+    let lastMutation = start;
+    const observer = new MutationObserver(() => { lastMutation = performance.now(); });
+    observer.observe(document, { subtree: true, childList: true, attributes: true, characterData: true });
+    
+    const check = () => {
+        const now = performance.now();
+        const quiet = now - lastMutation >= options.quietMs;
+        if (quiet || now - start >= options.timeoutMs) {
+            observer.disconnect();
+            resolve(quiet);
+        } else {
+            setTimeout(check, Math.min(50, options.quietMs));
+        }
+    };
+    setTimeout(check, Math.min(options.quietMs, options.timeoutMs));
+})
+"""
+
+class NetworkTracker:
+    """Tracks the requests in flight for one page"""
+    
+    def __init__(self, page: Page):
+        self.inflight: Dict[Any, float] = {}
+        self.last_activity = time.monotonic()
+        page.on("request", self.on_request)
+        page.on("requestfinished", self.on_request_done)
+        page.on("requestfailed", self.on_request_done)
+    
+    def on_request(self, request):
+        if request.resource_type in LONG_LIVED_RESOURCE_TYPES:
+            return
+        self.last_activity = time.monotonic()
+        self.inflight[request] = self.last_activity
+    
+    def on_request_done(self, request):
+        if self.inflight.pop(request, None) is not None:
+            self.last_activity = time.monotonic()
+    
+    def quiet_for(self, since: float = 0.0) -> float:
+        """Seconds since the last network activity or since, whichever is later,
+        0 while short-lived requests are in flight"""
+        now = time.monotonic()
+        long_lived_before = now - SETTLE_LONG_REQUEST_MS / 1000
+        if any(started > long_lived_before for started in self.inflight.values()):
+            return 0.0
+        return now - max(self.last_activity, since)
+
+class PageSettler:
+    """Waits until the DOM and network are quiet after an action, within a per-action budget"""
+    
+    def __init__(self):
+        self.trackers: Dict[Page, NetworkTracker] = {}
+        self.histograms: Dict[str, Dict[str, Any]] = {}
+    
+    def track(self, page: Page):
+        """Start tracking a page's requests; safe to call repeatedly"""
+        if page not in self.trackers:
+            self.trackers[page] = NetworkTracker(page)
+            page.on("close", lambda _: self.trackers.pop(page, None))
+    
+    def is_network_quiet(self, page: Page, since: float) -> bool:
+        tracker = self.trackers.get(page)
+        return tracker is None or tracker.quiet_for(since) >= SETTLE_NETWORK_QUIET_MS / 1000
+    
+    async def wait_network_quiet(self, page: Page, since: float, deadline: float) -> bool:
+        """Wait until no request has started or finished for the quiet period, counted
+        from since at the earliest: requests an action triggers may start a little later"""
+        while not self.is_network_quiet(page, since):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+    
+    async def wait_dom_quiet(self, page: Page, deadline: float) -> bool:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                return await page.evaluate(DOM_QUIET_JS, {"quietMs": SETTLE_DOM_QUIET_MS, "timeoutMs": remaining * 1000})
+            except Exception:
+                # The action navigated and destroyed the context; observe the new document
+                try:
+                    await page.wait_for_load_state("domcontentloaded", timeout=max(remaining * 1000, 1))
+                except Exception:
+                    return False
+                await asyncio.sleep(0.05)
+    
+    async def settle(self, page: Page, action_type: str) -> Dict[str, Any]:
+        """Wait for the page to settle and record the settle time"""
+        self.track(page)
+        budget = SETTLE_BUDGETS.get(action_type, SETTLE_BUDGETS["default"])
+        start = time.monotonic()
+        deadline = start + budget
+        while True:
+            network_quiet = await self.wait_network_quiet(page, start, deadline)
+            dom_quiet = await self.wait_dom_quiet(page, deadline)
+            # Requests may have started while the DOM settled; both must be quiet at once
+            network_quiet = network_quiet and self.is_network_quiet(page, start)
+            if network_quiet or not dom_quiet or time.monotonic() >= deadline:
+                break
+        elapsed_ms = (time.monotonic() - start) * 1000
+        settled = network_quiet and dom_quiet
+        
+        histogram = self.histograms.setdefault(action_type, {
+            "count": 0,
+            "timeouts": 0,
+            "sum_ms": 0.0,
+            "buckets": [0] * (len(SETTLE_HISTOGRAM_BUCKETS_MS) + 1)
+        })
+        histogram["count"] += 1
+        histogram["timeouts"] += 0 if settled else 1
+        histogram["sum_ms"] += elapsed_ms
+        histogram["buckets"][bisect.bisect_left(SETTLE_HISTOGRAM_BUCKETS_MS, elapsed_ms)] += 1
+        
+        return {
+            "action_type": action_type,
+            "settled": settled,
+            "network_quiet": network_quiet,
+            "dom_quiet": dom_quiet,
+            "elapsed_ms": round(elapsed_ms)
+        }
+    
+    def stats(self) -> Dict[str, Any]:
+        """Settle time histograms per action type, with cumulative bucket counts"""
+        stats = {}
+        for action_type, histogram in self.histograms.items():
+            buckets, cumulative = {}, 0
+            for bound, count in zip([*SETTLE_HISTOGRAM_BUCKETS_MS, "+Inf"], histogram["buckets"]):
+                cumulative += count
+                buckets[f"le_{bound}"] = cumulative
+            stats[action_type] = {
+                "count": histogram["count"],
+                "timeouts": histogram["timeouts"],
+                "mean_ms": round(histogram["sum_ms"] / histogram["count"]),
+                "budget_ms": round(SETTLE_BUDGETS.get(action_type, SETTLE_BUDGETS["default"]) * 1000),
+                "buckets": buckets
+            }
+        return stats
 
 #######################################################
 # Browser Action Result Model
@@ -263,7 +597,8 @@ class BrowserActionResult(BaseModel):
     pixels_above: int = 0
     pixels_below: int = 0
     content: Optional[str] = None
-    ocr_text: Optional[str] = None  # Added field for OCR text
+    ocr_text: Optional[str] = None  # Only set when OCR_ON_ACTION is enabled
+    screenshot_hash: Optional[str] = None
     
     # Additional metadata
     element_count: int = 0  # Number of interactive elements found
@@ -287,9 +622,19 @@ class BrowserAutomation:
         self.current_page_index: int = 0
         self.logger = logging.getLogger("browser_automation")
         self.include_attributes = ["id", "href", "src", "alt", "aria-label", "placeholder", "name", "role", "title", "value"]
+        self.dom_snapshot_mode = DOM_SNAPSHOT_MODE
+        self.settler = PageSettler()
+        self.max_dom_elements = DOM_MAX_ELEMENTS
         self.screenshot_dir = os.path.join(os.getcwd(), "screenshots")
         os.makedirs(self.screenshot_dir, exist_ok=True)
         
+        # OCR state: tesseract runs in worker processes, results cached by screenshot hash
+        self.ocr_on_action = OCR_ON_ACTION
+        self.ocr_executor: Optional[ProcessPoolExecutor] = None
+        self.ocr_cache: "OrderedDict[str, str]" = OrderedDict()
+        self.ocr_pending: Dict[str, asyncio.Future] = {}
+        self.last_screenshot: str = ""
+        
         # Register routes
         self.router.on_startup.append(self.startup)
         self.router.on_shutdown.append(self.shutdown)
@@ -326,6 +671,9 @@ class BrowserAutomation:
         
         # Drag and drop
         self.router.post("/automation/drag_drop")(self.drag_drop)
+        
+        # OCR
+        self.router.post("/automation/ocr")(self.ocr)
 
     async def startup(self):
         """Initialize the browser instance on startup"""
@@ -361,6 +709,7 @@ class BrowserAutomation:
                 print(f"Error finding existing page, creating new one. ( {page_error})")
                 page = await self.browser_context.new_page()
                 print("New page created successfully")
+                self.settler.track(page)
                 self.pages.append(page)
                 self.current_page_index = 0
                 # Navigate directly to google.com instead of about:blank
@@ -386,9 +735,13 @@ class BrowserAutomation:
             await self.browser_context.close()
         if self.browser:
             await self.browser.close()
+        if self.ocr_executor:
+            self.ocr_executor.shutdown(wait=False, cancel_futures=True)
+            self.ocr_executor = None
 
     async def handle_page_created(self, page: Page):
         """Handle new page creation"""
+        self.settler.track(page)
         await asyncio.sleep(0.5)
         self.pages.append(page)
         self.current_page_index = len(self.pages) - 1
@@ -400,8 +753,39 @@ class BrowserAutomation:
             raise HTTPException(status_code=500, detail="No browser pages available")
         return self.pages[self.current_page_index]
     
-    async def get_selector_map(self) -> Dict[int, DOMElementNode]:
+    async def get_compact_dom_state(self) -> DOMState:
+        """Get the DOM state from a single evaluate returning pre-serialized elements"""
+        page = await self.get_current_page()
+        snapshot = await page.evaluate(DOM_SNAPSHOT_JS, {
+            "attributes": SNAPSHOT_ATTRIBUTES,
+            "includeAttributes": self.include_attributes,
+            "maxElements": self.max_dom_elements
+        })
+        
+        elements = [CompactElementNode(*row) for row in snapshot['elements']]
+        print(f"Found {len(elements)} interactive elements in compact snapshot")
+        return DOMState(
+            element_tree=CompactElementTree(elements, snapshot.get('truncated', False)),
+            selector_map={element.highlight_index: element for element in elements},
+            url=page.url,
+            title=snapshot.get('title') or "",
+            pixels_above=snapshot.get('pixelsAbove', 0),
+            pixels_below=snapshot.get('pixelsBelow', 0),
+            viewport_width=snapshot.get('viewportWidth', 0),
+            viewport_height=snapshot.get('viewportHeight', 0)
+        )
+    
+    async def get_selector_map(self) -> Dict[int, DOMElementNode | CompactElementNode]:
         """Get a map of selectable elements on the page"""
+        if self.dom_snapshot_mode == "compact":
+            try:
+                return (await self.get_compact_dom_state()).selector_map
+            except Exception as e:
+                print(f"Error getting compact DOM snapshot, falling back to full: {e}")
+        return await self.get_full_selector_map()
+    
+    async def get_full_selector_map(self) -> Dict[int, DOMElementNode]:
+        """Get a map of selectable elements on the page as DOMElementNode trees"""
         page = await self.get_current_page()
         
         # Create a selector map for interactive elements
@@ -546,9 +930,16 @@ class BrowserAutomation:
     
     async def get_current_dom_state(self) -> DOMState:
         """Get the current DOM state including element tree and selector map"""
+        if self.dom_snapshot_mode == "compact":
+            try:
+                return await self.get_compact_dom_state()
+            except Exception as e:
+                print(f"Error getting compact DOM snapshot, falling back to full: {e}")
+                traceback.print_exc()
+        
         try:
             page = await self.get_current_page()
-            selector_map = await self.get_selector_map()
+            selector_map = await self.get_full_selector_map()
             
             # Create a root element
             root = DOMElementNode(
@@ -638,15 +1029,7 @@ class BrowserAutomation:
         try:
             page = await self.get_current_page()
             
-            # Wait for network to be idle and DOM to be stable
-            try:
-                await page.wait_for_load_state("networkidle", timeout=60000)  # Increased timeout to 60s
-            except Exception as e:
-                print(f"Warning: Network idle timeout, proceeding anyway: {e}")
-            
-            # Wait for any animations to complete
-            # await page.wait_for_timeout(1000)  # Wait 1 second for animations
-            
+            # The page has been settled by get_updated_browser_state
             # Take screenshot with increased timeout and better options
             screenshot_bytes = await page.screenshot(
                 type='jpeg',
@@ -678,35 +1061,58 @@ class BrowserAutomation:
             print(f"Error saving screenshot: {e}")
             return ""
     
+    def get_ocr_executor(self) -> ProcessPoolExecutor:
+        """Get the OCR process pool, starting it on first use"""
+        if self.ocr_executor is None:
+            # Spawned workers don't inherit the browser's threads and event loop
+            self.ocr_executor = ProcessPoolExecutor(
+                max_workers=OCR_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.ocr_executor
+    
     async def extract_ocr_text_from_screenshot(self, screenshot_base64: str) -> str:
-        """Extract text from screenshot using OCR"""
+        """Extract text from screenshot using OCR, off the event loop and cached by screenshot hash"""
         if not screenshot_base64:
             return ""
-            
+        
+        screenshot_hash = hashlib.sha256(screenshot_base64.encode()).hexdigest()
+        if screenshot_hash in self.ocr_cache:
+            self.ocr_cache.move_to_end(screenshot_hash)
+            return self.ocr_cache[screenshot_hash]
+        
+        # Concurrent requests for the same screenshot share one OCR run
+        future = self.ocr_pending.get(screenshot_hash)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.get_ocr_executor(), ocr_image, base64.b64decode(screenshot_base64))
+            self.ocr_pending[screenshot_hash] = future
+            future.add_done_callback(lambda _: self.ocr_pending.pop(screenshot_hash, None))
+        
         try:
-            # Decode base64 to image
-            image_bytes = base64.b64decode(screenshot_base64)
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            # Extract text using pytesseract
-            ocr_text = pytesseract.image_to_string(image)
-            
-            # Clean up the text
-            ocr_text = ocr_text.strip()
-            
-            return ocr_text
+            ocr_text = await asyncio.shield(future)
         except Exception as e:
             print(f"Error performing OCR: {e}")
             traceback.print_exc()
             return ""
+        
+        self.ocr_cache[screenshot_hash] = ocr_text
+        if len(self.ocr_cache) > OCR_CACHE_SIZE:
+            self.ocr_cache.popitem(last=False)
+        return ocr_text
     
     async def get_updated_browser_state(self, action_name: str) -> tuple:
         """Helper method to get updated browser state after any action
         Returns a tuple of (dom_state, screenshot, elements, metadata)
         """
         try:
-            # Wait a moment for any potential async processes to settle
-            await asyncio.sleep(0.5)
+            # Wait for the page to settle, within the budget of the action type
+            page = await self.get_current_page()
+            action_type = ACTION_SETTLE_TYPES.get(action_name.split("(")[0], "default")
+            settle = await self.settler.settle(page, action_type)
+            if not settle["settled"]:
+                print(f"Page not settled after {action_name} within {settle['elapsed_ms']} ms "
+                      f"(network quiet: {settle['network_quiet']}, DOM quiet: {settle['dom_quiet']})")
             
             # Get updated state
             dom_state = await self.get_current_dom_state()
@@ -718,7 +1124,6 @@ class BrowserAutomation:
             )
             
             # Collect additional metadata
-            page = await self.get_current_page()
             metadata = {}
             
             # Get element count
@@ -743,28 +1148,33 @@ class BrowserAutomation:
             
             metadata['interactive_elements'] = interactive_elements
             
-            # Get viewport dimensions - Fix syntax error in JavaScript
-            try:
-                viewport = await page.evaluate("""
-                () => {
-                    return {
-                        width: window.innerWidth,
-                        height: window.innerHeight
-                    };
-                }
-                """)
-                metadata['viewport_width'] = viewport.get('width', 0)
-                metadata['viewport_height'] = viewport.get('height', 0)
-            except Exception as e:
-                print(f"Error getting viewport dimensions: {e}")
-                metadata['viewport_width'] = 0
-                metadata['viewport_height'] = 0
+            # Get viewport dimensions, already part of compact snapshots
+            if dom_state.viewport_width is not None:
+                metadata['viewport_width'] = dom_state.viewport_width
+                metadata['viewport_height'] = dom_state.viewport_height
+            else:
+                try:
+                    viewport = await page.evaluate("""
+                    () => {
+                        return {
+                            width: window.innerWidth,
+                            height: window.innerHeight
+                        };
+                    }
+                    """)
+                    metadata['viewport_width'] = viewport.get('width', 0)
+                    metadata['viewport_height'] = viewport.get('height', 0)
+                except Exception as e:
+                    print(f"Error getting viewport dimensions: {e}")
+                    metadata['viewport_width'] = 0
+                    metadata['viewport_height'] = 0
             
-            # Extract OCR text from screenshot if available
-            ocr_text = ""
             if screenshot:
-                ocr_text = await self.extract_ocr_text_from_screenshot(screenshot)
-                metadata['ocr_text'] = ocr_text
+                self.last_screenshot = screenshot
+                metadata['screenshot_hash'] = hashlib.sha256(screenshot.encode()).hexdigest()
+                # OCR blocks for hundreds of ms, so it only runs here when enabled
+                if self.ocr_on_action:
+                    metadata['ocr_text'] = await self.extract_ocr_text_from_screenshot(screenshot)
             
             print(f"Got updated state after {action_name}: {len(dom_state.selector_map)} elements")
             return dom_state, screenshot, elements, metadata
@@ -794,6 +1204,7 @@ class BrowserAutomation:
             pixels_below=dom_state.pixels_below if dom_state else 0,
             content=content,
             ocr_text=metadata.get('ocr_text', ""),
+            screenshot_hash=metadata.get('screenshot_hash'),
             element_count=metadata.get('element_count', 0),
             interactive_elements=metadata.get('interactive_elements', []),
             viewport_width=metadata.get('viewport_width', 0),
@@ -807,7 +1218,6 @@ class BrowserAutomation:
         try:
             page = await self.get_current_page()
             await page.goto(action.url, wait_until="domcontentloaded")
-            await page.wait_for_load_state("networkidle", timeout=10000)
             
             # Get updated state after action
             dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"navigate_to({action.url})")
@@ -974,10 +1384,6 @@ class BrowserAutomation:
             # Perform the click at the specified coordinates
             await page.mouse.click(action.x, action.y)
             
-            # Give time for any navigation or DOM updates to occur
-            await page.wait_for_load_state("networkidle", timeout=5000)
-            
-            await asyncio.sleep(1)
             # Get updated state after action
             dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"click_coordinates({action.x}, {action.y})")
             
@@ -997,7 +1403,6 @@ class BrowserAutomation:
             
             # Try to get state even after error
             try:
-                await asyncio.sleep(1)
                 dom_state, screenshot, elements, metadata = await self.get_updated_browser_state("click_coordinates_error_recovery")
                 return self.build_action_result(
                     False,
@@ -1092,13 +1497,6 @@ class BrowserAutomation:
                  print(error_message)
 
 
-            # Wait for potential page changes/network activity
-            try:
-                await page.wait_for_load_state("networkidle", timeout=5000)
-            except Exception as wait_error:
-                print(f"Timeout or error waiting for network idle after click: {wait_error}")
-            await asyncio.sleep(1)
-
             # Get updated state after action
             dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"click_element({action.index})")
 
@@ -1182,7 +1580,6 @@ class BrowserAutomation:
                 # Fallback to xpath
                 await page.fill(f"//{element.tag_name}[{action.index}]", action.text)
             
-            await asyncio.sleep(1)
             # Get updated state after action
             dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"input_text({action.index}, '{action.text}')")
             
@@ -1214,7 +1611,6 @@ class BrowserAutomation:
             page = await self.get_current_page()
             await page.keyboard.press(action.keys)
             
-            await asyncio.sleep(1)
             # Get updated state after action
             dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"send_keys({action.keys})")
             
@@ -1291,11 +1687,11 @@ class BrowserAutomation:
             print(f"Attempting to open new tab with URL: {action.url}")
             # Create new page in same browser instance
             new_page = await self.browser_context.new_page()
+            self.settler.track(new_page)
             print(f"New page created successfully")
             
             # Navigate to the URL
             await new_page.goto(action.url, wait_until="domcontentloaded")
-            await new_page.wait_for_load_state("networkidle", timeout=10000)
             print(f"Navigated to URL in new tab: {action.url}")
             
             # Add to page list and make it current
@@ -1432,6 +1828,22 @@ class BrowserAutomation:
                 content=None
             )
     
+    async def ocr(self, action: OCRAction = Body(...)):
+        """Extract text from a screenshot using OCR, by default the latest action screenshot"""
+        screenshot = action.screenshot_base64 or self.last_screenshot
+        if not screenshot:
+            raise HTTPException(status_code=400, detail="No screenshot available for OCR")
+        
+        screenshot_hash = hashlib.sha256(screenshot.encode()).hexdigest()
+        cached = screenshot_hash in self.ocr_cache
+        ocr_text = await self.extract_ocr_text_from_screenshot(screenshot)
+        return {
+            "success": True,
+            "ocr_text": ocr_text,
+            "screenshot_hash": screenshot_hash,
+            "cached": cached
+        }
+    
     async def save_pdf(self):
         """Save the current page as a PDF"""
         try:
@@ -1481,8 +1893,6 @@ class BrowserAutomation:
                 await page.evaluate("window.scrollBy(0, window.innerHeight);")
                 amount_str = "one page"
             
-            await page.wait_for_timeout(500)  # Wait for scroll to complete
-            
             # Get updated state after action
             dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"scroll_down({amount_str})")
             
@@ -1519,8 +1929,6 @@ class BrowserAutomation:
                 await page.evaluate("window.scrollBy(0, -window.innerHeight);")
                 amount_str = "one page"
             
-            await page.wait_for_timeout(500)  # Wait for scroll to complete
-            
             # Get updated state after action
             dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"scroll_up({amount_str})")
             
@@ -1561,7 +1969,6 @@ class BrowserAutomation:
                 try:
                     if await locator.count() > 0 and await locator.first.is_visible():
                         await locator.first.scroll_into_view_if_needed()
-                        await asyncio.sleep(0.5)  # Wait for scroll to complete
                         found = True
                         break
                 except Exception:
@@ -1725,8 +2132,6 @@ class BrowserAutomation:
                 # Then try to click the option
                 await page.click(f"text={option_text}")
             
-            await page.wait_for_timeout(500)
-            
             # Get updated state after action
             dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"select_dropdown_option({index}, '{option_text}')")
             
@@ -1846,11 +2251,44 @@ api_app = FastAPI()
 
 @api_app.get("/api")
 async def health_check():
-    return {"status": "ok", "message": "API server is running"}
+    return {
+        "status": "ok",
+        "message": "API server is running",
+        "settle": automation_service.settler.stats()
+    }
 
 # Include automation service router with /api prefix
 api_app.include_router(automation_service.router, prefix="/api")
 
+@api_app.middleware("http")
+async def multipart_screenshot_response(request: Request, call_next):
+    """Return the screenshot as a binary part instead of base64 in the JSON when asked for
+    
+    Clients sending `Accept: multipart/mixed` get the action result as an
+    application/json part followed by an image/jpeg part. Results without a
+    screenshot are returned as plain JSON.
+    """
+    response = await call_next(request)
+    if "multipart/mixed" not in request.headers.get("accept", "") or \
+            response.headers.get("content-type") != "application/json":
+        return response
+    
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    result = json.loads(body)
+    screenshot = result.pop("screenshot_base64", None) if isinstance(result, dict) else None
+    if not screenshot:
+        return Response(content=body, status_code=response.status_code, media_type="application/json")
+    
+    boundary = uuid.uuid4().hex
+    content = b"".join([
+        f"--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode(),
+        json.dumps(result).encode(),
+        f"\r\n--{boundary}\r\nContent-Type: image/jpeg\r\nContent-Disposition: attachment; name=\"screenshot\"\r\n\r\n".encode(),
+        base64.b64decode(screenshot),
+        f"\r\n--{boundary}--\r\n".encode(),
+    ])
+    return Response(content=content, status_code=response.status_code, media_type=f"multipart/mixed; boundary={boundary}")
+
 async def test_browser_api():
     """Test the browser automation API functionality"""
     try:
@@ -1888,18 +2326,37 @@ async def test_browser_api():
         print(f"\nScreenshot captured: {'Yes' if result.screenshot_base64 else 'No'}")
         print(f"Viewport size: {result.viewport_width}x{result.viewport_height}")
         
-        # Test OCR extraction from screenshot
+        # Test OCR extraction from screenshot; this also starts the OCR workers
         print("\n--- Testing OCR Text Extraction ---")
-        if result.ocr_text:
+        ocr_text = await automation_service.extract_ocr_text_from_screenshot(result.screenshot_base64)
+        if ocr_text:
             print("OCR text extracted from screenshot:")
             print("=== OCR TEXT START ===")
-            print(result.ocr_text)
+            print(ocr_text)
             print("=== OCR TEXT END ===")
-            print(f"OCR text length: {len(result.ocr_text)} characters")
-            print(result.ocr_text)
+            print(f"OCR text length: {len(ocr_text)} characters")
         else:
             print("No OCR text extracted from screenshot")
         
+        # Measure action latency with and without OCR after each action
+        print("\n--- Testing Action Latency With/Without OCR ---")
+        latencies = {True: [], False: []}
+        for ocr_on_action in (True, False, True, False):
+            automation_service.ocr_on_action = ocr_on_action
+            start = time.perf_counter()
+            await automation_service.navigate_to(GoToUrlAction(url="https://www.youtube.com"))
+            latencies[ocr_on_action].append(time.perf_counter() - start)
+        automation_service.ocr_on_action = OCR_ON_ACTION
+        for ocr_on_action, label in ((False, "without OCR"), (True, "with OCR")):
+            runs = ", ".join(f"{latency * 1000:.0f} ms" for latency in latencies[ocr_on_action])
+            print(f"navigate_to {label}: {runs}")
+        
+        # The last action ran without OCR, so the first request computes it and the second hits the cache
+        for attempt in ("uncached", "cached"):
+            start = time.perf_counter()
+            ocr_result = await automation_service.ocr(OCRAction())
+            print(f"OCR endpoint ({attempt}): {(time.perf_counter() - start) * 1000:.0f} ms, cached={ocr_result['cached']}")
+        
         await asyncio.sleep(2)
         
         # Test search functionality
@@ -1913,10 +2370,11 @@ async def test_browser_api():
             print(f"Page title: {result.title}")
             
             # Test OCR extraction from search results
-            if result.ocr_text:
+            ocr_result = await automation_service.ocr(OCRAction())
+            if ocr_result["ocr_text"]:
                 print("\nOCR text from search results:")
                 print("=== OCR TEXT START ===")
-                print(result.ocr_text)
+                print(ocr_result["ocr_text"])
                 print("=== OCR TEXT END ===")
             else:
                 print("\nNo OCR text extracted from search results")
@@ -2091,6 +2549,70 @@ async def test_browser_api_2():
         await automation_service.shutdown()
         print("Browser closed")
 
+def build_dom_benchmark_fixture(sections: int = 2000) -> str:
+    """Build a large static page with interactive elements, text and hidden elements"""
+    rows = []
+    for i in range(sections):
+        rows.append(
+            f'<div class="row" id="row-{i}"><h3>Section {i}</h3>'
+            f'<p>Paragraph text for section {i} with some filler content to lay out.</p>'
+            f'<a href="/item/{i}" title="Item {i}">Item {i}</a> '
+            f'<button type="button" name="action-{i}">Action {i}</button> '
+            f'<input type="text" name="field-{i}" placeholder="Field {i}"> '
+            f'<span role="button" tabindex="0" aria-label="Toggle {i}"></span>'
+            f'<a href="/hidden/{i}" style="display:none">Hidden {i}</a></div>'
+        )
+    return f"<!DOCTYPE html><html><head><title>DOM benchmark</title></head><body>{''.join(rows)}</body></html>"
+
+async def benchmark_dom_snapshot(iterations: int = 5):
+    """Benchmark full vs compact DOM state extraction on a large page served locally"""
+    import tempfile
+    import threading
+    import tracemalloc
+    from functools import partial
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+    
+    fixture_dir = tempfile.mkdtemp()
+    with open(os.path.join(fixture_dir, "index.html"), "w") as f:
+        f.write(build_dom_benchmark_fixture())
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(SimpleHTTPRequestHandler, directory=fixture_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    
+    try:
+        print("\n=== Starting DOM Snapshot Benchmark ===")
+        await automation_service.startup()
+        page = await automation_service.get_current_page()
+        await page.goto(f"http://127.0.0.1:{server.server_port}/index.html", wait_until="load")
+        
+        for mode, max_elements in (("full", 0), ("compact", 0), ("compact", 500)):
+            automation_service.dom_snapshot_mode = mode
+            automation_service.max_dom_elements = max_elements
+            timings = []
+            for _ in range(iterations):
+                tracemalloc.start()
+                start = time.perf_counter()
+                dom_state = await automation_service.get_current_dom_state()
+                dom_state.element_tree.clickable_elements_to_string(include_attributes=automation_service.include_attributes)
+                timings.append(time.perf_counter() - start)
+                _, peak_memory = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            
+            label = f"{mode}" + (f" (max {max_elements})" if max_elements else "")
+            print(f"{label}: {len(dom_state.selector_map)} elements, "
+                  f"mean {sum(timings) / len(timings) * 1000:.0f} ms, min {min(timings) * 1000:.0f} ms, "
+                  f"peak Python memory {peak_memory / 1024:.0f} KiB")
+        
+        automation_service.dom_snapshot_mode = DOM_SNAPSHOT_MODE
+        automation_service.max_dom_elements = DOM_MAX_ELEMENTS
+    except Exception as e:
+        print(f"\n❌ Benchmark failed: {str(e)}")
+        traceback.print_exc()
+    finally:
+        print("\n--- Cleaning up ---")
+        server.shutdown()
+        await automation_service.shutdown()
+        print("Browser closed")
+
 if __name__ == '__main__':
     import uvicorn
     import sys
@@ -2098,6 +2620,7 @@ if __name__ == '__main__':
     # Check command line arguments for test mode
     test_mode_1 = "--test" in sys.argv
     test_mode_2 = "--test2" in sys.argv
+    bench_mode = "--bench" in sys.argv
     
     if test_mode_1:
         print("Running in test mode 1")
@@ -2105,6 +2628,9 @@ if __name__ == '__main__':
     elif test_mode_2:
         print("Running in test mode 2 (Chess Page)")
         asyncio.run(test_browser_api_2())
+    elif bench_mode:
+        print("Running DOM snapshot benchmark")
+        asyncio.run(benchmark_dom_snapshot())
     else:
         print("Starting API server")
         uvicorn.run("browser_api:api_app", host="0.0.0.0", port=8003)
\ No newline at end of file
@@ -5,16 +5,22 @@ stripe listen --forward-to localhost:8000/api/billing/webhook
 """
 
 from fastapi import APIRouter, HTTPException, Depends, Request
-from typing import Optional, Dict, Tuple
+from typing import Optional, Dict, Tuple, NamedTuple
+from functools import lru_cache
+import asyncio
+import json
 import stripe
 from datetime import datetime, timezone
 from utils.logger import logger
 from utils.config import config, EnvMode
 from services.supabase import DBConnection
+from services import redis
+from services.usage_ledger import usage_ledger
 from utils.auth_utils import get_current_user_id_from_jwt
 from pydantic import BaseModel
 from utils.constants import MODEL_ACCESS_TIERS, MODEL_NAME_ALIASES, HARDCODED_MODEL_PRICES
 from litellm.cost_calculator import cost_per_token
+from litellm.utils import get_model_info
 import time
 
 # Initialize Stripe
@@ -23,6 +29,9 @@ stripe.api_key = config.STRIPE_SECRET_KEY
 # Token price multiplier
 TOKEN_PRICE_MULTIPLIER = 1.5
 
+# Redis key prefix of cached subscription state, see get_subscription_state
+SUBSCRIPTION_CACHE_PREFIX = "billing:subscription:"
+
 # Initialize router
 router = APIRouter(prefix="/billing", tags=["billing"])
 
@@ -102,7 +111,8 @@ async def get_stripe_customer_id(client, user_id: str) -> Optional[str]:
 async def create_stripe_customer(client, user_id: str, email: str) -> str:
     """Create a new Stripe customer for a user."""
     # Create customer in Stripe
-    customer = stripe.Customer.create(
+    customer = await stripe_call(
+        stripe.Customer.create,
         email=email,
         metadata={"user_id": user_id}
     )
@@ -117,83 +127,124 @@ async def create_stripe_customer(client, user_id: str, email: str) -> str:
     
     return customer.id
 
-async def get_user_subscription(user_id: str) -> Optional[Dict]:
-    """Get the current subscription for a user from Stripe."""
-    try:
-        # Get customer ID
-        db = DBConnection()
-        client = await db.client
-        customer_id = await get_stripe_customer_id(client, user_id)
+async def stripe_call(method, *args, **kwargs):
+    """Run a blocking Stripe SDK call in a worker thread so it doesn't stall the event loop."""
+    return await asyncio.to_thread(method, *args, **kwargs)
+
+async def _fetch_user_subscription(user_id: str) -> Optional[Dict]:
+    """Get the current subscription for a user from Stripe. Raises on Stripe or database errors."""
+    # Get customer ID
+    db = DBConnection()
+    client = await db.client
+    customer_id = await get_stripe_customer_id(client, user_id)
+    
+    if not customer_id:
+        return None
         
-        if not customer_id:
-            return None
-            
-        # Get all active subscriptions for the customer
-        subscriptions = stripe.Subscription.list(
-            customer=customer_id,
-            status='active'
-        )
-        # print("Found subscriptions:", subscriptions)
+    # Get all active subscriptions for the customer
+    subscriptions = await stripe_call(
+        stripe.Subscription.list,
+        customer=customer_id,
+        status='active'
+    )
+    
+    # Check if we have any subscriptions
+    if not subscriptions or not subscriptions.get('data'):
+        return None
         
-        # Check if we have any subscriptions
-        if not subscriptions or not subscriptions.get('data'):
-            return None
-            
-        # Filter subscriptions to only include our product's subscriptions
-        our_subscriptions = []
-        for sub in subscriptions['data']:
-            # Get the first subscription item
-            if sub.get('items') and sub['items'].get('data') and len(sub['items']['data']) > 0:
-                item = sub['items']['data'][0]
-                if item.get('price') and item['price'].get('id') in [
-                    config.STRIPE_FREE_TIER_ID,
-                    config.STRIPE_TIER_2_20_ID,
-                    config.STRIPE_TIER_6_50_ID,
-                    config.STRIPE_TIER_12_100_ID,
-                    config.STRIPE_TIER_25_200_ID,
-                    config.STRIPE_TIER_50_400_ID,
-                    config.STRIPE_TIER_125_800_ID,
-                    config.STRIPE_TIER_200_1000_ID,
-                    # Yearly tiers
-                    config.STRIPE_TIER_2_20_YEARLY_ID,
-                    config.STRIPE_TIER_6_50_YEARLY_ID,
-                    config.STRIPE_TIER_12_100_YEARLY_ID,
-                    config.STRIPE_TIER_25_200_YEARLY_ID,
-                    config.STRIPE_TIER_50_400_YEARLY_ID,
-                    config.STRIPE_TIER_125_800_YEARLY_ID,
-                    config.STRIPE_TIER_200_1000_YEARLY_ID
-                ]:
-                    our_subscriptions.append(sub)
+    # Filter subscriptions to only include our product's subscriptions
+    our_subscriptions = []
+    for sub in subscriptions['data']:
+        # Get the first subscription item
+        if sub.get('items') and sub['items'].get('data') and len(sub['items']['data']) > 0:
+            item = sub['items']['data'][0]
+            if item.get('price') and item['price'].get('id') in SUBSCRIPTION_TIERS:
+                our_subscriptions.append(sub)
+    
+    if not our_subscriptions:
+        return None
         
-        if not our_subscriptions:
-            return None
-            
-        # If there are multiple active subscriptions, we need to handle this
-        if len(our_subscriptions) > 1:
-            logger.warning(f"User {user_id} has multiple active subscriptions: {[sub['id'] for sub in our_subscriptions]}")
-            
-            # Get the most recent subscription
-            most_recent = max(our_subscriptions, key=lambda x: x['created'])
-            
-            # Cancel all other subscriptions
-            for sub in our_subscriptions:
-                if sub['id'] != most_recent['id']:
-                    try:
-                        stripe.Subscription.modify(
-                            sub['id'],
-                            cancel_at_period_end=True
-                        )
-                        logger.info(f"Cancelled subscription {sub['id']} for user {user_id}")
-                    except Exception as e:
-                        logger.error(f"Error cancelling subscription {sub['id']}: {str(e)}")
-            
-            return most_recent
-            
-        return our_subscriptions[0]
+    # If there are multiple active subscriptions, we need to handle this
+    if len(our_subscriptions) > 1:
+        logger.warning(f"User {user_id} has multiple active subscriptions: {[sub['id'] for sub in our_subscriptions]}")
         
+        # Get the most recent subscription
+        most_recent = max(our_subscriptions, key=lambda x: x['created'])
+        
+        # Cancel all other subscriptions
+        for sub in our_subscriptions:
+            if sub['id'] != most_recent['id']:
+                try:
+                    await stripe_call(
+                        stripe.Subscription.modify,
+                        sub['id'],
+                        cancel_at_period_end=True
+                    )
+                    logger.info(f"Cancelled subscription {sub['id']} for user {user_id}")
+                except Exception as e:
+                    logger.error(f"Error cancelling subscription {sub['id']}: {str(e)}")
+        
+        return most_recent
+        
+    return our_subscriptions[0]
+
+def _subscription_cache_key(user_id: str) -> str:
+    return f"{SUBSCRIPTION_CACHE_PREFIX}{user_id}"
+
+def _subscription_state(subscription: Optional[Dict]) -> Dict:
+    """Build the cached state for a subscription: the subscription itself plus its price ID and tier name."""
+    price_id = config.STRIPE_FREE_TIER_ID
+    if subscription and subscription.get('items') and subscription['items'].get('data'):
+        price_id = subscription['items']['data'][0]['price']['id']
+    tier_info = SUBSCRIPTION_TIERS.get(price_id)
+    return {
+        'subscription': subscription,
+        'price_id': price_id,
+        'tier_name': tier_info['name'] if tier_info else 'free',
+    }
+
+async def get_subscription_state(user_id: str) -> Dict:
+    """
+    Get a user's subscription, price ID and tier name, served from Redis when cached.
+    
+    Cache entries are dropped by the Stripe webhook and by subscription changes made
+    through this API, so the agent start path normally makes no Stripe calls. If Stripe
+    can't be reached the user is treated as having no subscription and nothing is cached.
+    """
+    key = _subscription_cache_key(user_id)
+    try:
+        cached = await redis.get(key)
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        logger.warning(f"Failed to read subscription cache for user {user_id}: {str(e)}")
+
+    try:
+        subscription = await _fetch_user_subscription(user_id)
     except Exception as e:
         logger.error(f"Error getting subscription from Stripe: {str(e)}")
-        return None
+        return _subscription_state(None)
+
+    # Stripe objects are dicts; round-trip through JSON so cached and fresh states look the same
+    state = json.loads(json.dumps(_subscription_state(subscription), default=str))
+    try:
+        await redis.set(key, json.dumps(state), ex=config.BILLING_SUBSCRIPTION_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Failed to write subscription cache for user {user_id}: {str(e)}")
+    return state
+
+async def invalidate_subscription_cache(user_id: str):
+    """Drop a user's cached subscription state after it changed in Stripe."""
+    try:
+        await redis.delete(_subscription_cache_key(user_id))
+        logger.debug(f"Invalidated subscription cache for user {user_id}")
+    except Exception as e:
+        logger.warning(f"Failed to invalidate subscription cache for user {user_id}: {str(e)}")
+
+async def get_user_subscription(user_id: str) -> Optional[Dict]:
+    """Get the current subscription for a user (cached, see get_subscription_state)."""
+    state = await get_subscription_state(user_id)
+    return state['subscription']
 
 async def calculate_monthly_usage(client, user_id: str) -> float:
     """Calculate total agent run minutes for the current month for a user."""
@@ -228,17 +279,22 @@ async def calculate_monthly_usage(client, user_id: str) -> float:
     return total_cost
 
 
-async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: int = 1000) -> Dict:
-    """Get detailed usage logs for a user with pagination."""
+def get_usage_period_start(now: Optional[datetime] = None) -> datetime:
+    """Start of the current billing usage period: the start of the month in UTC."""
     # Get start of current month in UTC
-    now = datetime.now(timezone.utc)
+    now = now or datetime.now(timezone.utc)
     start_of_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
     
     # Use fixed cutoff date: June 26, 2025 midnight UTC
     # Ignore all token counts before this date
     cutoff_date = datetime(2025, 6, 30, 9, 0, 0, tzinfo=timezone.utc)
     
-    start_of_month = max(start_of_month, cutoff_date)
+    return max(start_of_month, cutoff_date)
+
+
+async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: int = 1000) -> Dict:
+    """Get detailed usage logs for a user with pagination."""
+    start_of_month = get_usage_period_start()
     
     # First get all threads for this user in batches
     batch_size = 1000
@@ -346,6 +402,93 @@ async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: in
     }
 
 
+class ModelPrice(NamedTuple):
+    """Per-token prices of a model, TOKEN_PRICE_MULTIPLIER included."""
+    input_cost_per_token: float
+    output_cost_per_token: float
+    # Set when litellm prices the model in tiers by prompt size; such costs
+    # are computed by litellm under this name instead of from the flat prices
+    tiered_model: Optional[str] = None
+
+
+def _litellm_model_variants(model: str, resolved_model: str) -> list[str]:
+    """Model names to try with litellm, most specific first."""
+    models_to_try = [model]
+    
+    # Add resolved model if different
+    if resolved_model != model:
+        models_to_try.append(resolved_model)
+    
+    # Try without provider prefix if it has one
+    if '/' in model:
+        models_to_try.append(model.split('/', 1)[1])
+    if '/' in resolved_model and resolved_model != model:
+        models_to_try.append(resolved_model.split('/', 1)[1])
+        
+    # Special handling for Google models accessed via OpenRouter
+    if model.startswith('openrouter/google/'):
+        models_to_try.append(model.replace('openrouter/', ''))
+    if resolved_model.startswith('openrouter/google/'):
+        models_to_try.append(resolved_model.replace('openrouter/', ''))
+    return models_to_try
+
+
+def _has_tiered_pricing(model_name: str) -> bool:
+    try:
+        model_info = get_model_info(model_name)
+    except Exception:
+        return False
+    return any('above' in key and value for key, value in model_info.items() if key.endswith('_tokens'))
+
+
+@lru_cache(maxsize=None)
+def get_model_price(model: str) -> Optional[ModelPrice]:
+    """
+    Resolve the per-token prices of a model name, or None if it has no known pricing.
+    
+    Resolution follows MODEL_NAME_ALIASES, then HARDCODED_MODEL_PRICES, then litellm's
+    cost map under several name variants. Results are memoized per model string, so
+    each distinct model in the usage logs is resolved once per process.
+    """
+    # Try to resolve the model name using MODEL_NAME_ALIASES first
+    resolved_model = MODEL_NAME_ALIASES.get(model, model)
+
+    # Check if we have hardcoded pricing for this model (try both original and resolved)
+    hardcoded_pricing = get_model_pricing(model) or get_model_pricing(resolved_model)
+    if hardcoded_pricing:
+        input_cost_per_million, output_cost_per_million = hardcoded_pricing
+        return ModelPrice(
+            input_cost_per_million / 1_000_000 * TOKEN_PRICE_MULTIPLIER,
+            output_cost_per_million / 1_000_000 * TOKEN_PRICE_MULTIPLIER,
+        )
+
+    # Use litellm pricing as fallback - try each model name variation until we find one that works
+    for model_name in _litellm_model_variants(model, resolved_model):
+        try:
+            input_cost, output_cost = cost_per_token(model_name, 1, 1)
+        except Exception as e:
+            logger.debug(f"Failed to get pricing for model variation {model_name}: {str(e)}")
+            continue
+        if input_cost is not None and output_cost is not None:
+            return ModelPrice(
+                input_cost * TOKEN_PRICE_MULTIPLIER,
+                output_cost * TOKEN_PRICE_MULTIPLIER,
+                model_name if _has_tiered_pricing(model_name) else None,
+            )
+
+    logger.warning(f"Could not get pricing for model {model} (resolved: {resolved_model}), costs will be 0")
+    return None
+
+
+def _build_pricing_table():
+    """Resolve the prices of all configured models up front so requests only hit the memo."""
+    start_time = time.time()
+    models = set(MODEL_NAME_ALIASES) | set(MODEL_NAME_ALIASES.values()) | set(HARDCODED_MODEL_PRICES)
+    for model in models:
+        get_model_price(model)
+    logger.debug(f"Resolved pricing of {len(models)} models in {time.time() - start_time:.3f} seconds")
+
+
 def calculate_token_cost(prompt_tokens: int, completion_tokens: int, model: str) -> float:
     """Calculate the cost for tokens using the same logic as the monthly usage calculation."""
     try:
@@ -353,65 +496,20 @@ def calculate_token_cost(prompt_tokens: int, completion_tokens: int, model: str)
         prompt_tokens = int(prompt_tokens) if prompt_tokens is not None else 0
         completion_tokens = int(completion_tokens) if completion_tokens is not None else 0
         
-        # Try to resolve the model name using MODEL_NAME_ALIASES first
-        resolved_model = MODEL_NAME_ALIASES.get(model, model)
-
-        # Check if we have hardcoded pricing for this model (try both original and resolved)
-        hardcoded_pricing = get_model_pricing(model) or get_model_pricing(resolved_model)
-        if hardcoded_pricing:
-            input_cost_per_million, output_cost_per_million = hardcoded_pricing
-            input_cost = (prompt_tokens / 1_000_000) * input_cost_per_million
-            output_cost = (completion_tokens / 1_000_000) * output_cost_per_million
-            message_cost = input_cost + output_cost
-        else:
-            # Use litellm pricing as fallback - try multiple variations
-            try:
-                models_to_try = [model]
-                
-                # Add resolved model if different
-                if resolved_model != model:
-                    models_to_try.append(resolved_model)
-                
-                # Try without provider prefix if it has one
-                if '/' in model:
-                    models_to_try.append(model.split('/', 1)[1])
-                if '/' in resolved_model and resolved_model != model:
-                    models_to_try.append(resolved_model.split('/', 1)[1])
-                    
-                # Special handling for Google models accessed via OpenRouter
-                if model.startswith('openrouter/google/'):
-                    google_model_name = model.replace('openrouter/', '')
-                    models_to_try.append(google_model_name)
-                if resolved_model.startswith('openrouter/google/'):
-                    google_model_name = resolved_model.replace('openrouter/', '')
-                    models_to_try.append(google_model_name)
-                
-                # Try each model name variation until we find one that works
-                message_cost = None
-                for model_name in models_to_try:
-                    try:
-                        prompt_token_cost, completion_token_cost = cost_per_token(model_name, prompt_tokens, completion_tokens)
-                        if prompt_token_cost is not None and completion_token_cost is not None:
-                            message_cost = prompt_token_cost + completion_token_cost
-                            break
-                    except Exception as e:
-                        logger.debug(f"Failed to get pricing for model variation {model_name}: {str(e)}")
-                        continue
-                
-                if message_cost is None:
-                    logger.warning(f"Could not get pricing for model {model} (resolved: {resolved_model}), returning 0 cost")
-                    return 0.0
-                    
-            except Exception as e:
-                logger.warning(f"Could not get pricing for model {model} (resolved: {resolved_model}): {str(e)}, returning 0 cost")
-                return 0.0
-        
-        # Apply the TOKEN_PRICE_MULTIPLIER
-        return message_cost * TOKEN_PRICE_MULTIPLIER
+        price = get_model_price(model)
+        if price is None:
+            return 0.0
+        if price.tiered_model:
+            prompt_token_cost, completion_token_cost = cost_per_token(price.tiered_model, prompt_tokens, completion_tokens)
+            return (prompt_token_cost + completion_token_cost) * TOKEN_PRICE_MULTIPLIER
+        return prompt_tokens * price.input_cost_per_token + completion_tokens * price.output_cost_per_token
     except Exception as e:
         logger.error(f"Error calculating token cost for model {model}: {str(e)}")
         return 0.0
 
+
+_build_pricing_table()
+
 async def get_allowed_models_for_user(client, user_id: str):
     """
     Get the list of models allowed for a user based on their subscription tier.
@@ -420,20 +518,8 @@ async def get_allowed_models_for_user(client, user_id: str):
         List of model names allowed for the user's subscription tier.
     """
 
-    subscription = await get_user_subscription(user_id)
-    tier_name = 'free'
-    
-    if subscription:
-        price_id = None
-        if subscription.get('items') and subscription['items'].get('data') and len(subscription['items']['data']) > 0:
-            price_id = subscription['items']['data'][0]['price']['id']
-        else:
-            price_id = subscription.get('price_id', config.STRIPE_FREE_TIER_ID)
-        
-        # Get tier info for this price_id
-        tier_info = SUBSCRIPTION_TIERS.get(price_id)
-        if tier_info:
-            tier_name = tier_info['name']
+    state = await get_subscription_state(user_id)
+    tier_name = state['tier_name']
     
     # Return allowed models for this tier
     return MODEL_ACCESS_TIERS.get(tier_name, MODEL_ACCESS_TIERS['free'])  # Default to free tier if unknown
@@ -470,9 +556,9 @@ async def check_billing_status(client, user_id: str) -> Tuple[bool, str, Optiona
             "minutes_limit": "no limit"
         }
     
-    # Get current subscription
-    subscription = await get_user_subscription(user_id)
-    # print("Current subscription:", subscription)
+    # Get current subscription (cached, no Stripe call on a warm cache)
+    state = await get_subscription_state(user_id)
+    subscription = state['subscription']
     
     # If no subscription, they can use free tier
     if not subscription:
@@ -481,21 +567,15 @@ async def check_billing_status(client, user_id: str) -> Tuple[bool, str, Optiona
             'plan_name': 'free'
         }
     
-    # Extract price ID from subscription items
-    price_id = None
-    if subscription.get('items') and subscription['items'].get('data') and len(subscription['items']['data']) > 0:
-        price_id = subscription['items']['data'][0]['price']['id']
-    else:
-        price_id = subscription.get('price_id', config.STRIPE_FREE_TIER_ID)
-    
     # Get tier info - default to free tier if not found
+    price_id = state['price_id']
     tier_info = SUBSCRIPTION_TIERS.get(price_id)
     if not tier_info:
         logger.warning(f"Unknown subscription tier: {price_id}, defaulting to free tier")
         tier_info = SUBSCRIPTION_TIERS[config.STRIPE_FREE_TIER_ID]
     
-    # Calculate current month's usage
-    current_usage = await calculate_monthly_usage(client, user_id)
+    # Current month's usage from the ledger
+    current_usage = await usage_ledger.get_monthly_usage(client, user_id)
     
     # Check if within limits
     if current_usage >= tier_info['cost']:
@@ -526,7 +606,7 @@ async def create_checkout_session(
          
         # Get the target price and product ID
         try:
-            price = stripe.Price.retrieve(request.price_id, expand=['product'])
+            price = await stripe_call(stripe.Price.retrieve, request.price_id, expand=['product'])
             product_id = price['product']['id']
         except stripe.error.InvalidRequestError:
             raise HTTPException(status_code=400, detail=f"Invalid price ID: {request.price_id}")
@@ -561,13 +641,14 @@ async def create_checkout_session(
                     }
                 
                 # Get current and new price details
-                current_price = stripe.Price.retrieve(current_price_id)
+                current_price = await stripe_call(stripe.Price.retrieve, current_price_id)
                 new_price = price # Already retrieved
                 is_upgrade = new_price['unit_amount'] > current_price['unit_amount']
 
                 if is_upgrade:
                     # --- Handle Upgrade --- Immediate modification
-                    updated_subscription = stripe.Subscription.modify(
+                    updated_subscription = await stripe_call(
+                        stripe.Subscription.modify,
                         subscription_id,
                         items=[{
                             'id': subscription_item['id'],
@@ -582,10 +663,11 @@ async def create_checkout_session(
                         {'active': True}
                     ).eq('id', customer_id).execute()
                     logger.info(f"Updated customer {customer_id} active status to TRUE after subscription upgrade")
+                    await invalidate_subscription_cache(current_user_id)
                     
                     latest_invoice = None
                     if updated_subscription.get('latest_invoice'):
-                       latest_invoice = stripe.Invoice.retrieve(updated_subscription['latest_invoice']) 
+                       latest_invoice = await stripe_call(stripe.Invoice.retrieve, updated_subscription['latest_invoice']) 
                     
                     return {
                         "subscription_id": updated_subscription['id'],
@@ -611,12 +693,12 @@ async def create_checkout_session(
                         
                         # Retrieve the subscription again to get the schedule ID if it exists
                         # This ensures we have the latest state before creating/modifying schedule
-                        sub_with_schedule = stripe.Subscription.retrieve(subscription_id)
+                        sub_with_schedule = await stripe_call(stripe.Subscription.retrieve, subscription_id)
                         schedule_id = sub_with_schedule.get('schedule')
 
                         # Get the current phase configuration from the schedule or subscription
                         if schedule_id:
-                            schedule = stripe.SubscriptionSchedule.retrieve(schedule_id)
+                            schedule = await stripe_call(stripe.SubscriptionSchedule.retrieve, schedule_id)
                             # Find the current phase in the schedule
                             # This logic assumes simple schedules; might need refinement for complex ones
                             current_phase = None
@@ -681,7 +763,8 @@ async def create_checkout_session(
                             logger.info(f"Updating existing schedule {schedule_id} for subscription {subscription_id}")
                             logger.debug(f"Current phase data: {current_phase_update_data}")
                             logger.debug(f"New phase data: {new_downgrade_phase_data}")
-                            updated_schedule = stripe.SubscriptionSchedule.modify(
+                            updated_schedule = await stripe_call(
+                                stripe.SubscriptionSchedule.modify,
                                 schedule_id,
                                 phases=[current_phase_update_data, new_downgrade_phase_data],
                                 end_behavior='release' 
@@ -696,7 +779,8 @@ async def create_checkout_session(
                             logger.debug(f"Current price: {current_price_id}, New price: {request.price_id}")
                             
                             try:
-                                updated_schedule = stripe.SubscriptionSchedule.create(
+                                updated_schedule = await stripe_call(
+                                    stripe.SubscriptionSchedule.create,
                                     from_subscription=subscription_id,
                                     phases=[
                                         {
@@ -728,13 +812,16 @@ async def create_checkout_session(
                                 # print(f"Created new schedule {updated_schedule['id']} from subscription {subscription_id}")
                                 
                                 # Verify the schedule was created correctly
-                                fetched_schedule = stripe.SubscriptionSchedule.retrieve(updated_schedule['id'])
+                                fetched_schedule = await stripe_call(stripe.SubscriptionSchedule.retrieve, updated_schedule['id'])
                                 logger.info(f"Schedule verification - Status: {fetched_schedule.get('status')}, Phase Count: {len(fetched_schedule.get('phases', []))}")
                                 logger.debug(f"Schedule details: {fetched_schedule}")
                             except Exception as schedule_error:
                                 logger.exception(f"Failed to create schedule: {str(schedule_error)}")
                                 raise schedule_error  # Re-raise to be caught by the outer try-except
                         
+                        # The subscription now references the schedule
+                        await invalidate_subscription_cache(current_user_id)
+                        
                         return {
                             "subscription_id": subscription_id,
                             "schedule_id": updated_schedule['id'],
@@ -756,7 +843,8 @@ async def create_checkout_session(
                 raise HTTPException(status_code=500, detail=f"Error updating subscription: {str(e)}")
         else:
             
-            session = stripe.checkout.Session.create(
+            session = await stripe_call(
+                stripe.checkout.Session.create,
                 customer=customer_id,
                 payment_method_types=['card'],
                     line_items=[{'price': request.price_id, 'quantity': 1}],
@@ -808,7 +896,7 @@ async def create_portal_session(
         # Ensure the portal configuration has subscription_update enabled
         try:
             # First, check if we have a configuration that already enables subscription update
-            configurations = stripe.billing_portal.Configuration.list(limit=100)
+            configurations = await stripe_call(stripe.billing_portal.Configuration.list, limit=100)
             active_config = None
             
             # Look for a configuration with subscription_update enabled
@@ -827,7 +915,8 @@ async def create_portal_session(
                     default_config = configurations['data'][0]
                     logger.info(f"Updating default portal configuration: {default_config['id']} to enable subscription_update")
                     
-                    active_config = stripe.billing_portal.Configuration.update(
+                    active_config = await stripe_call(
+                        stripe.billing_portal.Configuration.update,
                         default_config['id'],
                         features={
                             'subscription_update': {
@@ -844,7 +933,8 @@ async def create_portal_session(
                 else:
                     # Create a new configuration with subscription_update enabled
                     logger.info("Creating new portal configuration with subscription_update enabled")
-                    active_config = stripe.billing_portal.Configuration.create(
+                    active_config = await stripe_call(
+                        stripe.billing_portal.Configuration.create,
                         business_profile={
                             'headline': 'Subscription Management',
                             'privacy_policy_url': config.FRONTEND_URL + '/privacy',
@@ -882,7 +972,7 @@ async def create_portal_session(
             portal_params["configuration"] = active_config['id']
         
         # Create the session
-        session = stripe.billing_portal.Session.create(**portal_params)
+        session = await stripe_call(stripe.billing_portal.Session.create, **portal_params)
         
         return {"url": session.url}
         
@@ -903,7 +993,7 @@ async def get_subscription(
         # Calculate current usage
         db = DBConnection()
         client = await db.client
-        current_usage = await calculate_monthly_usage(client, current_user_id)
+        current_usage = await usage_ledger.get_monthly_usage(client, current_user_id)
 
         if not subscription:
             # Default to free tier status if no active subscription for our product
@@ -944,7 +1034,7 @@ async def get_subscription(
         schedule_id = subscription.get('schedule')
         if schedule_id:
             try:
-                schedule = stripe.SubscriptionSchedule.retrieve(schedule_id)
+                schedule = await stripe_call(stripe.SubscriptionSchedule.retrieve, schedule_id)
                 # Find the *next* phase after the current one
                 next_phase = None
                 current_phase_end = current_item['current_period_end']
@@ -1044,11 +1134,13 @@ async def stripe_webhook(request: Request):
                 else:
                     # Subscription is not active (e.g., past_due, canceled, etc.)
                     # Check if customer has any other active subscriptions before updating status
-                    has_active = len(stripe.Subscription.list(
+                    active_subscriptions = await stripe_call(
+                        stripe.Subscription.list,
                         customer=customer_id,
                         status='active',
                         limit=1
-                    ).get('data', [])) > 0
+                    )
+                    has_active = len(active_subscriptions.get('data', [])) > 0
                     
                     if not has_active:
                         await client.schema('basejump').from_('billing_customers').update(
@@ -1058,11 +1150,13 @@ async def stripe_webhook(request: Request):
             
             elif event.type == 'customer.subscription.deleted':
                 # Check if customer has any other active subscriptions
-                has_active = len(stripe.Subscription.list(
+                active_subscriptions = await stripe_call(
+                    stripe.Subscription.list,
                     customer=customer_id,
                     status='active',
                     limit=1
-                ).get('data', [])) > 0
+                )
+                has_active = len(active_subscriptions.get('data', [])) > 0
                 
                 if not has_active:
                     # If no active subscriptions left, set active to false
@@ -1071,6 +1165,14 @@ async def stripe_webhook(request: Request):
                     ).eq('id', customer_id).execute()
                     logger.info(f"Webhook: Updated customer {customer_id} active status to FALSE after subscription deletion")
             
+            # Drop the cached subscription state so the next billing check sees the change
+            customer = await client.schema('basejump').from_('billing_customers') \
+                .select('account_id') \
+                .eq('id', customer_id) \
+                .execute()
+            for row in customer.data or []:
+                await invalidate_subscription_cache(row['account_id'])
+            
             logger.info(f"Processed {event.type} event for customer {customer_id}")
         
         return {"status": "success"}
@@ -0,0 +1,145 @@
+"""
+Process-wide pooled HTTP clients for outbound integrations.
+
+Creating an ``httpx.AsyncClient`` per request pays a TCP and TLS handshake on
+every call. The registry hands out long-lived named clients instead, each
+with its own keep-alive connection pool, limits and timeouts, and HTTP/2
+(``httpx[http2]``) unless the spec turns it off. Each named client talks to
+one service, so its pool limits are effectively per-host limits.
+
+The registry is initialized in the API lifespan and the worker init and
+closed on shutdown; clients requested before that are created on first use.
+
+Usage:
+    client = http_clients.get("smithery")
+    response = await client.get(url, params=params)
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict
+
+import httpx
+
+from utils.logger import logger
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+@dataclass(frozen=True)
+class ClientSpec:
+    timeout: float = 30.0
+    connect_timeout: float = 10.0
+    max_connections: int = 50
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 60.0
+    http2: bool = True
+    follow_redirects: bool = False
+
+
+CLIENT_SPECS: Dict[str, ClientSpec] = {
+    # Anything without a dedicated client
+    "default": ClientSpec(),
+    # Smithery registry (mcp_service.api)
+    "smithery": ClientSpec(max_connections=20),
+    # Pipedream MCP registry (pipedream.search_utils)
+    "pipedream": ClientSpec(max_connections=20),
+    # Firecrawl scrapes are slow and run several URLs in parallel
+    "firecrawl": ClientSpec(timeout=120.0, max_connections=20),
+    # RapidAPI data providers (agent.tools.data_providers)
+    "rapidapi": ClientSpec(max_connections=50),
+    # Sandbox browser automation API through sandbox preview URLs (sandbox.browser_client)
+    "sandbox_browser": ClientSpec(max_connections=50),
+    # Arbitrary image URLs; many hosts, so a small keep-alive pool
+    "downloads": ClientSpec(max_connections=50, max_keepalive_connections=5, http2=False),
+}
+
+
+class HTTPClientRegistry:
+    """Named, lazily created httpx clients shared by the whole process."""
+
+    def __init__(self, specs: Dict[str, ClientSpec]):
+        self.specs = specs
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._requests: Dict[str, int] = {}
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        spec = self.specs[name]
+
+        async def count_request(request: httpx.Request):
+            self._requests[name] = self._requests.get(name, 0) + 1
+
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(spec.timeout, connect=spec.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=spec.max_connections,
+                max_keepalive_connections=spec.max_keepalive_connections,
+                keepalive_expiry=spec.keepalive_expiry,
+            ),
+            http2=spec.http2 and HTTP2_AVAILABLE,
+            follow_redirects=spec.follow_redirects,
+            event_hooks={"request": [count_request]},
+        )
+
+    def get(self, name: str = "default") -> httpx.AsyncClient:
+        """Return the named client, creating it if needed."""
+        if name not in self.specs:
+            raise ValueError(f"Unknown HTTP client: {name}")
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create(name)
+            self._clients[name] = client
+        return client
+
+    async def initialize(self):
+        """Create all clients up front."""
+        for name in self.specs:
+            self.get(name)
+        logger.info(f"Initialized {len(self._clients)} HTTP clients (HTTP/2 {'enabled' if HTTP2_AVAILABLE else 'unavailable'})")
+
+    async def close(self):
+        """Close all clients and their connections."""
+        clients = list(self._clients.items())
+        self._clients.clear()
+        for name, client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing HTTP client {name}: {e}")
+        if clients:
+            logger.info(f"Closed {len(clients)} HTTP clients")
+
+    @staticmethod
+    def _pool_stats(client: httpx.AsyncClient, max_connections: int) -> Dict[str, Any]:
+        # httpx has no public pool metrics; these are httpcore internals and are
+        # skipped if an upgrade changes them
+        try:
+            connections = list(client._transport._pool.connections)
+            active = sum(1 for connection in connections if not connection.is_idle())
+        except Exception:
+            return {}
+        return {
+            "connections": len(connections),
+            "active": active,
+            "idle": len(connections) - active,
+            "utilization": round(active / max_connections, 3),
+        }
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Requests sent per client and, where available, open, active and idle connections."""
+        stats = {}
+        for name, client in self._clients.items():
+            spec = self.specs[name]
+            stats[name] = {
+                "requests": self._requests.get(name, 0),
+                "max_connections": spec.max_connections,
+                "http2": spec.http2 and HTTP2_AVAILABLE,
+                **self._pool_stats(client, spec.max_connections),
+            }
+        return stats
+
+
+http_clients = HTTPClientRegistry(CLIENT_SPECS)
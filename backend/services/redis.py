@@ -177,3 +177,47 @@ async def keys(pattern: str) -> List[str]:
 async def expire(key: str, seconds: int):
     redis_client = await get_client()
     return await redis_client.expire(key, seconds)
+
+
+async def llen(key: str) -> int:
+    """Get the length of a list."""
+    redis_client = await get_client()
+    return await redis_client.llen(key)
+
+
+# Stream operations
+async def xadd(key: str, fields: dict, maxlen: int = None):
+    """Append an entry to a stream, optionally trimming it to roughly maxlen entries."""
+    redis_client = await get_client()
+    return await redis_client.xadd(key, fields, maxlen=maxlen, approximate=True)
+
+
+async def xrange(key: str, min: str = "-", max: str = "+", count: int = None):
+    """Get a range of entries from a stream."""
+    redis_client = await get_client()
+    return await redis_client.xrange(key, min=min, max=max, count=count)
+
+
+async def xread(streams: dict, count: int = None, block: int = None):
+    """Read entries newer than the given IDs from one or more streams."""
+    redis_client = await get_client()
+    return await redis_client.xread(streams, count=count, block=block)
+
+
+async def pipeline(transaction: bool = False):
+    """Create a pipeline for batching commands into one round-trip."""
+    redis_client = await get_client()
+    return redis_client.pipeline(transaction=transaction)
+
+
+# Hash operations
+async def hgetall(key: str) -> dict:
+    """Get all fields and values of a hash."""
+    redis_client = await get_client()
+    return await redis_client.hgetall(key)
+
+
+async def eval_script(script: str, keys: List[str], args: List[Any]):
+    """Run a Lua script atomically on the server."""
+    redis_client = await get_client()
+    return await redis_client.eval(script, len(keys), *keys, *args)
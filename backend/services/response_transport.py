@@ -0,0 +1,390 @@
+"""
+Transport for streamed agent run responses.
+
+Agent run responses are produced by the background worker and consumed by
+the SSE endpoint. Two transports are supported, selected with
+AGENT_RESPONSE_TRANSPORT:
+
+- "list" (default): responses are appended to a Redis list and every append is
+  announced on a pub/sub channel; consumers re-read the list tail with LRANGE.
+- "stream": responses are appended to a Redis Stream with XADD (trimmed to
+  AGENT_RESPONSE_STREAM_MAXLEN) and consumers block on XREAD from the last
+  entry ID. Control signals are written into the stream as well, so a
+  consumer needs no pub/sub connection at all.
+
+Entry IDs are returned with every response so that the SSE endpoint can emit
+them as event IDs and resume from ``Last-Event-ID`` after a reconnect. For the
+list transport the ID is the list index.
+
+Batch sizes, latencies and failures of ResponsePublisher flushes are recorded
+as Prometheus metrics in the default registry (``agent_response_flush_*``).
+"""
+
+import json
+import time
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter, Histogram
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+TRANSPORT_LIST = "list"
+TRANSPORT_STREAM = "stream"
+
+# How long a consumer blocks on XREAD before re-checking the run's status
+STREAM_BLOCK_MS = 5000
+
+FLUSH_BATCH_SIZE = Histogram(
+    "agent_response_flush_batch_size", "Responses pushed per publisher flush",
+    ["transport"], buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+FLUSH_SECONDS = Histogram(
+    "agent_response_flush_seconds", "Latency of publisher flushes to Redis",
+    ["transport"], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+FLUSH_FAILURES = Counter(
+    "agent_response_flush_failures_total", "Publisher flushes that failed to reach Redis",
+    ["transport"],
+)
+
+
+def get_transport() -> str:
+    transport = (config.AGENT_RESPONSE_TRANSPORT or TRANSPORT_LIST).lower()
+    if transport not in (TRANSPORT_LIST, TRANSPORT_STREAM):
+        logger.warning(f"Unknown AGENT_RESPONSE_TRANSPORT '{transport}', using '{TRANSPORT_LIST}'")
+        return TRANSPORT_LIST
+    return transport
+
+
+def response_list_key(agent_run_id: str) -> str:
+    return f"agent_run:{agent_run_id}:responses"
+
+
+def response_stream_key(agent_run_id: str) -> str:
+    return f"agent_run:{agent_run_id}:response_stream"
+
+
+def response_channel(agent_run_id: str) -> str:
+    return f"agent_run:{agent_run_id}:new_response"
+
+
+def control_channel(agent_run_id: str) -> str:
+    return f"agent_run:{agent_run_id}:control"
+
+
+def _decode_stream_entry(entry_id: str, fields: Dict[str, str]) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+    """Return (entry_id, response, control_signal) for a stream entry."""
+    if "control" in fields:
+        return entry_id, None, fields["control"]
+    return entry_id, json.loads(fields["data"]), None
+
+
+async def push_responses(agent_run_id: str, responses: List[Dict[str, Any]]):
+    """Append responses for an agent run and notify consumers."""
+    if not responses:
+        return
+    if get_transport() == TRANSPORT_STREAM:
+        pipe = await redis.pipeline()
+        key = response_stream_key(agent_run_id)
+        for response in responses:
+            pipe.xadd(key, {"data": json.dumps(response)}, maxlen=config.AGENT_RESPONSE_STREAM_MAXLEN, approximate=True)
+        await pipe.execute()
+    else:
+        pipe = await redis.pipeline()
+        pipe.rpush(response_list_key(agent_run_id), *[json.dumps(response) for response in responses])
+        pipe.publish(response_channel(agent_run_id), "new")
+        await pipe.execute()
+
+
+class TranscriptCompactor:
+    """Builds a compacted transcript of an agent run incrementally.
+
+    Consecutive streamed ``assistant`` chunk messages of the same thread run
+    are merged into one message and transient ``tool_call_chunk`` statuses are
+    dropped; every other response is kept as is.
+
+    Finished responses can be written out as the run goes with ``finished``
+    and ``drop_finished``, so only the pending chunk and the unwritten
+    responses stay in memory.
+
+    Usage:
+        transcript = TranscriptCompactor()
+        transcript.add(response)
+        if transcript.finished_chars > limit:
+            await write(transcript.finished())
+            transcript.drop_finished()
+        ...
+        transcript.finish()
+        await write(transcript.finished())
+    """
+
+    def __init__(self):
+        self._compacted: List[Dict[str, Any]] = []
+        self._pending_chunk: Optional[Dict[str, Any]] = None
+        self._pending_parts: List[str] = []
+        self._pending_metadata: Dict[str, Any] = {}
+        self.total = 0
+        # Approximate size of the finished responses not yet dropped
+        self.finished_chars = 0
+
+    @staticmethod
+    def _loads(value: Any) -> Any:
+        if isinstance(value, str):
+            try:
+                return json.loads(value)
+            except json.JSONDecodeError:
+                return None
+        return value
+
+    @staticmethod
+    def _size(response: Dict[str, Any]) -> int:
+        return sum(len(value) for value in response.values() if isinstance(value, str))
+
+    def _append(self, response: Dict[str, Any]):
+        self._compacted.append(response)
+        self.finished_chars += self._size(response)
+
+    def _finish_pending_chunk(self):
+        if self._pending_chunk is None:
+            return
+        merged = dict(self._pending_chunk)
+        merged["content"] = json.dumps({"role": "assistant", "content": "".join(self._pending_parts)})
+        merged["metadata"] = json.dumps({**self._pending_metadata, "merged_chunks": len(self._pending_parts)})
+        self._append(merged)
+        self._pending_chunk = None
+        self._pending_parts = []
+        self._pending_metadata = {}
+
+    def add(self, response: Dict[str, Any]):
+        """Add the next streamed response to the transcript."""
+        self.total += 1
+        response_type = response.get("type")
+
+        if response_type == "assistant":
+            metadata = self._loads(response.get("metadata"))
+            if isinstance(metadata, dict) and metadata.get("stream_status") == "chunk":
+                content = self._loads(response.get("content"))
+                text = content.get("content") if isinstance(content, dict) else None
+                if isinstance(text, str):
+                    if self._pending_chunk is not None and self._pending_metadata.get("thread_run_id") != metadata.get("thread_run_id"):
+                        self._finish_pending_chunk()
+                    if self._pending_chunk is None:
+                        self._pending_chunk = response
+                        self._pending_metadata = metadata
+                    self._pending_parts.append(text)
+                    return
+
+        elif response_type == "status":
+            content = self._loads(response.get("content"))
+            if isinstance(content, dict) and content.get("status_type") == "tool_call_chunk":
+                return
+
+        self._finish_pending_chunk()
+        self._append(response)
+
+    def finish(self):
+        """Close the pending chunk message, e.g. when the run ends."""
+        self._finish_pending_chunk()
+
+    def finished(self) -> List[Dict[str, Any]]:
+        """Get the finished responses that haven't been dropped yet."""
+        return self._compacted
+
+    def drop_finished(self, count: Optional[int] = None):
+        """Forget the first count finished responses (all by default) once written."""
+        if count is None or count >= len(self._compacted):
+            self._compacted = []
+            self.finished_chars = 0
+        else:
+            del self._compacted[:count]
+            self.finished_chars = sum(self._size(response) for response in self._compacted)
+
+    def responses(self) -> List[Dict[str, Any]]:
+        """Get the compacted transcript."""
+        self._finish_pending_chunk()
+        return self._compacted
+
+
+async def read_compacted_responses(agent_run_id: str, page_size: int = 1000) -> List[Dict[str, Any]]:
+    """Read the stored responses of an agent run page by page into a compacted transcript."""
+    transcript = TranscriptCompactor()
+    if get_transport() == TRANSPORT_STREAM:
+        key = response_stream_key(agent_run_id)
+        min_id = "-"
+        while True:
+            entries = await redis.xrange(key, min=min_id, count=page_size)
+            for entry_id, fields in entries:
+                _, response, _ = _decode_stream_entry(entry_id, fields)
+                if response is not None:
+                    transcript.add(response)
+            if len(entries) < page_size:
+                break
+            min_id = f"({entries[-1][0]}"
+    else:
+        key = response_list_key(agent_run_id)
+        start = 0
+        while True:
+            page = await redis.lrange(key, start, start + page_size - 1)
+            for response_json in page:
+                transcript.add(json.loads(response_json))
+            if len(page) < page_size:
+                break
+            start += page_size
+    return transcript.responses()
+
+
+class ResponsePublisher:
+    """Coalesces streamed responses into batched, ordered pushes.
+
+    Responses are buffered for up to ``flush_interval`` seconds or
+    ``max_batch`` items and then written with a single pipelined push and one
+    notification. Flushes are serialized, so responses reach Redis in the
+    order they were published. If more than ``max_buffered`` responses are
+    waiting, ``publish`` flushes inline, which bounds memory and applies
+    backpressure to the producer.
+
+    Usage:
+        publisher = ResponsePublisher(agent_run_id)
+        await publisher.publish(response)
+        ...
+        await publisher.close()
+    """
+
+    def __init__(self, agent_run_id: str, flush_interval: Optional[float] = None, max_batch: Optional[int] = None, max_buffered: int = 1000):
+        self.agent_run_id = agent_run_id
+        self.flush_interval = flush_interval if flush_interval is not None else config.AGENT_RESPONSE_FLUSH_INTERVAL_MS / 1000
+        self.max_batch = max_batch or config.AGENT_RESPONSE_FLUSH_MAX_ITEMS
+        self.max_buffered = max(max_buffered, self.max_batch)
+        self._buffer: List[Dict[str, Any]] = []
+        self._flush_lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._flush_tasks: set = set()
+        # Metrics
+        self.published = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.max_batch_size = 0
+        self.total_flush_ms = 0.0
+
+    async def publish(self, response: Dict[str, Any]):
+        """Buffer a response for the next flush."""
+        self._buffer.append(response)
+        self.published += 1
+        if len(self._buffer) >= self.max_buffered:
+            await self.flush()
+        elif len(self._buffer) == self.max_batch:
+            self._schedule_flush(0)
+        elif self._timer is None:
+            self._timer = self._schedule_flush(self.flush_interval)
+
+    def _schedule_flush(self, delay: float) -> asyncio.Task:
+        async def _flush_later():
+            if delay:
+                await asyncio.sleep(delay)
+            await self.flush()
+        task = asyncio.create_task(_flush_later())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+        return task
+
+    async def flush(self):
+        """Push everything buffered so far."""
+        async with self._flush_lock:
+            if self._timer is not None and self._timer is not asyncio.current_task():
+                self._timer.cancel()
+            self._timer = None
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+
+            transport = get_transport()
+            started = time.monotonic()
+            try:
+                await push_responses(self.agent_run_id, batch)
+            except Exception as e:
+                self.failed_flushes += 1
+                FLUSH_FAILURES.labels(transport).inc()
+                logger.error(f"Failed to push {len(batch)} responses for agent run {self.agent_run_id}: {str(e)}")
+                return
+            flush_ms = (time.monotonic() - started) * 1000
+            FLUSH_BATCH_SIZE.labels(transport).observe(len(batch))
+            FLUSH_SECONDS.labels(transport).observe(flush_ms / 1000)
+
+            self.flushes += 1
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+            self.total_flush_ms += flush_ms
+            logger.debug(f"Flushed responses for agent run {self.agent_run_id}: batch_size={len(batch)}, flush_ms={flush_ms:.1f}")
+
+    async def close(self, timeout: float = 30.0):
+        """Flush remaining responses and wait for in-flight flushes."""
+        try:
+            await asyncio.wait_for(self.flush(), timeout=timeout)
+            if self._flush_tasks:
+                await asyncio.wait_for(asyncio.gather(*self._flush_tasks, return_exceptions=True), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout waiting for pending response flushes for {self.agent_run_id}")
+
+        avg_batch = self.published / self.flushes if self.flushes else 0
+        avg_flush_ms = self.total_flush_ms / self.flushes if self.flushes else 0
+        logger.info(
+            f"Response publisher for {self.agent_run_id}: {self.published} responses in {self.flushes} flushes "
+            f"(avg batch {avg_batch:.1f}, max batch {self.max_batch_size}, avg flush {avg_flush_ms:.1f}ms, failed {self.failed_flushes})"
+        )
+
+
+async def push_control(agent_run_id: str, signal: str):
+    """Record a control signal (STOP, END_STREAM, ERROR) in the response stream.
+
+    Only needed for the stream transport; list consumers receive control
+    signals on the pub/sub control channel.
+    """
+    if get_transport() != TRANSPORT_STREAM:
+        return
+    await redis.xadd(response_stream_key(agent_run_id), {"control": signal}, maxlen=config.AGENT_RESPONSE_STREAM_MAXLEN)
+
+
+async def read_responses(agent_run_id: str, after_id: Optional[str] = None) -> List[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    """Read stored entries of an agent run, optionally only those after an entry ID.
+
+    Returns:
+        List of (entry_id, response, control_signal); exactly one of response
+        and control_signal is set.
+    """
+    if get_transport() == TRANSPORT_STREAM:
+        entries = await redis.xrange(response_stream_key(agent_run_id), min=f"({after_id}" if after_id else "-")
+        return [_decode_stream_entry(entry_id, fields) for entry_id, fields in entries]
+
+    start = int(after_id) + 1 if after_id is not None else 0
+    responses_json = await redis.lrange(response_list_key(agent_run_id), start, -1)
+    return [(str(start + i), json.loads(r), None) for i, r in enumerate(responses_json)]
+
+
+async def wait_for_responses(agent_run_id: str, last_id: str, block_ms: int = STREAM_BLOCK_MS) -> List[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    """Block until entries newer than last_id arrive (stream transport only).
+
+    Returns an empty list if nothing arrived within block_ms.
+    """
+    result = await redis.xread({response_stream_key(agent_run_id): last_id}, block=block_ms)
+    if not result:
+        return []
+    _, entries = result[0]
+    return [_decode_stream_entry(entry_id, fields) for entry_id, fields in entries]
+
+
+async def expire_responses(agent_run_id: str, ttl: int):
+    """Set a TTL on the stored responses of an agent run."""
+    if get_transport() == TRANSPORT_STREAM:
+        await redis.expire(response_stream_key(agent_run_id), ttl)
+    else:
+        await redis.expire(response_list_key(agent_run_id), ttl)
+
+
+async def delete_responses(agent_run_id: str):
+    """Delete the stored responses of an agent run."""
+    if get_transport() == TRANSPORT_STREAM:
+        await redis.delete(response_stream_key(agent_run_id))
+    else:
+        await redis.delete(response_list_key(agent_run_id))
@@ -0,0 +1,172 @@
+"""
+Stop signal handling for agent runs executing in a worker process.
+
+Instead of a pub/sub connection and a polling task per run, all runs on a
+worker share one pattern subscription to ``agent_run:*:control*`` (both the
+global and the instance-specific control channels). A STOP message sets the
+asyncio Event of the matching run, and the ``active_run`` keys of all runs
+are kept alive by a single pipelined EXPIRE batch.
+
+Usage:
+    stop_event = await run_control.register(agent_run_id, instance_active_key)
+    ...
+    if stop_event.is_set():
+        ...
+    await run_control.unregister(agent_run_id)
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from services import redis
+from utils.logger import logger
+
+CONTROL_PATTERN = "agent_run:*:control*"
+TTL_REFRESH_INTERVAL = 60  # seconds
+RECONNECT_DELAY = 1.0  # seconds, doubled up to RECONNECT_MAX_DELAY
+RECONNECT_MAX_DELAY = 30.0
+# Reads on the pub/sub connection wait at most this long, well below the pool's
+# socket timeout, so an idle subscription never looks like a broken one
+POLL_TIMEOUT = 1.0  # seconds
+
+
+def _decode(value) -> Optional[str]:
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+def run_id_from_channel(channel: str) -> Optional[str]:
+    """Extract the agent run ID from ``agent_run:{id}:control[:{instance}]``."""
+    parts = channel.split(":")
+    if len(parts) < 3 or parts[0] != "agent_run" or parts[2] != "control":
+        return None
+    return parts[1]
+
+
+@dataclass
+class _ActiveRun:
+    active_key: str
+    stop_event: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class RunControl:
+    """Multiplexes control channels and TTL refreshes for all local runs."""
+
+    def __init__(self, ttl_refresh_interval: float = TTL_REFRESH_INTERVAL):
+        self.ttl_refresh_interval = ttl_refresh_interval
+        self._runs: Dict[str, _ActiveRun] = {}
+        self._lock = asyncio.Lock()
+        self._listener: Optional[asyncio.Task] = None
+        self._refresher: Optional[asyncio.Task] = None
+        self._subscribed: Optional[asyncio.Event] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active_runs": len(self._runs),
+            "listening": self._listener is not None and not self._listener.done(),
+        }
+
+    async def register(self, agent_run_id: str, active_key: str) -> asyncio.Event:
+        """Track a run and return the Event that is set when it receives STOP.
+
+        Returns once the shared subscription is active, so a STOP published
+        after this call is not missed.
+        """
+        async with self._lock:
+            run = self._runs.get(agent_run_id)
+            if run is None:
+                run = _ActiveRun(active_key=active_key)
+                self._runs[agent_run_id] = run
+            if self._listener is None or self._listener.done():
+                self._subscribed = asyncio.Event()
+                self._listener = asyncio.create_task(self._listen(self._subscribed))
+                self._refresher = asyncio.create_task(self._refresh_ttls())
+            subscribed = self._subscribed
+
+        # Don't wait forever if Redis is down; report it like a failed subscribe
+        try:
+            await asyncio.wait_for(subscribed.wait(), timeout=10)
+        except asyncio.TimeoutError:
+            await self.unregister(agent_run_id)
+            raise RuntimeError(f"Timed out subscribing to control channels for agent run {agent_run_id}")
+        logger.debug(f"Registered agent run {agent_run_id} for control signals ({len(self._runs)} active)")
+        return run.stop_event
+
+    async def unregister(self, agent_run_id: str):
+        """Stop tracking a run; the shared subscription closes with the last run."""
+        async with self._lock:
+            self._runs.pop(agent_run_id, None)
+            if self._runs:
+                return
+            tasks = [task for task in (self._listener, self._refresher) if task and not task.done()]
+            self._listener = None
+            self._refresher = None
+            self._subscribed = None
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logger.warning(f"Error stopping run control task: {e}")
+
+    def _dispatch(self, channel: str, data: str):
+        if data != "STOP":
+            return
+        agent_run_id = run_id_from_channel(channel)
+        run = self._runs.get(agent_run_id) if agent_run_id else None
+        if run and not run.stop_event.is_set():
+            logger.info(f"Received STOP signal for agent run {agent_run_id} on {channel}")
+            run.stop_event.set()
+
+    async def _listen(self, subscribed: asyncio.Event):
+        delay = RECONNECT_DELAY
+        while True:
+            pubsub = None
+            try:
+                pubsub = await redis.create_pubsub()
+                await pubsub.psubscribe(CONTROL_PATTERN)
+                logger.debug(f"Subscribed to control pattern {CONTROL_PATTERN}")
+                subscribed.set()
+                delay = RECONNECT_DELAY
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=POLL_TIMEOUT)
+                    if not message or message.get("type") != "pmessage":
+                        continue
+                    self._dispatch(_decode(message.get("channel")), _decode(message.get("data")))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep the runs going; resubscribe after a backoff
+                logger.error(f"Control channel listener failed, reconnecting in {delay:.0f}s: {e}", exc_info=True)
+            finally:
+                if pubsub:
+                    try:
+                        await pubsub.punsubscribe()
+                        await pubsub.close()
+                    except Exception as e:
+                        logger.warning(f"Error closing control pubsub: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _refresh_ttls(self):
+        while True:
+            await asyncio.sleep(self.ttl_refresh_interval)
+            keys = [run.active_key for run in self._runs.values()]
+            if not keys:
+                continue
+            try:
+                pipe = await redis.pipeline()
+                for key in keys:
+                    pipe.expire(key, redis.REDIS_KEY_TTL)
+                await pipe.execute()
+                logger.debug(f"Refreshed TTL of {len(keys)} active run keys")
+            except Exception as e:
+                logger.warning(f"Failed to refresh TTL of {len(keys)} active run keys: {e}")
+
+
+run_control = RunControl()
@@ -0,0 +1,308 @@
+"""
+Per-process fan-out hub for agent run SSE viewers.
+
+Without the hub every viewer of ``/agent-run/{agent_run_id}/stream`` holds its
+own Redis subscriptions and re-reads the response list on every notification.
+The hub keeps a single Redis reader per agent run in this process and hands
+entries to every local viewer through a bounded asyncio queue. A ring buffer
+of recent entries lets late joiners replay without touching Redis; viewers
+that fall too far behind are resynchronised from Redis instead of blocking
+the reader.
+
+Enabled with AGENT_STREAM_HUB_ENABLED.
+"""
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Deque, Dict, List, Optional, Set, Tuple
+
+from services import redis
+from services import response_transport
+from utils.config import config
+from utils.logger import logger
+
+# (entry_id, response, control_signal) as returned by response_transport
+Entry = Tuple[Optional[str], Optional[Dict[str, Any]], Optional[str]]
+
+TERMINAL_STATUSES = ('completed', 'failed', 'stopped')
+CONTROL_SIGNALS = ('STOP', 'END_STREAM', 'ERROR')
+
+# Reads on the list reader's subscription wait at most this long, well below the
+# pool's socket timeout; the list is re-checked on every idle tick
+POLL_TIMEOUT = 1.0  # seconds
+
+_LAGGED = object()
+
+
+def _id_key(entry_id: str) -> Tuple[int, ...]:
+    """Sort key for list indexes ("12") and stream IDs ("1700000000000-3")."""
+    return tuple(int(part) for part in entry_id.split("-"))
+
+
+def is_terminal(entry: Entry) -> bool:
+    _, response, control_signal = entry
+    if control_signal:
+        return True
+    return response.get('type') == 'status' and response.get('status') in TERMINAL_STATUSES
+
+
+@dataclass(eq=False)
+class _Viewer:
+    queue: asyncio.Queue
+    lagged: bool = False
+
+
+@dataclass(eq=False)
+class _RunChannel:
+    """Shared reader state of a single agent run."""
+    agent_run_id: str
+    buffer: Deque[Entry]
+    viewers: Set[_Viewer] = field(default_factory=set)
+    evicted: int = 0
+    finished: bool = False
+    reader: Optional[asyncio.Task] = None
+    ready: asyncio.Event = field(default_factory=asyncio.Event)
+    error: Optional[str] = None
+
+    def append(self, entry: Entry):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.evicted += 1
+        self.buffer.append(entry)
+        for viewer in self.viewers:
+            if viewer.lagged:
+                continue
+            try:
+                viewer.queue.put_nowait(entry)
+            except asyncio.QueueFull:
+                # Slow viewer: drop its queue and let it resync from Redis
+                viewer.lagged = True
+                while not viewer.queue.empty():
+                    viewer.queue.get_nowait()
+                viewer.queue.put_nowait(_LAGGED)
+        if is_terminal(entry):
+            self.finished = True
+
+    def replay_after(self, last_id: Optional[str]) -> Optional[List[Entry]]:
+        """Entries after last_id from the ring buffer, or None if the buffer no longer covers them."""
+        entries = list(self.buffer)
+        if last_id is None:
+            return entries if self.evicted == 0 else None
+        last_key = _id_key(last_id)
+        ids = [entry[0] for entry in entries if entry[0] is not None]
+        if self.evicted and (not ids or _id_key(ids[0]) > last_key):
+            return None
+        return [entry for entry in entries if entry[0] is None or _id_key(entry[0]) > last_key]
+
+
+class StreamHub:
+    """Fans out agent run entries from one Redis reader to all local viewers.
+
+    Usage:
+        async for entry_id, response, control_signal in stream_hub.subscribe(agent_run_id, last_event_id):
+            ...
+    """
+
+    def __init__(self, buffer_size: int = 2000, viewer_queue_size: int = 1000):
+        self.buffer_size = buffer_size
+        self.viewer_queue_size = viewer_queue_size
+        self._runs: Dict[str, _RunChannel] = {}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": len(self._runs),
+            "viewers": sum(len(run.viewers) for run in self._runs.values()),
+        }
+
+    def _get_or_start(self, agent_run_id: str) -> _RunChannel:
+        run = self._runs.get(agent_run_id)
+        if run is None:
+            run = _RunChannel(agent_run_id=agent_run_id, buffer=deque(maxlen=self.buffer_size))
+            self._runs[agent_run_id] = run
+            if response_transport.get_transport() == response_transport.TRANSPORT_STREAM:
+                run.reader = asyncio.create_task(self._read_stream(run))
+            else:
+                run.reader = asyncio.create_task(self._read_list(run))
+            logger.debug(f"Stream hub started reader for agent run {agent_run_id}")
+        return run
+
+    async def _read_stream(self, run: _RunChannel):
+        try:
+            last_id = None
+            for entry in await response_transport.read_responses(run.agent_run_id):
+                run.append(entry)
+                last_id = entry[0]
+            run.ready.set()
+            while not run.finished:
+                for entry in await response_transport.wait_for_responses(run.agent_run_id, last_id or "0"):
+                    run.append(entry)
+                    last_id = entry[0]
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Stream hub reader failed for agent run {run.agent_run_id}: {e}", exc_info=True)
+            self._fail(run, str(e))
+
+    async def _read_list(self, run: _RunChannel):
+        response_channel = response_transport.response_channel(run.agent_run_id)
+        control_channel = response_transport.control_channel(run.agent_run_id)
+        pubsub = None
+        try:
+            # Subscribe before reading the backlog so no notification is missed
+            pubsub = await redis.create_pubsub()
+            await pubsub.subscribe(response_channel, control_channel)
+            last_id = None
+            for entry in await response_transport.read_responses(run.agent_run_id):
+                run.append(entry)
+                last_id = entry[0]
+            run.ready.set()
+
+            while not run.finished:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=POLL_TIMEOUT)
+                if message is None:
+                    # Idle tick: re-check the list in case a notification was missed
+                    channel, data = response_channel, "new"
+                elif message.get("type") != "message":
+                    continue
+                else:
+                    channel = message.get("channel")
+                    data = message.get("data")
+                if isinstance(data, bytes): data = data.decode('utf-8')
+
+                if channel == response_channel and data == "new":
+                    for entry in await response_transport.read_responses(run.agent_run_id, after_id=last_id):
+                        run.append(entry)
+                        last_id = entry[0]
+                        if run.finished:
+                            break
+                elif channel == control_channel and data in CONTROL_SIGNALS:
+                    logger.info(f"Stream hub received control signal '{data}' for {run.agent_run_id}")
+                    run.append((None, None, data))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Stream hub reader failed for agent run {run.agent_run_id}: {e}", exc_info=True)
+            self._fail(run, str(e))
+        finally:
+            if pubsub:
+                try:
+                    await pubsub.unsubscribe(response_channel, control_channel)
+                    await pubsub.close()
+                except Exception as e:
+                    logger.warning(f"Error closing stream hub pubsub for {run.agent_run_id}: {e}")
+
+    def _fail(self, run: _RunChannel, error: str):
+        run.error = error
+        run.ready.set()
+        if self._runs.get(run.agent_run_id) is run:
+            del self._runs[run.agent_run_id]
+        for viewer in run.viewers:
+            while not viewer.queue.empty():
+                viewer.queue.get_nowait()
+            viewer.queue.put_nowait(_LAGGED)
+
+    async def _release(self, run: _RunChannel, viewer: _Viewer):
+        run.viewers.discard(viewer)
+        if run.viewers:
+            return
+        if self._runs.get(run.agent_run_id) is run:
+            del self._runs[run.agent_run_id]
+        if run.reader and not run.reader.done():
+            run.reader.cancel()
+            try:
+                await run.reader
+            except asyncio.CancelledError:
+                pass
+        logger.debug(f"Stream hub stopped reader for agent run {run.agent_run_id}")
+
+    async def subscribe(self, agent_run_id: str, last_event_id: Optional[str] = None) -> AsyncGenerator[Entry, None]:
+        """Yield entries of an agent run after last_event_id until a terminal entry."""
+        run = self._get_or_start(agent_run_id)
+        viewer = _Viewer(queue=asyncio.Queue(maxsize=self.viewer_queue_size))
+        run.viewers.add(viewer)
+        last_id = last_event_id
+        try:
+            await run.ready.wait()
+            if run.error:
+                raise RuntimeError(f"Stream reader failed: {run.error}")
+
+            # Replay from the ring buffer, or from Redis if it no longer covers last_id.
+            # Entries queued meanwhile are skipped by ID below.
+            replay = run.replay_after(last_id)
+            if replay is None:
+                replay = await response_transport.read_responses(agent_run_id, after_id=last_id)
+
+            while True:
+                for entry in replay:
+                    entry_id = entry[0]
+                    if entry_id is not None and last_id is not None and _id_key(entry_id) <= _id_key(last_id):
+                        continue
+                    yield entry
+                    if entry_id is not None:
+                        last_id = entry_id
+                    if is_terminal(entry):
+                        return
+
+                item = await viewer.queue.get()
+                if item is _LAGGED:
+                    if run.error:
+                        raise RuntimeError(f"Stream reader failed: {run.error}")
+                    logger.warning(f"Viewer of agent run {agent_run_id} fell behind, resyncing from Redis")
+                    viewer.lagged = False
+                    replay = await response_transport.read_responses(agent_run_id, after_id=last_id)
+                else:
+                    replay = [item]
+        finally:
+            await self._release(run, viewer)
+
+
+stream_hub = StreamHub(
+    buffer_size=config.AGENT_STREAM_HUB_BUFFER_SIZE,
+    viewer_queue_size=config.AGENT_STREAM_HUB_VIEWER_QUEUE_SIZE,
+)
+
+
+if __name__ == "__main__":
+    # Load test: one producer, 100 concurrent viewers on the same run.
+    # Requires a reachable Redis (REDIS_HOST / REDIS_PORT).
+    #   python -m services.stream_hub [viewers] [responses]
+    import sys
+    import uuid
+
+    async def load_test(viewer_count: int, response_count: int):
+        await redis.initialize_async()
+        hub = StreamHub(buffer_size=config.AGENT_STREAM_HUB_BUFFER_SIZE, viewer_queue_size=config.AGENT_STREAM_HUB_VIEWER_QUEUE_SIZE)
+        agent_run_id = f"loadtest-{uuid.uuid4().hex[:8]}"
+        received = [0] * viewer_count
+
+        async def viewer(index: int):
+            async for entry in hub.subscribe(agent_run_id):
+                if entry[1] is not None:
+                    received[index] += 1
+
+        async def producer():
+            publisher = response_transport.ResponsePublisher(agent_run_id)
+            for i in range(response_count):
+                await publisher.publish({"type": "assistant", "content": f"chunk {i}"})
+                if i % 20 == 0:
+                    await asyncio.sleep(0.001)
+            await publisher.publish({"type": "status", "status": "completed"})
+            await publisher.close()
+
+        started = time.perf_counter()
+        viewers = [asyncio.create_task(viewer(i)) for i in range(viewer_count)]
+        await asyncio.sleep(0.2)
+        print(f"hub with {viewer_count} viewers: {hub.stats()}")
+        await producer()
+        await asyncio.wait_for(asyncio.gather(*viewers), timeout=60)
+        elapsed = time.perf_counter() - started
+
+        complete = sum(1 for count in received if count == response_count + 1)
+        print(f"{complete}/{viewer_count} viewers received all {response_count + 1} entries in {elapsed:.2f}s")
+        await response_transport.delete_responses(agent_run_id)
+        await redis.close()
+
+    viewers_arg = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    responses_arg = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    asyncio.run(load_test(viewers_arg, responses_arg))
@@ -0,0 +1,179 @@
+"""
+Running monthly usage totals per account.
+
+Billing checks used to recompute the month's usage from every
+``assistant_response_end`` message of the account, which gets slower as the
+month goes on. The ledger keeps the month's cost in a Redis hash per account,
+incremented by the ResponseProcessor each time it saves an
+``assistant_response_end``, so ``check_billing_status`` is a single lookup.
+
+Ledger entries are rebuilt from messages (``reconcile``) when missing and
+after ``USAGE_LEDGER_RECONCILE_SECONDS``, which also corrects any increments
+lost to a crash or a race with a rebuild. Increments only apply to an
+existing entry; a response saved before the entry is built is counted by the
+rebuild instead.
+
+Enabled with USAGE_LEDGER_ENABLED.
+"""
+
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from services import redis
+from services.supabase import DBConnection
+from utils.config import config
+from utils.logger import logger
+
+THREAD_CACHE_SIZE = 10000
+
+# Increment the ledger only if it has been built for this period
+_INCREMENT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HINCRBYFLOAT', KEYS[1], 'cost', ARGV[1])
+redis.call('HINCRBY', KEYS[1], 'responses', 1)
+return 1
+"""
+
+
+def usage_from_response(response: Any) -> Tuple[str, int, int]:
+    """Extract (model, prompt_tokens, completion_tokens) from a saved assistant_response_end.
+
+    Handles both the dict built for streamed responses and LiteLLM response objects.
+    """
+    if isinstance(response, dict):
+        usage = response.get('usage') or {}
+        model = response.get('model') or 'unknown'
+    else:
+        usage = getattr(response, 'usage', None) or {}
+        model = getattr(response, 'model', None) or 'unknown'
+    if not isinstance(usage, dict):
+        usage = {
+            'prompt_tokens': getattr(usage, 'prompt_tokens', 0),
+            'completion_tokens': getattr(usage, 'completion_tokens', 0),
+        }
+    return model, usage.get('prompt_tokens') or 0, usage.get('completion_tokens') or 0
+
+
+class UsageLedger:
+    """Redis-backed running totals of each account's usage in the current period.
+
+    Usage:
+        await usage_ledger.record_usage(thread_id, model, prompt_tokens, completion_tokens)
+        current_usage = await usage_ledger.get_monthly_usage(client, account_id)
+    """
+
+    def __init__(self, enabled: bool = True, reconcile_after: int = 21600):
+        """
+        Args:
+            enabled: When False usage is always computed from messages.
+            reconcile_after: Seconds after which a ledger entry is rebuilt from messages.
+        """
+        self.enabled = enabled
+        self.reconcile_after = reconcile_after
+        # thread_id -> (account_id, thread created_at)
+        self._threads: "OrderedDict[str, Tuple[str, datetime]]" = OrderedDict()
+
+    @staticmethod
+    def _key(account_id: str, period_start: datetime) -> str:
+        return f"usage_ledger:{account_id}:{period_start.strftime('%Y-%m')}"
+
+    async def _get_thread(self, thread_id: str) -> Optional[Tuple[str, datetime]]:
+        thread = self._threads.get(thread_id)
+        if thread is not None:
+            self._threads.move_to_end(thread_id)
+            return thread
+
+        db = DBConnection()
+        client = await db.client
+        result = await client.table('threads').select('account_id, created_at').eq('thread_id', thread_id).execute()
+        if not result.data:
+            return None
+        row = result.data[0]
+        thread = (row['account_id'], datetime.fromisoformat(row['created_at']))
+        self._threads[thread_id] = thread
+        if len(self._threads) > THREAD_CACHE_SIZE:
+            self._threads.popitem(last=False)
+        return thread
+
+    async def record_usage(self, thread_id: str, model: str, prompt_tokens: int, completion_tokens: int):
+        """Add the cost of one LLM response to the ledger of the thread's account."""
+        if not self.enabled:
+            return
+        from services.billing import calculate_token_cost, get_usage_period_start
+
+        try:
+            thread = await self._get_thread(thread_id)
+            if thread is None:
+                logger.warning(f"Not recording usage for unknown thread {thread_id}")
+                return
+            account_id, thread_created_at = thread
+
+            # Usage is counted per thread created in the period, same as get_usage_logs
+            period_start = get_usage_period_start()
+            if thread_created_at < period_start:
+                return
+
+            cost = calculate_token_cost(prompt_tokens, completion_tokens, model)
+            if cost <= 0:
+                return
+            await redis.eval_script(_INCREMENT_SCRIPT, [self._key(account_id, period_start)], [f"{cost:.10f}"])
+        except Exception as e:
+            # The next reconciliation picks this response up from the messages
+            logger.warning(f"Failed to record usage for thread {thread_id}: {str(e)}")
+
+    async def reconcile(self, client, account_id: str) -> float:
+        """Rebuild an account's ledger entry for the current period from its messages."""
+        from services.billing import calculate_monthly_usage, get_usage_period_start
+
+        key = self._key(account_id, get_usage_period_start())
+        cost = await calculate_monthly_usage(client, account_id)
+        pipe = await redis.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.hset(key, mapping={'cost': f"{cost:.10f}", 'responses': 0, 'reconciled_at': int(time.time())})
+        pipe.expire(key, self.reconcile_after)
+        await pipe.execute()
+        logger.debug(f"Reconciled usage ledger of account {account_id}: {cost}")
+        return cost
+
+    async def get_monthly_usage(self, client, account_id: str) -> float:
+        """Current period cost of an account, rebuilding its ledger entry if missing."""
+        from services.billing import calculate_monthly_usage, get_usage_period_start
+
+        if not self.enabled:
+            return await calculate_monthly_usage(client, account_id)
+
+        try:
+            entry: Dict[str, str] = await redis.hgetall(self._key(account_id, get_usage_period_start()))
+            if entry and 'cost' in entry:
+                return float(entry['cost'])
+            return await self.reconcile(client, account_id)
+        except Exception as e:
+            logger.warning(f"Usage ledger unavailable for account {account_id}, computing from messages: {str(e)}")
+            return await calculate_monthly_usage(client, account_id)
+
+
+usage_ledger = UsageLedger(
+    enabled=config.USAGE_LEDGER_ENABLED,
+    reconcile_after=config.USAGE_LEDGER_RECONCILE_SECONDS,
+)
+
+
+if __name__ == "__main__":
+    # Rebuild ledger entries from messages:
+    #   python -m services.usage_ledger <account_id> [<account_id> ...]
+    import asyncio
+    import sys
+
+    async def reconcile_accounts(account_ids):
+        await redis.initialize_async()
+        db = DBConnection()
+        client = await db.client
+        for account_id in account_ids:
+            print(f"{account_id}: {await usage_ledger.reconcile(client, account_id):.4f}")
+        await redis.close()
+
+    asyncio.run(reconcile_accounts(sys.argv[1:]))
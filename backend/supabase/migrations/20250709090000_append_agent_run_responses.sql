@@ -0,0 +1,30 @@
+-- Migration: Append compacted transcript segments to agent_runs.responses
+-- The background worker writes the transcript of a run in segments while it
+-- streams instead of holding all of it in memory until the run ends
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION append_agent_run_responses(
+    p_agent_run_id UUID,
+    p_responses JSONB
+)
+RETURNS BOOLEAN
+SECURITY DEFINER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- Once the run is stopped elsewhere its transcript has been written in full
+    UPDATE agent_runs
+    SET responses = COALESCE(responses, '[]'::jsonb) || p_responses
+    WHERE id = p_agent_run_id
+      AND status = 'running';
+
+    RETURN FOUND;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION append_agent_run_responses TO service_role;
+
+COMMENT ON FUNCTION append_agent_run_responses IS 'Appends compacted transcript segments to a running agent run';
+
+COMMIT;
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+pytest.importorskip("redis")
+pytest.importorskip("prometheus_client")
+
+from services.response_transport import TranscriptCompactor
+
+
+def chunk(text: str, thread_run_id: str = "run-1"):
+    return {
+        "type": "assistant",
+        "content": json.dumps({"role": "assistant", "content": text}),
+        "metadata": json.dumps({"stream_status": "chunk", "thread_run_id": thread_run_id}),
+    }
+
+
+def status(status_type: str):
+    return {"type": "status", "content": json.dumps({"status_type": status_type}), "metadata": "{}"}
+
+
+def merged_text(response):
+    return json.loads(response["content"])["content"]
+
+
+def test_consecutive_assistant_chunks_are_merged():
+    transcript = TranscriptCompactor()
+    for text in ("Hel", "lo ", "world"):
+        transcript.add(chunk(text))
+
+    responses = transcript.responses()
+    assert len(responses) == 1
+    assert merged_text(responses[0]) == "Hello world"
+    assert json.loads(responses[0]["metadata"])["merged_chunks"] == 3
+
+
+def test_chunks_of_different_thread_runs_are_not_merged():
+    transcript = TranscriptCompactor()
+    transcript.add(chunk("first", "run-1"))
+    transcript.add(chunk("second", "run-2"))
+
+    assert [merged_text(r) for r in transcript.responses()] == ["first", "second"]
+
+
+def test_tool_call_chunks_are_dropped_and_other_responses_kept_in_order():
+    transcript = TranscriptCompactor()
+    start = status("thread_run_start")
+    tool_result = {"type": "tool", "content": "result", "metadata": "{}"}
+    transcript.add(start)
+    transcript.add(chunk("Let me "))
+    transcript.add(status("tool_call_chunk"))
+    transcript.add(chunk("check."))
+    transcript.add(tool_result)
+    transcript.add(chunk("Done"))
+
+    responses = transcript.responses()
+    assert responses[0] is start
+    assert merged_text(responses[1]) == "Let me check."
+    assert responses[2] is tool_result
+    assert merged_text(responses[3]) == "Done"
+    assert len(responses) == 4
+    assert transcript.total == 6
+
+
+def test_pending_chunk_is_kept_until_finished():
+    transcript = TranscriptCompactor()
+    first = {"type": "tool", "content": "x" * 10, "metadata": "{}"}
+    transcript.add(first)
+    transcript.add(chunk("partial"))
+
+    assert transcript.finished() == [first]
+    assert transcript.finished_chars >= 10
+
+    transcript.drop_finished()
+    assert transcript.finished() == []
+    assert transcript.finished_chars == 0
+
+    transcript.add(chunk(" answer"))
+    transcript.finish()
+    assert [merged_text(r) for r in transcript.finished()] == ["partial answer"]
+
+
+def test_drop_finished_keeps_responses_added_after_the_write():
+    transcript = TranscriptCompactor()
+    transcript.add({"type": "tool", "content": "a", "metadata": "{}"})
+    written = len(transcript.finished())
+    later = {"type": "tool", "content": "b", "metadata": "{}"}
+    transcript.add(later)
+
+    transcript.drop_finished(written)
+    assert transcript.finished() == [later]
+
+    only_later = TranscriptCompactor()
+    only_later.add(later)
+    assert transcript.finished_chars == only_later.finished_chars
@@ -0,0 +1,61 @@
+import asyncio
+import io
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+from utils import screenshot_pipeline as pipeline_module
+from utils.screenshot_pipeline import ScreenshotPipeline, process_screenshot
+
+
+def render(text: str = "", checked: bool = False, compress_level: int = 6) -> bytes:
+    image = Image.new("RGB", (800, 600), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((100, 100, 500, 130), outline="gray")
+    draw.text((105, 110), text, fill="black")
+    draw.rectangle((100, 200, 112, 212), outline="gray", fill="black" if checked else "white")
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", compress_level=compress_level)
+    return buffer.getvalue()
+
+
+def test_small_visual_changes_change_the_digest():
+    empty = process_screenshot(render(), 1024, 75).digest
+    assert process_screenshot(render(text="a"), 1024, 75).digest != empty
+    assert process_screenshot(render(checked=True), 1024, 75).digest != empty
+
+
+def test_digest_ignores_encoding_of_identical_pixels():
+    fast = render(text="hello", compress_level=1)
+    small = render(text="hello", compress_level=9)
+    assert fast != small
+    assert process_screenshot(fast, 1024, 75).digest == process_screenshot(small, 1024, 75).digest
+
+
+def test_submit_reuses_only_identical_screenshots(monkeypatch):
+    uploads = []
+
+    async def get_image_public_url(filename, bucket_name):
+        return f"https://storage/{bucket_name}/{filename}"
+
+    async def upload_image_bytes(data, bucket_name, content_type, filename):
+        uploads.append(filename)
+        return f"https://storage/{bucket_name}/{filename}"
+
+    monkeypatch.setattr(pipeline_module, "get_image_public_url", get_image_public_url)
+    monkeypatch.setattr(pipeline_module, "upload_image_bytes", upload_image_bytes)
+
+    async def run():
+        pipeline = ScreenshotPipeline()
+        first = await pipeline.submit("thread", render())
+        same = await pipeline.submit("thread", render())
+        typed = await pipeline.submit("thread", render(text="x"))
+        await pipeline.wait_for_upload(typed)
+        return first, same, typed
+
+    first, same, typed = asyncio.run(run())
+    assert same == first
+    assert typed != first
+    assert len(uploads) == 2
@@ -0,0 +1,33 @@
+from agentpress.xml_stream_scanner import XMLStreamScanner, build_xml_tag_pattern
+
+TAGS = ["complete", "ask", "create-file"]
+
+FUNCTION_CALLS_BLOCK = (
+    "<function_calls>\n<invoke name=\"ask\">\n"
+    "<parameter name=\"text\">Done?</parameter>\n</invoke>\n</function_calls>"
+)
+
+
+def scan(content: str, chunk_size: int):
+    scanner = XMLStreamScanner(build_xml_tag_pattern(TAGS), TAGS)
+    chunks = []
+    for i in range(0, len(content), chunk_size):
+        chunks.extend(scanner.feed(content[i:i + chunk_size]))
+    return chunks
+
+
+def test_function_calls_after_unclosed_legacy_tag_in_prose():
+    content = f"I will call <complete> at the end.\n{FUNCTION_CALLS_BLOCK}\nThanks."
+    for chunk_size in (1, 7, len(content)):
+        assert scan(content, chunk_size) == [FUNCTION_CALLS_BLOCK]
+
+
+def test_closed_legacy_block_is_emitted():
+    content = "Text <ask>Question?</ask> more text"
+    for chunk_size in (1, 5, len(content)):
+        assert scan(content, chunk_size) == ["<ask>Question?</ask>"]
+
+
+def test_legacy_tags_ignored_after_function_calls():
+    content = f"{FUNCTION_CALLS_BLOCK}\n<ask>Question?</ask>"
+    assert scan(content, 3) == [FUNCTION_CALLS_BLOCK]
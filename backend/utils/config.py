@@ -198,6 +198,47 @@ class Configuration:
     REDIS_PASSWORD: Optional[str] = None
     REDIS_SSL: bool = True
     
+    # Per-thread LLM message cache (agentpress.message_cache)
+    THREAD_MESSAGE_CACHE_MAX_THREADS: int = 256
+    THREAD_MESSAGE_CACHE_REDIS: bool = False
+    
+    # Agent run response transport: "list" (RPUSH + pub/sub) or "stream" (Redis Streams)
+    AGENT_RESPONSE_TRANSPORT: str = "list"
+    AGENT_RESPONSE_STREAM_MAXLEN: int = 100000
+    AGENT_RESPONSE_FLUSH_INTERVAL_MS: int = 30
+    AGENT_RESPONSE_FLUSH_MAX_ITEMS: int = 50
+    # Compacted transcript segments are appended to agent_runs.responses once this large
+    AGENT_TRANSCRIPT_FLUSH_ITEMS: int = 100
+    AGENT_TRANSCRIPT_FLUSH_CHARS: int = 1000000
+    
+    # Shared SSE fan-out hub for agent run viewers (services.stream_hub)
+    AGENT_STREAM_HUB_ENABLED: bool = False
+    AGENT_STREAM_HUB_BUFFER_SIZE: int = 2000
+    AGENT_STREAM_HUB_VIEWER_QUEUE_SIZE: int = 1000
+    
+    # Overall time limit for connecting to an agent's MCP servers at startup
+    MCP_DISCOVERY_DEADLINE: int = 30
+    
+    # Cross-run cache of MCP tool lists (mcp_service.tool_cache)
+    MCP_TOOL_CACHE_ENABLED: bool = True
+    MCP_TOOL_CACHE_FRESH_SECONDS: int = 3600
+
+    # Redis cache of each user's Stripe subscription and tier, invalidated by the billing webhook
+    BILLING_SUBSCRIPTION_CACHE_TTL: int = 900
+
+    # Running monthly usage totals (services.usage_ledger), rebuilt from messages after this many seconds
+    USAGE_LEDGER_ENABLED: bool = True
+    USAGE_LEDGER_RECONCILE_SECONDS: int = 21600
+
+    # Browser screenshot pipeline (utils.screenshot_pipeline)
+    BROWSER_SCREENSHOT_MAX_WIDTH: int = 1024
+    BROWSER_SCREENSHOT_JPEG_QUALITY: int = 75
+    BROWSER_SCREENSHOT_UPLOAD_CONCURRENCY: int = 4
+    BROWSER_SCREENSHOT_UPLOAD_QUEUE_SIZE: int = 32
+
+    # Context compression algorithm: "recursive" or "packed"
+    CONTEXT_COMPRESSION_STRATEGY: str = "recursive"
+    
     # Daytona sandbox configuration
     DAYTONA_API_KEY: str
     DAYTONA_SERVER_URL: str
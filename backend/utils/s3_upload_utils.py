@@ -25,11 +25,40 @@ async def upload_base64_image(base64_data: str, bucket_name: str = "browser-scre
         
         # Decode base64 data
         image_data = base64.b64decode(base64_data)
+    except Exception as e:
+        logger.error(f"Error uploading base64 image: {e}")
+        raise RuntimeError(f"Failed to upload image: {str(e)}")
+
+    return await upload_image_bytes(image_data, bucket_name)
+
+def new_image_filename(content_type: str = "image/png") -> str:
+    """Generate a unique filename for an uploaded image."""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    unique_id = str(uuid.uuid4())[:8]
+    extension = content_type.split('/')[-1]
+    return f"image_{timestamp}_{unique_id}.{extension}"
+
+async def get_image_public_url(filename: str, bucket_name: str = "browser-screenshots") -> str:
+    """Public URL an image uploaded under filename will be served from."""
+    db = DBConnection()
+    client = await db.client
+    return await client.storage.from_(bucket_name).get_public_url(filename)
+
+async def upload_image_bytes(image_data: bytes, bucket_name: str = "browser-screenshots", content_type: str = "image/png",
+                             filename: str = None) -> str:
+    """Upload raw image bytes to Supabase storage and return the URL.
+    
+    Args:
+        image_data (bytes): Encoded image data
+        bucket_name (str): Name of the storage bucket to upload to
+        content_type (str): MIME type of the image
+        filename (str, optional): Name to store the image under; generated if not given
         
-        # Generate unique filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        unique_id = str(uuid.uuid4())[:8]
-        filename = f"image_{timestamp}_{unique_id}.png"
+    Returns:
+        str: Public URL of the uploaded image
+    """
+    try:
+        filename = filename or new_image_filename(content_type)
         
         # Upload to Supabase storage
         db = DBConnection()
@@ -37,7 +66,7 @@ async def upload_base64_image(base64_data: str, bucket_name: str = "browser-scre
         storage_response = await client.storage.from_(bucket_name).upload(
             filename,
             image_data,
-            {"content-type": "image/png"}
+            {"content-type": content_type}
         )
         
         # Get public URL
@@ -47,5 +76,5 @@ async def upload_base64_image(base64_data: str, bucket_name: str = "browser-scre
         return public_url
         
     except Exception as e:
-        logger.error(f"Error uploading base64 image: {e}")
-        raise RuntimeError(f"Failed to upload image: {str(e)}") 
\ No newline at end of file
+        logger.error(f"Error uploading image: {e}")
+        raise RuntimeError(f"Failed to upload image: {str(e)}")
@@ -0,0 +1,208 @@
+"""
+Processing and upload of browser screenshots.
+
+Every browser action returns a screenshot that is shown to the LLM through
+its uploaded URL. The pipeline:
+
+- checks the image header and size instead of validating the full image,
+- reuses the previous upload of the thread when the new screenshot has the
+  exact same pixels, e.g. after a scroll at the end of the page. Small
+  changes such as typed text or a ticked checkbox must reach the LLM, so
+  near matches are uploaded,
+- downscales screenshots wider than BROWSER_SCREENSHOT_MAX_WIDTH,
+- uploads in the background. The public URL is known before the upload, so
+  the tool result is built and saved while it runs. Consumers of the URL
+  call ``wait_for_upload`` first. Once BROWSER_SCREENSHOT_UPLOAD_QUEUE_SIZE
+  uploads are pending, callers wait for their own upload instead.
+
+Usage:
+    image_url = await screenshot_pipeline.submit(thread_id, screenshot_bytes)
+    ...
+    if await screenshot_pipeline.wait_for_upload(image_url):
+        ...
+"""
+
+import asyncio
+import base64
+import hashlib
+import io
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from utils.config import config
+from utils.logger import logger
+from utils.s3_upload_utils import get_image_public_url, new_image_filename, upload_image_bytes
+
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+MAX_DIMENSION = 8192
+THREAD_CACHE_SIZE = 1000
+UPLOAD_HISTORY_SIZE = 256
+
+
+def detect_image_type(data: bytes) -> Optional[str]:
+    """MIME type from the image's magic bytes, None if not a supported image."""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def decode_base64_image(data: str) -> bytes:
+    """Decode a base64 image, with or without data URL prefix."""
+    if data.startswith('data:'):
+        data = data.split(',', 1)[-1]
+    try:
+        return base64.b64decode(data)
+    except Exception as e:
+        raise ValueError(f"Base64 decoding failed: {str(e)}")
+
+
+def pixel_digest(image: Image.Image) -> str:
+    """Digest of the decoded pixels, independent of encoding and metadata."""
+    return hashlib.sha256(image.convert("RGB").tobytes()).hexdigest()
+
+
+@dataclass
+class ProcessedScreenshot:
+    data: bytes
+    content_type: str
+    digest: str
+
+
+def process_screenshot(data: bytes, max_width: int, quality: int) -> ProcessedScreenshot:
+    """Check, hash and downscale a screenshot. CPU bound; run off the event loop."""
+    content_type = detect_image_type(data)
+    if content_type is None:
+        raise ValueError("Unsupported image format")
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ValueError(f"Image size ({len(data)} bytes) exceeds limit ({MAX_IMAGE_BYTES} bytes)")
+
+    with Image.open(io.BytesIO(data)) as image:
+        # Only the header has been read so far
+        width, height = image.size
+        if width < 1 or height < 1 or width > MAX_DIMENSION or height > MAX_DIMENSION:
+            raise ValueError(f"Invalid image dimensions: {width}x{height}")
+
+        digest = pixel_digest(image)
+        if width > max_width:
+            resized = image.convert("RGB").resize((max_width, max(1, round(height * max_width / width))), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer, "JPEG", quality=quality, optimize=True)
+            data, content_type = buffer.getvalue(), "image/jpeg"
+
+    return ProcessedScreenshot(data=data, content_type=content_type, digest=digest)
+
+
+class ScreenshotPipeline:
+    """Deduplicates, downscales and uploads browser screenshots."""
+
+    def __init__(self, max_width: int = 1024, quality: int = 75, upload_concurrency: int = 4,
+                 queue_size: int = 32, bucket_name: str = "browser-screenshots"):
+        """
+        Args:
+            max_width: Screenshots wider than this are downscaled.
+            quality: JPEG quality of downscaled screenshots.
+            upload_concurrency: Uploads running at the same time.
+            queue_size: Pending uploads before callers wait for their own upload.
+            bucket_name: Storage bucket the screenshots are uploaded to.
+        """
+        self.max_width = max_width
+        self.quality = quality
+        self.upload_concurrency = upload_concurrency
+        self.queue_size = queue_size
+        self.bucket_name = bucket_name
+        # thread_id -> (pixel digest, image_url) of the thread's last screenshot
+        self._last: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        # image_url -> upload task, pending and recently finished
+        self._uploads: "OrderedDict[str, asyncio.Task]" = OrderedDict()
+        self._pending = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Semaphores and tasks belong to one event loop
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.upload_concurrency)
+            self._uploads.clear()
+            self._pending = 0
+        return self._semaphore
+
+    async def _upload(self, screenshot: ProcessedScreenshot, filename: str):
+        async with self._get_semaphore():
+            await upload_image_bytes(screenshot.data, self.bucket_name, screenshot.content_type, filename)
+
+    def _upload_done(self, thread_id: str, image_url: str, task: asyncio.Task):
+        self._pending -= 1
+        if task.cancelled() or task.exception() is not None:
+            logger.error(f"Background upload of screenshot {image_url} failed: {task.exception() if not task.cancelled() else 'cancelled'}")
+            # Don't reuse a URL that was never uploaded
+            if self._last.get(thread_id, (None, None))[1] == image_url:
+                del self._last[thread_id]
+
+    async def submit(self, thread_id: str, data: bytes) -> str:
+        """Process a screenshot and start its upload.
+
+        Returns:
+            The URL the screenshot is served from once uploaded.
+
+        Raises:
+            ValueError: The data isn't a valid image.
+        """
+        self._get_semaphore()
+        screenshot = await asyncio.to_thread(process_screenshot, data, self.max_width, self.quality)
+
+        previous = self._last.get(thread_id)
+        if previous and previous[0] == screenshot.digest:
+            self._last.move_to_end(thread_id)
+            logger.debug(f"Screenshot unchanged for thread {thread_id}, reusing {previous[1]}")
+            return previous[1]
+
+        filename = new_image_filename(screenshot.content_type)
+        if self._pending >= self.queue_size:
+            # Upload queue is full; apply backpressure to the caller
+            logger.warning(f"Screenshot upload queue full ({self._pending} pending), uploading inline")
+            image_url = await upload_image_bytes(screenshot.data, self.bucket_name, screenshot.content_type, filename)
+        else:
+            image_url = await get_image_public_url(filename, self.bucket_name)
+            task = asyncio.create_task(self._upload(screenshot, filename))
+            self._pending += 1
+            task.add_done_callback(lambda t: self._upload_done(thread_id, image_url, t))
+            self._uploads[image_url] = task
+            while len(self._uploads) > UPLOAD_HISTORY_SIZE and next(iter(self._uploads.values())).done():
+                self._uploads.popitem(last=False)
+
+        self._last[thread_id] = (screenshot.digest, image_url)
+        self._last.move_to_end(thread_id)
+        if len(self._last) > THREAD_CACHE_SIZE:
+            self._last.popitem(last=False)
+        return image_url
+
+    async def wait_for_upload(self, image_url: str, timeout: float = 30.0) -> bool:
+        """Wait for a background upload; False if it failed or didn't finish in time."""
+        task = self._uploads.get(image_url)
+        if task is None or self._loop is not asyncio.get_running_loop():
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"Screenshot {image_url} not available: {type(e).__name__} {str(e)}")
+            return False
+
+
+screenshot_pipeline = ScreenshotPipeline(
+    max_width=config.BROWSER_SCREENSHOT_MAX_WIDTH,
+    quality=config.BROWSER_SCREENSHOT_JPEG_QUALITY,
+    upload_concurrency=config.BROWSER_SCREENSHOT_UPLOAD_CONCURRENCY,
+    queue_size=config.BROWSER_SCREENSHOT_UPLOAD_QUEUE_SIZE,
+)